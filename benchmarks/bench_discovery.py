@@ -0,0 +1,76 @@
+"""
+Benchmark of file discovery with `os.walk` compared to the pruning `FileDiscovery`.
+
+By default a checkout is generated in a temporary folder: a synthetic package next to a virtual environment,
+`node_modules`, a `.git` folder and a build folder listed in `.gitignore`, which are typical for real
+repositories. Pass `--folder` to measure an existing checkout instead. Run with
+`python -m benchmarks.bench_discovery`.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import SyntheticConfig, generate_codebase
+from src.parser import FileDiscovery
+
+
+def walk_discovery(folder_path: str) -> list[tuple[str, str]]:
+    """Discovery as it was before `FileDiscovery`: walk the whole tree, then keep the Python files."""
+    jobs = []
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            if file.endswith('.py'):
+                file_path = os.path.join(root, file)
+                module_name = os.path.relpath(file_path, folder_path).replace(os.sep, '.').replace('\\', '.')
+                jobs.append((file_path, module_name))
+    jobs.sort(key=lambda job: job[1])
+    return jobs
+
+
+def generate_checkout(folder: str, n_modules: int, n_ignored: int):
+    """Write a synthetic package and `n_ignored` files in each of the folders that discovery should skip."""
+    generate_codebase(os.path.join(folder, 'src'), SyntheticConfig(modules=n_modules, functions=5, fan_out=2))
+    with open(os.path.join(folder, '.gitignore'), 'w') as f:
+        f.write('# Build output\n/generated/\n*.log\n')
+    for ignored, extension in (('.venv/lib/site-packages', '.py'), ('node_modules', '.js'),
+                               ('.git/objects', ''), ('generated', '.py')):
+        for i in range(n_ignored):
+            directory = os.path.join(folder, ignored, f'dir_{i // 50}')
+            os.makedirs(directory, exist_ok=True)
+            open(os.path.join(directory, f'file_{i}{extension}'), 'w').close()
+
+
+def best_time(discover, folder: str, repeat: int) -> tuple[float, int]:
+    """Fastest of `repeat` runs in seconds and the number of discovered files."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        jobs = discover(folder)
+        times.append(time.perf_counter() - start)
+    return min(times), len(jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark file discovery with os.walk and FileDiscovery")
+    parser.add_argument('--folder', type=str, default=None, help="Existing checkout to measure")
+    parser.add_argument('--modules', type=int, default=500, help="Number of generated modules")
+    parser.add_argument('--ignored', type=int, default=20000, help="Number of files per ignored folder")
+    parser.add_argument('--repeat', type=int, default=5, help="Number of runs, the fastest is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        folder = args.folder
+        if folder is None:
+            folder = temporary_folder
+            generate_checkout(folder, args.modules, args.ignored)
+        walk_time, walk_files = best_time(walk_discovery, folder, args.repeat)
+        scan_time, scan_files = best_time(FileDiscovery().discover, folder, args.repeat)
+
+    print(f"{'os.walk':<16} {walk_time * 1000:>10.1f} ms {walk_files:>8} files")
+    print(f"{'FileDiscovery':<16} {scan_time * 1000:>10.1f} ms {scan_files:>8} files  "
+          f"({walk_time / scan_time:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
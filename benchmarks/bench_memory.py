@@ -0,0 +1,158 @@
+"""
+Benchmark of the memory used by the parsed modules compared to their `CompactGraph`, and of the peak memory of a run.
+
+A synthetic package is generated in a temporary folder. The memory retained by the parsed modules and by their
+`CompactGraph` is measured with tracemalloc. The peak memory of a run is the maximum resident set size (RSS) of a
+separate process per variant, so the variants do not share an allocator or a high-water mark:
+
+- `startup`: only the imports, the baseline of every other variant
+- `parse`: all modules parsed into memory, as `Parser.parse_folder`
+- `in_memory`: all modules parsed into memory and converted to a `CompactGraph`, as `poseidon` without a budget
+- `streaming`: the modules streamed by a `StreamingParser` into a `CompactGraph`, as `poseidon --memory-budget`
+
+The `CompactGraph` is retained at a fraction of the memory of the parsed modules, but the peak of the `in_memory`
+variant is not lower than that of `parse`: all modules are in memory before the graph is built from them.
+Run with `python -m benchmarks.bench_memory`.
+
+The memory budget of `streaming` only bounds the unresolved calls, the definitions and the graph grow with the
+tree. `--max-peak` checks that the streaming peak of a large tree stays within a limit, e.g. about 2 million
+lines within 2 GB, which exits with status 1 if the peak is higher:
+
+    python -m benchmarks.bench_memory --modules 1100 --memory-budget 64 --variants startup streaming \
+        --no-retained --max-peak 2048
+"""
+import argparse
+import gc
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.synthetic import SyntheticConfig, generate_codebase
+from src.graphs import CompactGraph
+from src.parser import Parser
+from src.pipeline import StreamingParser
+
+VARIANTS: tuple[str, ...] = ('startup', 'parse', 'in_memory', 'streaming')
+
+
+def retained_memory(build) -> tuple[object, int]:
+    """Call `build` and return its result together with the memory the result retains, in bytes."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def peak_rss() -> int:
+    """The maximum resident set size of this process so far, in bytes."""
+    try:
+        # The high-water mark of the address space, Linux keeps `ru_maxrss` of the parent across exec
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_variant(variant: str, folder: str, memory_budget: int) -> dict:
+    """Run a variant in this process and return its peak RSS and the size of the result."""
+    graph = None
+    if variant == 'parse':
+        modules = Parser().parse_folder(folder)
+        del modules
+    elif variant == 'in_memory':
+        graph = CompactGraph.from_modules(Parser().parse_folder(folder))
+    elif variant == 'streaming':
+        with StreamingParser(Parser(), memory_budget=memory_budget).parse_folder(folder) as stream:
+            graph = CompactGraph.from_stream(stream.summaries, stream.modules())
+    elif variant != 'startup':
+        raise ValueError(f"Unknown variant '{variant}', choose from {VARIANTS}")
+    return {
+        'variant': variant,
+        'peak_rss': peak_rss(),
+        'nodes': graph.num_nodes if graph is not None else None,
+        'edges': graph.num_edges if graph is not None else None,
+    }
+
+
+def measure_variant(variant: str, folder: str, memory_budget: int) -> dict:
+    """Run a variant in a new process and return its result, see `run_variant`."""
+    command = [
+        sys.executable, '-m', 'benchmarks.bench_memory', '--run-variant', variant, '--folder', folder,
+        '--memory-budget', str(memory_budget / 2**20),
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory of the parsed modules and the CompactGraph")
+    parser.add_argument('--modules', type=int, default=200, help="Number of generated modules")
+    parser.add_argument('--functions', type=int, default=50, help="Number of functions per module")
+    parser.add_argument('--calls', type=int, default=20, help="Number of calls per function")
+    parser.add_argument('--memory-budget', type=float, default=1, help="Memory budget of the streaming run in MB")
+    parser.add_argument('--variants', type=str, nargs='+', choices=VARIANTS, default=list(VARIANTS),
+                        help="Variants of which the peak RSS is measured (default: all)")
+    parser.add_argument('--max-peak', type=float, default=None, metavar='MB',
+                        help="Exit with status 1 if the peak RSS of the streaming variant exceeds this many MB")
+    parser.add_argument('--no-retained', action='store_true',
+                        help="Skip the tracemalloc measurement of the retained memory, which is slow for large trees")
+    # Used internally to run a single variant in a separate process
+    parser.add_argument('--run-variant', type=str, choices=VARIANTS, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--folder', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    memory_budget = int(args.memory_budget * 2**20)
+
+    if args.run_variant is not None:
+        print(json.dumps(run_variant(args.run_variant, args.folder, memory_budget)))
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        config = SyntheticConfig(
+            modules=args.modules, functions=args.functions, fan_out=args.calls, import_style='relative'
+        )
+        size = generate_codebase(folder, config)
+        print(f"{size.files} files, {size.lines} lines, {size.bytes / 2**20:.1f} MB of source")
+        results = {variant: measure_variant(variant, folder, memory_budget) for variant in args.variants}
+        if not args.no_retained:
+            modules, modules_size = retained_memory(lambda: Parser().parse_folder(folder))
+            graph, graph_size = retained_memory(lambda: CompactGraph.from_modules(modules))
+            del modules
+            print(f"{graph.num_nodes} nodes, {graph.num_edges} call sites")
+            print(f"{'retained modules':<18} {modules_size / 2**20:>8.1f} MB")
+            print(f"{'retained graph':<18} {graph_size / 2**20:>8.1f} MB  ({modules_size / graph_size:.1f}x smaller)")
+            del graph
+
+    # The peaks above the memory of the interpreter and the imports are compared
+    startup = results['startup']['peak_rss'] if 'startup' in results else 0
+    reference = results['in_memory']['peak_rss'] - startup if 'in_memory' in results else None
+    for variant, result in results.items():
+        above_startup = result['peak_rss'] - startup
+        line = f"{'peak RSS ' + variant:<18} {result['peak_rss'] / 2**20:>8.1f} MB"
+        if startup and variant != 'startup':
+            line += f"  {above_startup / 2**20:>8.1f} MB above startup"
+        if reference is not None and variant not in ('startup', 'in_memory') and above_startup > 0:
+            line += f"  ({reference / above_startup:.2f}x lower than in_memory)"
+        print(line)
+
+    if args.max_peak is not None and 'streaming' in results:
+        streaming_peak = results['streaming']['peak_rss'] / 2**20
+        if streaming_peak > args.max_peak:
+            print(f"FAIL: the streaming peak of {streaming_peak:.0f} MB exceeds {args.max_peak:.0f} MB")
+            sys.exit(1)
+        print(f"OK: the streaming peak of {streaming_peak:.0f} MB is within {args.max_peak:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark of the AstWalker on functions nested `depth` levels deep, each level containing a few calls.
+
+The number of AST nodes grows linearly with the depth, so with a single-pass walker the time per level
+should stay roughly constant. Run with `python -m benchmarks.bench_nesting`.
+"""
+import argparse
+import ast
+import time
+
+from src.parser import AstWalker
+
+CALLS_PER_LEVEL = 5
+
+
+def generate_nested_source(depth: int) -> str:
+    """Generate a module with a single function containing `depth` nested functions."""
+    lines = []
+    for level in range(depth):
+        indent = '    ' * level
+        lines.append(f'{indent}def level_{level}():')
+        for i in range(CALLS_PER_LEVEL):
+            lines.append(f'{indent}    helper_{i}(level_{level})')
+    lines.append('    ' * depth + 'pass')
+    return '\n'.join(lines)
+
+
+def time_walk(tree: ast.AST, repeat: int) -> float:
+    """Best time of `repeat` walks over the tree in seconds."""
+    walker = AstWalker()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        walker.walk(tree, 'nested')
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AstWalker on deeply nested functions")
+    parser.add_argument('--depths', type=int, nargs='+', default=[10, 20, 40, 80],
+                        help="Nesting depths to benchmark, at most ~90 because of the limits of the CPython parser")
+    parser.add_argument('--repeat', type=int, default=5, help="Number of repetitions per depth")
+    args = parser.parse_args()
+
+    print(f"{'depth':>6} {'walk (ms)':>10} {'per level (us)':>15}")
+    for depth in args.depths:
+        tree = ast.parse(generate_nested_source(depth))
+        seconds = time_walk(tree, args.repeat)
+        print(f"{depth:>6} {seconds * 1e3:>10.2f} {seconds / depth * 1e6:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
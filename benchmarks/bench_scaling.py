@@ -0,0 +1,137 @@
+"""
+Scaling check of the per-module cost of the AstWalker and of call resolution, on generated stub-like modules.
+
+A module with `classes` classes of `methods` methods each is generated for every size, similar to generated
+protobuf or ORM stubs, every method calling a few methods of its own class, an inherited method, an imported
+function and an aliased import. The classes inherit in chains of `INHERITANCE_DEPTH` classes. The visit of the AST,
+grouping the methods into their classes, the resolution of the calls and indexing the inheritance of all classes
+are timed separately. All steps should take linear time in the number of definitions and calls, so the time per
+definition must stay roughly constant: it grows with the size of the module if a step is quadratic. The exit
+status is 1 if the time per definition of any step in the largest module is more than `--max-growth` times that
+of the smallest, so the check can run in CI. The default sizes differ 16x, which leaves room for cache effects.
+Run with `python -m benchmarks.bench_scaling`. A smaller version of the check is a slow test, it is timing based and
+only runs with `python -m pytest tests/test_scaling.py --run-slow`.
+"""
+import argparse
+import ast
+import sys
+import time
+
+from src.parser import AstWalker, Module, Parser
+from src.parser.symbol_index import SymbolIndex
+
+MODULE_NAME = 'stubs'
+CALLS_PER_METHOD = 4
+INHERITANCE_DEPTH = 10
+# The walk over the AST, grouping the methods into their classes, resolving the calls, and the MROs and inherited
+# methods of all classes
+STEPS: tuple[str, ...] = ('visit', 'group', 'resolve', 'inherit')
+
+
+def generate_stub_source(classes: int, methods: int) -> str:
+    """Generate a module with `classes` classes of `methods` methods each."""
+    lines = ['import os.path as osp', 'from helpers import convert as _convert', '']
+    for c in range(classes):
+        lines.append(f'class Message{c}(Message{c - 1}):' if c % INHERITANCE_DEPTH else f'class Message{c}:')
+        for m in range(methods):
+            lines.append(f'    def field_{m}(self, value):')
+            for i in range(1, CALLS_PER_METHOD - 2):
+                lines.append(f'        self.field_{(m + i) % methods}(value)')
+            lines.append(f'        self.base_{m}(value)')
+            lines.append('        _convert(osp.join(value))')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def time_best(function, repeat: int) -> tuple[object, float]:
+    """The result of `function` and its best time of `repeat` runs in seconds."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def measure(classes: int, methods: int, repeat: int) -> dict[str, float]:
+    """Seconds per definition of every step in `STEPS` on a generated module."""
+    tree = ast.parse(generate_stub_source(classes, methods))
+    walker = AstWalker()
+
+    def visit():
+        walker.reset()
+        walker.module_name = MODULE_NAME
+        walker.visit(tree)
+        return dict(walker.definitions)
+
+    flat_definitions, visit_time = time_best(visit, repeat)
+
+    def group():
+        walker.definitions = dict(flat_definitions)
+        walker._resolve_classes_in_definitions()
+        return walker.definitions
+
+    definitions, group_time = time_best(group, repeat)
+    module = Module(definitions=definitions, calls=walker.calls, imports=walker.imports)
+    index = SymbolIndex({f'{MODULE_NAME}.py': module})
+    parser = Parser()
+    _, resolve_time = time_best(lambda: parser.resolve_module(index, f'{MODULE_NAME}.py', module), repeat)
+
+    def inherit():
+        inheritance = SymbolIndex({f'{MODULE_NAME}.py': module}).inheritance
+        for c in range(classes):
+            inheritance.methods(f'{MODULE_NAME}.Message{c}')
+
+    _, inherit_time = time_best(inherit, repeat)
+    num_definitions = classes * (methods + 1)
+    times = (visit_time, group_time, resolve_time, inherit_time)
+    return {step: seconds / num_definitions for step, seconds in zip(STEPS, times)}
+
+
+def check_scaling(results: list[dict[str, float]], max_growth: float):
+    """
+    Check that the time per definition of every step stays roughly constant from the smallest to the largest module.
+
+    Args:
+        results: The results of `measure` for modules from small to large
+        max_growth: Maximum ratio of the time per definition of the largest and the smallest module
+
+    Raises:
+        AssertionError: if the time per definition of a step grew more than `max_growth` times
+    """
+    failures = []
+    for step in STEPS:
+        growth = results[-1][step] / results[0][step]
+        if growth > max_growth:
+            failures.append(f"{step}: the time per definition grew {growth:.1f}x, more than {max_growth}x")
+    assert not failures, '\n'.join(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that walking and resolving a module scales linearly")
+    parser.add_argument('--classes', type=int, nargs='+', default=[100, 200, 400, 800, 1600],
+                        help="Numbers of classes of the generated modules, from small to large")
+    parser.add_argument('--methods', type=int, default=20, help="Number of methods per class")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of repetitions per size, the best is used")
+    parser.add_argument('--max-growth', type=float, default=3.0,
+                        help="Maximum ratio of the time per definition of the largest and the smallest module")
+    args = parser.parse_args()
+
+    print(f"{'classes':>8} {'definitions':>12}" + ''.join(f" {step + ' (us/def)':>17}" for step in STEPS))
+    results = []
+    for classes in args.classes:
+        per_definition = measure(classes, args.methods, args.repeat)
+        results.append(per_definition)
+        print(f"{classes:>8} {classes * (args.methods + 1):>12}"
+              + ''.join(f" {per_definition[step] * 1e6:>17.3f}" for step in STEPS))
+
+    try:
+        check_scaling(results, args.max_growth)
+    except AssertionError as e:
+        print(e)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Compare two result files of `benchmarks.run`, e.g. of the commit before and after a change.
+
+Prints the time of every phase in both runs and their ratio. With `--threshold` the exit code is 1 if any phase
+became slower by more than the given factor, so the comparison can be used as a regression check. Run with
+`python -m benchmarks.compare baseline.json current.json`.
+"""
+import argparse
+import json
+import sys
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline: dict, current: dict, threshold: float = None) -> list[str]:
+    """Print the comparison and return the phases that regressed by more than `threshold`."""
+    if baseline['config'] != current['config']:
+        print("Warning: the results were measured with different configurations")
+    print(f"{'phase':<14} {baseline['commit'] or 'baseline':>12} {current['commit'] or 'current':>12} {'ratio':>8}")
+    regressions = []
+    phases = list(baseline['times']) + [phase for phase in current['times'] if phase not in baseline['times']]
+    for phase in phases + ['total']:
+        before = baseline['total'] if phase == 'total' else baseline['times'].get(phase)
+        after = current['total'] if phase == 'total' else current['times'].get(phase)
+        if before is None or after is None:
+            print(f"{phase:<14} {'-' if before is None else f'{before * 1000:.1f}':>12} "
+                  f"{'-' if after is None else f'{after * 1000:.1f}':>12}")
+            continue
+        ratio = after / before if before else float('inf')
+        marker = ''
+        if threshold is not None and ratio > threshold and phase != 'total':
+            regressions.append(phase)
+            marker = '  regression'
+        print(f"{phase:<14} {before * 1000:>10.1f}ms {after * 1000:>10.1f}ms {ratio:>7.2f}x{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument('baseline', type=str, help="Results of the baseline run")
+    parser.add_argument('current', type=str, help="Results of the current run")
+    parser.add_argument('--threshold', type=float, default=None,
+                        help="Exit with status 1 if a phase is slower than the baseline by more than this factor")
+    args = parser.parse_args()
+
+    regressions = compare(load_results(args.baseline), load_results(args.current), args.threshold)
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Benchmark harness that times every phase of a run on a synthetic code base.
+
+The phases are timed separately: file discovery, reading, `ast.parse`, the `AstWalker`, call resolution, the
+`CompactGraph` conversion, the dead code report, building the Graphviz graph and, if the `dot` executable is
+available, rendering.
+With `--memory` every phase runs a second time under tracemalloc to record its peak memory, so the timings are
+not affected by tracing. The results are written as JSON together with the configuration and the git commit, and
+can be compared with `python -m benchmarks.compare`. Run with `python -m benchmarks.run`.
+"""
+import argparse
+import ast
+import datetime
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Iterator
+
+from benchmarks.synthetic import IMPORT_STYLES, SyntheticConfig, generate_codebase
+from src.graphs import CallGraph, CompactGraph, find_dead_code
+from src.parser import AstWalker, Module, Parser
+
+PHASES: tuple[str, ...] = (
+    'discover', 'read', 'ast_parse', 'walk', 'resolve', 'compact_graph', 'dead_code', 'build_graph', 'render'
+)
+
+
+def run_phases(folder: str, output_folder: str, render: bool) -> Iterator[tuple[str, object]]:
+    """Run all phases once on `folder`, yields (phase, result) after every phase."""
+    parser = Parser()
+    jobs = parser.discover_files(folder)
+    yield 'discover', jobs
+
+    sources = []
+    for file_path, _ in jobs:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            sources.append(f.read())
+    yield 'read', sources
+
+    trees = [ast.parse(source, filename=file_path) for source, (file_path, _) in zip(sources, jobs)]
+    yield 'ast_parse', trees
+
+    walker = AstWalker()
+    modules = {}
+    for tree, (_, module_name) in zip(trees, jobs):
+        definitions, calls, imports = walker.walk(tree, module_name.removesuffix('.py'))
+        modules[module_name] = Module(definitions=definitions, calls=calls, imports=imports)
+    del trees
+    yield 'walk', modules
+
+    modules = parser.resolve(modules, root_package=parser.root_package(folder))
+    yield 'resolve', modules
+
+    graph = CompactGraph.from_modules(modules)
+    yield 'compact_graph', graph
+
+    yield 'dead_code', find_dead_code(graph)
+
+    call_graph = CallGraph(output_path=os.path.join(output_folder, 'call_graph.svg'), level='auto')
+    call_graph.build_graph(graph)
+    yield 'build_graph', call_graph
+
+    if render:
+        call_graph.render()
+        yield 'render', None
+
+
+def time_phases(folder: str, output_folder: str, render: bool) -> dict[str, float]:
+    """Wall-clock seconds of every phase."""
+    times = {}
+    gc.collect()
+    start = time.perf_counter()
+    for phase, _ in run_phases(folder, output_folder, render):
+        end = time.perf_counter()
+        times[phase] = end - start
+        start = time.perf_counter()
+    return times
+
+
+def trace_phases(folder: str, output_folder: str, render: bool) -> dict[str, int]:
+    """Peak traced memory of every phase in bytes, including the results of the earlier phases it keeps alive."""
+    peaks = {}
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for phase, _ in run_phases(folder, output_folder, render):
+            peaks[phase] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def git_commit() -> str | None:
+    """The commit of the working tree, or None outside a git repository."""
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def run_benchmark(config: SyntheticConfig, repeat: int = 3, memory: bool = False, render: bool = None) -> dict:
+    """Generate a code base for `config` and benchmark it, returns the results as a JSON-serializable dict."""
+    if render is None:
+        render = shutil.which('dot') is not None
+    with tempfile.TemporaryDirectory() as folder, tempfile.TemporaryDirectory() as output_folder:
+        code_folder = os.path.join(folder, 'synthetic')
+        stats = generate_codebase(code_folder, config)
+        # The best of `repeat` runs is least affected by other processes
+        runs = [time_phases(code_folder, output_folder, render) for _ in range(repeat)]
+        times = {phase: min(run[phase] for run in runs) for phase in runs[0]}
+        peaks = trace_phases(code_folder, output_folder, render) if memory else None
+
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': config.to_dict(),
+        'codebase': vars(stats),
+        'repeat': repeat,
+        'times': times,
+        'total': sum(times.values()),
+        'peak_memory': peaks,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def print_results(results: dict):
+    codebase = results['codebase']
+    print(f"{codebase['files']} files, {codebase['lines']} lines, {codebase['functions']} functions, "
+          f"{codebase['calls']} calls")
+    peaks = results['peak_memory'] or {}
+    for phase, seconds in results['times'].items():
+        peak = f"{peaks[phase] / 2**20:>8.1f} MB" if phase in peaks else ''
+        print(f"{phase:<14} {seconds * 1000:>10.1f} ms {peak}")
+    print(f"{'total':<14} {results['total'] * 1000:>10.1f} ms")
+    print(f"max RSS {results['max_rss_kb'] / 1024:.1f} MB")
+
+
+def main():
+    defaults = SyntheticConfig()
+    parser = argparse.ArgumentParser(description="Benchmark every phase of a run on a synthetic code base")
+    parser.add_argument('--modules', type=int, default=defaults.modules, help="Number of generated modules")
+    parser.add_argument('--modules-per-package', type=int, default=defaults.modules_per_package,
+                        help="Number of modules per sub-package")
+    parser.add_argument('--functions', type=int, default=defaults.functions,
+                        help="Number of functions and methods per module")
+    parser.add_argument('--fan-out', type=int, default=defaults.fan_out, help="Number of calls per function")
+    parser.add_argument('--nesting-depth', type=int, default=defaults.nesting_depth,
+                        help="Levels of nested functions inside every top-level function")
+    parser.add_argument('--class-density', type=float, default=defaults.class_density,
+                        help="Fraction of the functions that are methods")
+    parser.add_argument('--import-style', choices=IMPORT_STYLES, default=defaults.import_style,
+                        help="How modules import each other")
+    parser.add_argument('--seed', type=int, default=defaults.seed, help="Seed of the generator")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of timed runs, the fastest is reported")
+    parser.add_argument('--memory', action='store_true', help="Also measure the peak memory of every phase")
+    parser.add_argument('--no-render', action='store_true', help="Skip rendering even if Graphviz is installed")
+    parser.add_argument('-o', '--output', type=str, default=None, help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    config = SyntheticConfig(
+        modules=args.modules,
+        modules_per_package=args.modules_per_package,
+        functions=args.functions,
+        fan_out=args.fan_out,
+        nesting_depth=args.nesting_depth,
+        class_density=args.class_density,
+        import_style=args.import_style,
+        seed=args.seed,
+    )
+    results = run_benchmark(config, repeat=args.repeat, memory=args.memory, render=False if args.no_render else None)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
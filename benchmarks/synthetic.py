@@ -0,0 +1,157 @@
+"""
+Deterministic generator of synthetic Python code bases for benchmarks.
+
+The generated code base is a package with `modules / modules_per_package` sub-packages. Every module has the
+same layout: top-level functions `function_<i>` and classes `Class_<k>` with methods `method_<j>`, so calls to
+other modules can be generated without knowing their contents. The same configuration and seed always generate
+the same files.
+"""
+import math
+import os
+import random
+from dataclasses import asdict, dataclass
+
+IMPORT_STYLES: tuple[str, ...] = ('from', 'module', 'alias', 'relative', 'mixed')
+EXTERNAL_CALLS: tuple[str, ...] = ('len(args)', 'print(args)', 'os.path.join("a", "b")', 'sorted(args)')
+
+
+@dataclass
+class SyntheticConfig:
+    """Parameters of a synthetic code base."""
+    modules: int = 100
+    modules_per_package: int = 10
+    functions: int = 20  # Functions and methods per module
+    fan_out: int = 5  # Calls per function
+    nesting_depth: int = 0  # Levels of nested functions inside every top-level function
+    class_density: float = 0.2  # Fraction of the functions that are methods
+    methods_per_class: int = 5
+    import_style: str = 'mixed'  # One of IMPORT_STYLES
+    external_ratio: float = 0.1  # Fraction of the calls to the standard library
+    seed: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class SyntheticStats:
+    """Size of a generated code base."""
+    files: int = 0
+    lines: int = 0
+    bytes: int = 0
+    functions: int = 0
+    classes: int = 0
+    calls: int = 0
+
+
+class SyntheticCodebase:
+    """Writes a synthetic code base for a `SyntheticConfig`."""
+    def __init__(self, config: SyntheticConfig):
+        if config.import_style not in IMPORT_STYLES:
+            raise ValueError(f"Unknown import style '{config.import_style}', choose from {IMPORT_STYLES}")
+        self.config = config
+        self.rng = random.Random(config.seed)
+        n_methods = int(config.functions * config.class_density)
+        self.n_classes = math.ceil(n_methods / config.methods_per_class) if n_methods else 0
+        self.n_functions = config.functions - n_methods
+        self.methods_per_class = config.methods_per_class if n_methods else 0
+        self.stats = SyntheticStats()
+
+    def write(self, folder: str) -> SyntheticStats:
+        """Write the code base into `folder`, which is created if needed."""
+        os.makedirs(folder, exist_ok=True)
+        self._write_file(os.path.join(folder, '__init__.py'), '')
+        n_packages = math.ceil(self.config.modules / self.config.modules_per_package)
+        for package in range(n_packages):
+            os.makedirs(os.path.join(folder, f'pkg_{package}'), exist_ok=True)
+            self._write_file(os.path.join(folder, f'pkg_{package}', '__init__.py'), '')
+        for module in range(self.config.modules):
+            package = module // self.config.modules_per_package
+            path = os.path.join(folder, f'pkg_{package}', f'module_{module}.py')
+            self._write_file(path, self._generate_module(module))
+        return self.stats
+
+    def _write_file(self, path: str, source: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(source)
+        self.stats.files += 1
+        self.stats.lines += source.count('\n')
+        self.stats.bytes += len(source.encode('utf-8'))
+
+    def _generate_module(self, module: int) -> str:
+        imports = {'import os'}
+        body = []
+        for function in range(self.n_functions):
+            body.append(f'\n\ndef function_{function}(*args):')
+            body.extend(self._generate_body(module, imports, indent=1, depth=self.config.nesting_depth))
+            self.stats.functions += 1
+        for class_index in range(self.n_classes):
+            body.append(f'\n\nclass Class_{class_index}:')
+            self.stats.classes += 1
+            for method in range(self.methods_per_class):
+                body.append(f'    def method_{method}(self, *args):')
+                if self.methods_per_class > 1:
+                    body.append(f'        self.method_{(method + 1) % self.methods_per_class}()')
+                    self.stats.calls += 1
+                body.extend(self._generate_body(module, imports, indent=2, depth=0))
+                self.stats.functions += 1
+        return '\n'.join(sorted(imports) + body) + '\n'
+
+    def _generate_body(self, module: int, imports: set[str], indent: int, depth: int) -> list[str]:
+        prefix = '    ' * indent
+        lines = []
+        if depth > 0:
+            lines.append(f'{prefix}def nested_{depth}(*args):')
+            lines.extend(self._generate_body(module, imports, indent + 1, depth - 1))
+            lines.append(f'{prefix}nested_{depth}()')
+            self.stats.functions += 1
+            self.stats.calls += 1
+        for _ in range(self.config.fan_out):
+            lines.append(prefix + self._generate_call(module, imports))
+            self.stats.calls += 1
+        lines.append(f'{prefix}return args')
+        return lines
+
+    def _generate_call(self, module: int, imports: set[str]) -> str:
+        rng = self.rng
+        if rng.random() < self.config.external_ratio:
+            return rng.choice(EXTERNAL_CALLS)
+
+        # Pick a function or a method of a random module
+        target = rng.randrange(self.config.modules)
+        index = rng.randrange(self.n_functions + self.n_classes * self.methods_per_class)
+        if index < self.n_functions:
+            name = f'function_{index}'
+        else:
+            index -= self.n_functions
+            name = f'Class_{index // self.methods_per_class}.method_{index % self.methods_per_class}'
+        call = '(None)' if '.' in name else '()'
+        if target == module:
+            return f'{name}{call}'
+
+        target_package = target // self.config.modules_per_package
+        target_module = f'pkg_{target_package}.module_{target}'
+        style = self.config.import_style
+        if style == 'mixed':
+            style = IMPORT_STYLES[target % (len(IMPORT_STYLES) - 1)]
+        head = name.partition('.')[0]
+        if style == 'from':
+            alias = f'{head}_m{target}'
+            imports.add(f'from {target_module} import {head} as {alias}')
+            return f'{alias}{name[len(head):]}{call}'
+        if style == 'module':
+            imports.add(f'import {target_module}')
+            return f'{target_module}.{name}{call}'
+        if style == 'alias':
+            imports.add(f'import {target_module} as m_{target}')
+            return f'm_{target}.{name}{call}'
+        # Relative import of the target module
+        package = module // self.config.modules_per_package
+        source = '.' if package == target_package else f'..pkg_{target_package}'
+        imports.add(f'from {source} import module_{target}')
+        return f'module_{target}.{name}{call}'
+
+
+def generate_codebase(folder: str, config: SyntheticConfig = None) -> SyntheticStats:
+    """Write a synthetic code base into `folder` and return its size."""
+    return SyntheticCodebase(config or SyntheticConfig()).write(folder)
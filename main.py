@@ -1,5 +1,7 @@
 import logging
 
+from src.graphs import CallGraph, CompactGraph
+from src.parser import Parser
 from src.poseidon import poseidon
 
 # Configure logging
@@ -19,39 +21,24 @@ poseidon(
     output_path='output/example_with_classes.png'
 )
 
-# Example 3: Exclude private/external
-poseidon(
-    folder_path="examples/example_ignore",
-    graph_type='call',
-    output_path='output/example_ignore_exclude_all.png'
-)
-
-
-# Example 4: Show private
-poseidon(
-    folder_path="examples/example_ignore",
-    graph_type='call',
-    output_path='output/example_show_private.png',
-    exclude_private=False,
-)
-
-# Example 5: Show External
-poseidon(
-    folder_path="examples/example_ignore",
-    graph_type='call',
-    output_path='output/example_show_external.png',
-    exclude_external=False,
-)
-
-# Example 6: Show all
-poseidon(
-    folder_path="examples/example_ignore",
-    graph_type='call',
-    output_path='output/example_show_all.png',
-    exclude_external=False,
-    exclude_private=False,
-    title='Very cool title'
-)
+# Examples 3-6 render the same folder with different filters, so it is parsed only once
+modules = Parser().parse_folder("examples/example_ignore")
+compact_graph = CompactGraph.from_modules(modules)
+ignore_examples = [
+    # Example 3: Exclude private/external
+    dict(output_path='output/example_ignore_exclude_all.png', exclude_private=True, exclude_external=True),
+    # Example 4: Show private
+    dict(output_path='output/example_show_private.png', exclude_private=False, exclude_external=True),
+    # Example 5: Show External
+    dict(output_path='output/example_show_external.png', exclude_private=True, exclude_external=False),
+    # Example 6: Show all
+    dict(output_path='output/example_show_all.png', exclude_private=False, exclude_external=False,
+         title='Very cool title'),
+]
+for example in ignore_examples:
+    graph = CallGraph(**example)
+    graph.build_graph(compact_graph)
+    graph.render()
 
 # Example 7: Show all
 poseidon(
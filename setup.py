@@ -3,8 +3,8 @@ from setuptools import setup, find_packages
 
 setup(
     name="poseidon",
-    version="0.0.2",
-    packages=find_packages(),
+    version="0.1.0",
+    packages=find_packages(exclude=["tests", "tests.*"]),
     entry_points={
         'console_scripts': [
             'poseidon = src.poseidon:main',  # This tells setuptools to link the CLI command to your main function
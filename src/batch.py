@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+
+from src.graphs import CallGraph, ClassGraph, CompactGraph, HtmlViewer
+from src.graphs.exporters import EXPORT_FORMATS, GraphExporter, get_exporter
+from src.graphs.html_viewer import is_html_output
+from src.graphs.queries import CALLEES
+from src.graphs.sequence_diagram import DEFAULT_MAX_CALLS, DEFAULT_MAX_DEPTH, SequenceDiagram
+from src.parser import Module, make_parser
+from src.parser.cache import DEFAULT_CACHE_SIZE
+from src.parser.symbol_index import SymbolIndex
+
+DEFAULT_RENDER_WORKERS = min(8, os.cpu_count() or 1)
+# Graph types of batch jobs, the class and sequence jobs also need the parsed modules besides the call graph
+GRAPH_TYPES: tuple[str, ...] = ('call', 'class', 'sequence')
+
+
+@dataclass
+class RenderJob:
+    """Specification of a single graph in a batch."""
+    output_path: str
+    graph_type: str = 'call'  # One of GRAPH_TYPES
+    title: str = None
+    exclude_private: bool = True
+    exclude_external: bool = True
+    package: str = None  # Only show the modules of this package
+    level: str = 'function'  # 'function', 'module', 'package' or 'auto'
+    focus: list[str] = None  # Only show the functions reachable from these functions, the entry of a sequence
+    depth: int = None
+    direction: str = CALLEES  # 'callees', 'callers' or 'both'
+    layout_cache: bool = False  # Keep unchanged nodes at their position of the previous render
+    max_calls: int = DEFAULT_MAX_CALLS  # Maximum number of calls shown per function of a sequence diagram
+    export_format: str = None  # Export a call graph in this format instead of by the extension of the output
+
+
+@dataclass
+class JobResult:
+    """Outcome of a single job in a batch, times are in seconds."""
+    output_path: str
+    build_time: float = 0.0
+    render_time: float = 0.0
+    error: str = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class BatchResult:
+    """Outcome of a batch, times are in seconds."""
+    parse_time: float = 0.0
+    total_time: float = 0.0
+    jobs: list[JobResult] = field(default_factory=list)
+
+    @property
+    def failed(self) -> list[JobResult]:
+        return [job for job in self.jobs if not job.succeeded]
+
+    def summary(self) -> str:
+        """A table with the timings and failures of the jobs."""
+        lines = [f"{'output':<50} {'build (s)':>10} {'render (s)':>11}  status"]
+        for job in self.jobs:
+            status = 'ok' if job.succeeded else f'FAILED: {job.error}'
+            lines.append(f"{job.output_path:<50} {job.build_time:>10.2f} {job.render_time:>11.2f}  {status}")
+        lines.append(f"Parsed in {self.parse_time:.2f} s, {len(self.jobs)} jobs ({len(self.failed)} failed) "
+                     f"finished in {self.total_time:.2f} s")
+        return '\n'.join(lines)
+
+
+def load_manifest(manifest_path: str) -> list[dict]:
+    """
+    Load the job specifications of a batch from a JSON or YAML manifest.
+
+    The manifest is either a list of job specifications, or a mapping with the specifications under `jobs`
+    and optionally default values for all jobs under `defaults`. The keys of a specification are the fields
+    of `RenderJob`. The specifications are validated per job by `poseidon_batch`, so an invalid job does not
+    stop the other jobs.
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        if manifest_path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ImportError("PyYAML is required for YAML manifests, install it or use a JSON manifest") from e
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+
+    defaults = {}
+    if isinstance(manifest, dict):
+        defaults = manifest.get('defaults', {})
+        manifest = manifest.get('jobs', [])
+    return [{**defaults, **spec} if isinstance(spec, dict) else spec for spec in manifest]
+
+
+def poseidon_batch(
+        folder_path: str,
+        jobs: list[RenderJob | dict] | str,
+        render_workers: int = DEFAULT_RENDER_WORKERS,
+        workers: int = 1,
+        cache_dir: str = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        include: list[str] = None,
+        exclude: list[str] = None,
+        use_gitignore: bool = True
+    ) -> BatchResult:
+    """ Produce many graphs of a folder from a single parse
+
+    The graphs are built one by one, while up to `render_workers` Graphviz processes render them concurrently.
+    A failing or invalid job does not stop the other jobs, its error is reported in the result. Call graphs are
+    built from the `CompactGraph` of the parse, or streamed by an exporter for outputs such as `.dot` or `.jsonl`.
+    The parsed modules are only kept for exported call graphs, class diagrams and sequence diagrams.
+
+    Args:
+        folder_path: The path of the source code to be parsed
+        jobs: The graphs to be produced, as `RenderJob`s, dictionaries or the path of a manifest
+        render_workers: Maximum number of concurrent Graphviz processes
+        workers: Number of processes used for parsing, values below 1 use all available cores
+        cache_dir: Folder of the parse cache for unchanged files, None (the default) disables the cache. The
+            entries are unpickled, so only use a folder that no untrusted user can write to
+        cache_size: Maximum size of the parse cache in bytes
+        include: Patterns in .gitignore syntax of the files to parse, all Python files by default
+        exclude: Patterns in .gitignore syntax of files and directories to skip
+        use_gitignore: Skip the files ignored by the .gitignore files in the folder
+    """
+    start = time.perf_counter()
+    if isinstance(jobs, str):
+        jobs = load_manifest(jobs)
+    result = BatchResult()
+    valid_jobs = []
+    for number, spec in enumerate(jobs, start=1):
+        try:
+            job = _make_job(spec)
+        except (TypeError, ValueError) as e:
+            output_path = spec.get('output_path') if isinstance(spec, dict) else None
+            logging.error(f'Job {number} is invalid: {e}')
+            result.jobs.append(JobResult(output_path=str(output_path or f'<job {number}>'), error=str(e)))
+            continue
+        job_result = JobResult(output_path=job.output_path)
+        result.jobs.append(job_result)
+        valid_jobs.append((job, job_result))
+
+    parser = make_parser(workers, cache_dir, cache_size, include, exclude, use_gitignore)
+    modules = parser.parse_folder(folder_path=folder_path)
+    compact_graph = CompactGraph.from_modules(modules)
+    # The index the parser resolved the calls with is shared by all class diagrams
+    index = parser.index if any(job.graph_type == 'class' for job, _ in valid_jobs) else None
+    if all(job.graph_type == 'call' and _job_exporter(job) is None for job, _ in valid_jobs):
+        modules = None
+    result.parse_time = time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, render_workers)) as executor:
+        pending = []
+        for job, job_result in valid_jobs:
+            try:
+                graph = _build_job(compact_graph, job, job_result, modules=modules, index=index)
+            except Exception as e:
+                logging.error(f'Building {job.output_path} failed: {e}')
+                job_result.error = str(e)
+                continue
+            if graph is not None:
+                pending.append(executor.submit(_render_job, graph, job_result))
+        for future in pending:
+            future.result()
+
+    result.total_time = time.perf_counter() - start
+    logging.info(f'Finished batch of {len(result.jobs)} jobs with {len(result.failed)} failures')
+    return result
+
+
+def _make_job(spec: RenderJob | dict) -> RenderJob:
+    """The job of a specification, raises a ValueError if the specification is invalid."""
+    if isinstance(spec, RenderJob):
+        job = spec
+    elif isinstance(spec, dict):
+        job_fields = {job_field.name for job_field in fields(RenderJob)}
+        unknown = sorted(map(str, spec.keys() - job_fields))
+        if unknown:
+            raise ValueError(f"Unknown job field(s) {', '.join(unknown)}, choose from {', '.join(sorted(job_fields))}")
+        if not isinstance(spec.get('output_path'), str):
+            raise ValueError('A job requires an output_path')
+        job = RenderJob(**spec)
+    else:
+        raise ValueError(f'A job specification is a mapping, not {type(spec).__name__}')
+    if job.graph_type not in GRAPH_TYPES:
+        raise ValueError(f"Graph type '{job.graph_type}' is not supported, choose from {', '.join(GRAPH_TYPES)}")
+    _job_exporter(job)  # Validates the export format
+    return job
+
+
+def _job_exporter(job: RenderJob) -> type[GraphExporter] | None:
+    """The exporter of a call graph job, see `get_exporter`, None if the graph is rendered."""
+    if job.graph_type != 'call':
+        return None
+    if job.export_format is not None and job.export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Export format '{job.export_format}' is not supported, choose from "
+                         f"{', '.join(EXPORT_FORMATS)}")
+    return get_exporter(job.output_path, job.export_format)
+
+
+def _build_job(
+        compact_graph: CompactGraph,
+        job: RenderJob,
+        job_result: JobResult,
+        modules: dict[str, Module] = None,
+        index: SymbolIndex = None
+    ) -> CallGraph | SequenceDiagram | None:
+    """Build the graph of a job, or export it directly and return None if the job has an exporter."""
+    start = time.perf_counter()
+    if job.graph_type == 'class':
+        graph = ClassGraph(
+            output_path=job.output_path,
+            title=job.title,
+            exclude_private=job.exclude_private,
+            exclude_external=job.exclude_external
+        )
+        graph.build_graph(_package_modules(modules, job.package), index=index)
+        job_result.build_time = time.perf_counter() - start
+        return graph
+    if job.graph_type == 'sequence':
+        if not job.focus or len(job.focus) != 1:
+            raise ValueError('A sequence diagram starts at exactly one focused function')
+        graph = SequenceDiagram(
+            output_path=job.output_path,
+            title=job.title,
+            exclude_private=job.exclude_private,
+            exclude_external=job.exclude_external,
+            max_depth=DEFAULT_MAX_DEPTH if job.depth is None else job.depth,
+            max_calls=job.max_calls
+        )
+        graph.build_graph(_package_modules(modules, job.package), entry=job.focus[0])
+        job_result.build_time = time.perf_counter() - start
+        return graph
+    exporter = _job_exporter(job)
+    if exporter is not None:
+        if job.focus:
+            raise ValueError('A focused graph can only be rendered, not exported')
+        # Stream the graph to the output like `poseidon`, there is nothing left to render
+        exporter(
+            output_path=job.output_path,
+            exclude_private=job.exclude_private,
+            exclude_external=job.exclude_external
+        ).export(_package_modules(modules, job.package))
+        job_result.build_time = time.perf_counter() - start
+        return None
+    if job.package is not None:
+        compact_graph = compact_graph.select_package(job.package)
+    if is_html_output(job.output_path):
+        graph = HtmlViewer(
+            output_path=job.output_path,
+            title=job.title,
+            exclude_private=job.exclude_private,
+            exclude_external=job.exclude_external,
+            focus=job.focus,
+            depth=job.depth,
+            direction=job.direction
+        )
+        graph.build_graph(compact_graph)
+        job_result.build_time = time.perf_counter() - start
+        return graph
+    graph = CallGraph(
+        output_path=job.output_path,
+        title=job.title,
+        exclude_private=job.exclude_private,
+        exclude_external=job.exclude_external,
+        level=job.level,
+        focus=job.focus,
+        depth=job.depth,
+        direction=job.direction,
+        layout_cache=job.layout_cache
+    )
+    graph.build_graph(compact_graph)
+    job_result.build_time = time.perf_counter() - start
+    return graph
+
+
+def _package_modules(modules: dict[str, Module], package: str = None) -> dict[str, Module]:
+    """The modules of a package, like `CompactGraph.select_package`, all modules if no package is given."""
+    if package is None:
+        return modules
+    return {
+        module_file: module for module_file, module in modules.items()
+        if module_file.removesuffix('.py') == package or module_file.startswith(f'{package}.')
+    }
+
+
+def _render_job(graph: CallGraph | SequenceDiagram, job_result: JobResult):
+    """Render a built graph, runs in a thread that waits for the Graphviz process."""
+    start = time.perf_counter()
+    try:
+        graph.render()
+    except Exception as e:
+        logging.error(f'Rendering {job_result.output_path} failed: {e}')
+        job_result.error = str(e)
+    job_result.render_time = time.perf_counter() - start
@@ -1 +1,10 @@
-from .call_graph import CallGraph
\ No newline at end of file
+from .compact_graph import CompactGraph
+from .call_graph import CallGraph
+from .class_graph import ClassGraph
+from .exporters import DotExporter, GraphExporter, GraphMLExporter, JsonLinesExporter, get_exporter
+from .dead_code import DeadCodeReport, DeadDefinition, find_dead_code
+from .graph_diff import GraphDiff, diff_graphs
+from .html_viewer import HtmlViewer
+from .layout_cache import LayoutCache, LayoutPlan
+from .queries import GraphQuery
+from .sequence_diagram import SequenceDiagram
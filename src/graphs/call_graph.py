@@ -1,73 +1,254 @@
 import graphviz
 import logging
+import math
 import os
 
-from src.parser import Class, Definition
+from src.graphs.compact_graph import CLASS, EXTERNAL, FUNCTION, METHOD, NO_ID, CompactGraph
+from src.graphs.graph_diff import GraphDiff
+from src.graphs.layout_cache import LAYOUT_CACHE_SUFFIX, PIN_ENGINE, LayoutCache, LayoutPlan
+from src.graphs.queries import CALLEES, GraphQuery
+from src.parser import Module
+from src.stats import RunStats, phase
+
+# Above this number of nodes a faster layout engine and a lower resolution are used, and the 'auto' level of
+# detail collapses functions into modules or packages
+LARGE_GRAPH_NODES = 1000
+LARGE_GRAPH_ENGINE = 'sfdp'
+LARGE_GRAPH_DPI = '96'
+DEFAULT_ENGINE = 'dot'
+DEFAULT_DPI = '300'
+# Colors of the definitions and calls that were added or removed, see `GraphDiff`
+ADDED_COLOR = 'forestgreen'
+ADDED_FILL_COLOR = 'palegreen'
+REMOVED_COLOR = 'red'
 
 class CallGraph:
-    def __init__(self, output_path: str = 'call_graph.png', title: str = None):
-        """Initialize the call graph."""
+    def __init__(
+            self,
+            output_path: str = 'call_graph.png',
+            title: str = None,
+            exclude_private: bool = False,
+            exclude_external: bool = False,
+            level: str = 'function',
+            engine: str = None,
+            dpi: str = None,
+            stats: RunStats = None,
+            diff: GraphDiff = None,
+            focus: list[str] = None,
+            depth: int = None,
+            direction: str = CALLEES,
+            layout_cache: bool = False
+    ):
+        """Initialize the call graph.
+
+        Args:
+            output_path: The path where the graph should be stored
+            title: Title of the graph, defaults to the name of the output file
+            exclude_private: Leave out private functions and the calls from and to them
+            exclude_external: Leave out calls to external functions
+            level: Level of detail, 'function', 'module' or 'package' to collapse functions into modules or
+                packages, or 'auto' to collapse only if the graph has more than `LARGE_GRAPH_NODES` nodes
+            engine: Graphviz layout engine, by default 'dot' or 'sfdp' for large graphs
+            dpi: Resolution of the output, by default 300 or 96 for large graphs
+            stats: Optional `RunStats` that collects the time of building and rendering the graph
+            diff: Optional difference with an earlier version of the graph, added definitions and calls are
+                highlighted and removed ones are drawn dashed, at the function level of detail only
+            focus: Only show the functions reachable from these functions, see `GraphQuery.focus`
+            depth: Maximum number of calls from a focused function, None for no limit
+            direction: Follow calls from the focused functions to their 'callees', 'callers' or 'both'
+            layout_cache: Store the layout next to the output, e.g. `graph.layout.json`, and keep the unchanged
+                nodes at their previous positions on the next render, see `LayoutCache`
+        """
         # Set attributes
         self.output_path = output_path
+        self.exclude_private = exclude_private
+        self.exclude_external = exclude_external
+        self.level = level
+        self.engine = engine
+        self.dpi = dpi
+        self.stats = stats
+        self.diff = diff
+        self.focus = focus
+        self.depth = depth
+        self.direction = direction
+        self.layout_cache = layout_cache
+        self._layout: LayoutPlan | None = None
+        self._layout_engine: str = None  # Engine that lays out the graph from scratch
+        self._drawn_clusters: set[str] = set()
+        self._node_clusters: dict[str, str] = {}
+        self._added_definitions = set(diff.added_definitions) if diff is not None else set()
+        self._added_edges = set(diff.added_edges) if diff is not None else set()
+        self._focused = set()
 
         # Extract other attributes based on the output path
         base_name, file_extension = os.path.splitext(self.output_path)
         self.base_name = base_name
         self.file_extension = file_extension.lstrip('.') if file_extension else  '.png'  # Remove leading dot if present
         self.title = base_name.split('/')[-1] if title is None else title
+        self.layout_path = base_name + LAYOUT_CACHE_SUFFIX
+
+    def build_graph(self, modules: dict[str, Module] | CompactGraph):
+        """Build the call graph based on the parsed modules, or their `CompactGraph`."""
+        if isinstance(modules, CompactGraph):
+            graph = modules
+        else:
+            with phase(self.stats, 'compact_graph'):
+                graph = CompactGraph.from_modules(modules)
+        if self.focus:
+            # Focus before filtering, so that paths through private functions are followed
+            with phase(self.stats, 'focus'):
+                query = GraphQuery(graph)
+                self._focused = {graph.names[query.find(name)] for name in self.focus}
+                graph = query.focus(self.focus, depth=self.depth, direction=self.direction)
+        with phase(self.stats, 'filter'):
+            graph = graph.filter(exclude_private=self.exclude_private, exclude_external=self.exclude_external)
+        with phase(self.stats, 'collapse'):
+            level = self._select_level(graph) if self.level == 'auto' else self.level
+            graph = graph.collapse(level)
+        if self.stats is not None:
+            self.stats.count('nodes', graph.num_nodes)
+            self.stats.count('edges', graph.num_edges)
 
-    def build_graph(self, modules):
-        """Build the call graph based on the parsed modules."""
+        with phase(self.stats, 'build_graph'):
+            self._add_graph(graph, level)
+
+    def _add_graph(self, graph: CompactGraph, level: str):
+        """Add the nodes and edges of a filtered and collapsed graph to the Graphviz graph."""
         # Create empty graph
-        self._init_graph()
+        self._init_graph(num_nodes=graph.num_nodes)
+        if self.layout_cache:
+            self._plan_layout(graph, level)
+        if level != 'function':
+            self._add_collapsed_nodes(graph)
+            self._add_title()
+            return
 
         # Process modules
-        logging.debug(f"Building graph with {len(modules)} modules.")
-        for module_name, module in modules.items():
+        logging.debug(f"Building graph with {len(graph.module_names)} modules.")
+        called = _called_classes(graph)
+        for module_id, module_name in enumerate(graph.module_names):
             logging.debug(f"Processing module: {module_name}")
+            if not self._is_drawn(f"cluster_{module_name}"):
+                continue
             # Create a subgraph for the module that groups all functions and calls inside a dotted box
             with self.graph.subgraph(name=f"cluster_{module_name}") as subgraph:
-                subgraph.attr(label=module_name, style='dotted', color='black')  # Dotted box for module
-                for full_name, definition in module.definitions.items():
-                    # Add each function in the module
-                    if type(definition) == Definition:
-                        self._add_function(graph=subgraph, full_name=full_name, definition=definition)
+                # Dotted box for module
+                subgraph.attr(label=module_name, style='dotted', color='black',
+                              **self._cluster_layout(f"cluster_{module_name}"))
+                for node_id in graph.module_nodes(module_id):
+                    # Add each function in the module, methods are added together with their class
+                    kind = graph.kinds[node_id]
+                    if kind == FUNCTION:
                         # Detect leaf functions (functions that do not have any calls)
-                        if not module.calls[full_name]:
-                            self._add_function(graph=subgraph, full_name=full_name, definition=definition, is_leaf=True)
-                    elif type(definition) == Class:
-                        self._add_class(subgraph, definition=definition)
-
-                # Add calls for each function
-                for caller, callees in module.calls.items():
-                    for callee in callees:
-                        self._add_call(caller, callee)
+                        is_leaf = graph.out_degree(node_id) == 0
+                        self._add_function(graph=subgraph, full_name=graph.names[node_id],
+                                           label=graph.labels[node_id], is_leaf=is_leaf)
+                    elif kind == CLASS:
+                        self._add_class(subgraph, compact_graph=graph, class_id=node_id, called=called)
+
+                # Add calls for each function, a single edge per callee weighted by the number of calls
+                for node_id in graph.module_nodes(module_id):
+                    for callee_id, weight in zip(graph.successors(node_id), graph.successor_weights(node_id)):
+                        self._add_call(graph.names[node_id], graph.names[callee_id], weight=weight)
+        if self._layout is not None:
+            # External functions are only added by their calls, which does not place them
+            for node_id in range(graph.num_nodes):
+                kind = graph.kinds[node_id]
+                layout = self._node_layout(graph.names[node_id])
+                if layout and (kind == EXTERNAL or (kind == METHOD and graph.parents[node_id] == NO_ID)):
+                    self.graph.node(graph.names[node_id], **layout)
+        if self.diff is not None:
+            self._add_removed(graph)
         self._add_title()
 
-    def _add_function(self, graph, full_name, definition: Definition, is_leaf=False):
+    @staticmethod
+    def _select_level(graph: CompactGraph) -> str:
+        """Select the most detailed level at which the graph has at most `LARGE_GRAPH_NODES` nodes."""
+        if graph.num_nodes <= LARGE_GRAPH_NODES:
+            return 'function'
+        if len(graph.module_names) <= LARGE_GRAPH_NODES:
+            return 'module'
+        return 'package'
+
+    def _add_collapsed_nodes(self, graph: CompactGraph):
+        """Add the nodes of a graph collapsed into modules or packages, clustered by their parent package."""
+        for group_id, group_name in enumerate(graph.module_names):
+            if not self._is_drawn(f"cluster_{group_name}"):
+                continue
+            with self.graph.subgraph(name=f"cluster_{group_name}") as subgraph:
+                subgraph.attr(label=group_name, style='dotted', color='black',
+                              **self._cluster_layout(f"cluster_{group_name}"))
+                for node_id in graph.module_nodes(group_id):
+                    subgraph.node(graph.names[node_id], label=graph.names[node_id], shape='box',
+                                  style='filled', fillcolor='lightblue', **self._node_layout(graph.names[node_id]))
+        for node_id in range(graph.module_offsets[-1], graph.num_nodes):
+            if graph.kinds[node_id] == EXTERNAL:
+                self.graph.node(graph.names[node_id], label=graph.labels[node_id],
+                                **self._node_layout(graph.names[node_id]))
+
+        for node_id in range(graph.num_nodes):
+            for callee_id, weight in zip(graph.successors(node_id), graph.successor_weights(node_id)):
+                self._add_call(graph.names[node_id], graph.names[callee_id], weight=weight)
+
+    def _add_function(self, graph, full_name, label: str, is_leaf=False):
         """Create a function node, marking leaf nodes in green."""
         logging.debug(f"Adding function: {full_name}")
+        layout = self._node_layout(full_name)
+        if full_name in self._added_definitions:
+            graph.node(full_name, label=label, style='filled', fillcolor=ADDED_FILL_COLOR, color=ADDED_COLOR,
+                       penwidth='2', **layout)
+            return
         color = 'green' if is_leaf else 'lightblue'
-        graph.node(full_name, label=definition.name, style='filled', fillcolor=color)
+        if full_name in self._focused:
+            graph.node(full_name, label=label, style='filled', fillcolor=color, penwidth='3', **layout)
+            return
+        graph.node(full_name, label=label, style='filled', fillcolor=color, **layout)
 
-    def _add_class(self, graph, definition: Class):
-        """Create a box for a graph and add the methods"""
-        class_name = definition.name
-        module = definition.module
-        methods = definition.methods
+    def _add_class(self, graph, compact_graph: CompactGraph, class_id: int, called: set[int] = frozenset()):
+        """Create a box for a class with its methods, and the class itself if it is instantiated without `__init__`."""
+        class_name = compact_graph.labels[class_id]
+        module = compact_graph.names[class_id].rpartition('.')[0]
+        if not self._is_drawn(f"cluster_{module}_{class_name}"):
+            return
         with graph.subgraph(name=f"cluster_{module}_{class_name}") as class_graph:
             class_graph.attr(label=f'Class: {class_name}',
-                             style='solid', color='black', penwidth='0.7', bgcolor='#f2f2f2' )  # Box for class
-            for method_name, method in methods.items():
-                full_name = f'{module}.{method.class_name}.{method.name}'
+                             style='solid', color='black', penwidth='0.7', bgcolor='#f2f2f2',
+                             **self._cluster_layout(f"cluster_{module}_{class_name}"))  # Box for class
+            if class_id in called:
+                self._add_function(class_graph, compact_graph.names[class_id], label=class_name)
+            # The methods of a class directly follow the class node
+            node_id = class_id + 1
+            while node_id < compact_graph.num_nodes and compact_graph.parents[node_id] == class_id:
+                full_name = compact_graph.names[node_id]
                 logging.debug(f'adding method {full_name}')
-                self._add_function(class_graph, full_name, definition=method)
-
+                self._add_function(class_graph, full_name, label=compact_graph.labels[node_id])
+                node_id += 1
 
-    def _add_call(self, caller, callee):
-        """Add a directed edge for a function call."""
+    def _add_call(self, caller, callee, weight: int = 1):
+        """Add a directed edge for a function call, edges of multiple calls are drawn thicker."""
         logging.debug(f"Adding call from {caller} to {callee}.")
-        self.graph.edge(caller, callee)
+        layout = self._layout.edge_attributes(caller, callee) if self._layout is not None else {}
+        if (caller, callee) in self._added_edges:
+            self.graph.edge(caller, callee, color=ADDED_COLOR, penwidth='2', tooltip='added', **layout)
+        elif weight > 1:
+            self.graph.edge(caller, callee, weight=str(weight), penwidth=f'{1 + math.log2(weight):.2f}',
+                            tooltip=f'{weight} calls', **layout)
+        else:
+            self.graph.edge(caller, callee, **layout)
+
+    def _add_removed(self, graph: CompactGraph):
+        """Add the definitions and calls that were removed according to the diff, dashed and in red."""
+        removed = set(self.diff.removed_definitions)
+        for full_name in self.diff.removed_definitions:
+            self.graph.node(full_name, label=full_name.rpartition('.')[2], style='dashed', color=REMOVED_COLOR,
+                            fontcolor=REMOVED_COLOR, tooltip='removed', **self._node_layout(full_name))
+        for caller, callee in self.diff.removed_edges:
+            if graph.node_id(callee) == NO_ID and callee not in removed:
+                # A callee that is not part of the graph any more, e.g. an external function
+                removed.add(callee)
+                self.graph.node(callee, label=callee, style='dashed', color=REMOVED_COLOR, **self._node_layout(callee))
+            self.graph.edge(caller, callee, color=REMOVED_COLOR, style='dashed', tooltip='removed',
+                            **(self._layout.edge_attributes(caller, callee) if self._layout is not None else {}))
 
     def render(self):
         """Render the graph to a file."""
@@ -75,13 +256,102 @@ class CallGraph:
         output_path = self.output_path if self.file_extension else self.base_name + '.' + self.graph.format
 
         # Render the graph with the correct output path and format
-        self.graph.render(outfile=output_path, cleanup=True)  # This will use the specified output path
+        with phase(self.stats, 'render'):
+            if self._layout is not None:
+                self._render_with_layout(output_path)
+            else:
+                self.graph.render(outfile=output_path, cleanup=True)  # This will use the specified output path
         logging.info(f"Graph rendered and saved to {output_path}")
 
-    def _init_graph(self):
-        # Create empty graph
-        self.graph = graphviz.Digraph(engine='dot')
-        self.graph.attr(dpi='300')  # High-quality output
+    def _render_with_layout(self, output_path: str):
+        """
+        Lay out the graph as planned, then draw it with `neato -n2` and store the positions for the next render.
+
+        The laid out graph is drawn and read back without a layout of its own, which takes a fraction of the time
+        of the layout.
+        """
+        laid_out = graphviz.Source(
+            self.graph.pipe(format='dot', neato_no_op=self._layout.no_op, encoding='utf-8'),
+            engine=PIN_ENGINE,
+            format=self.graph.format
+        )
+        laid_out.render(outfile=output_path, neato_no_op=2, cleanup=True)
+        layout = laid_out.pipe(format='json0', neato_no_op=2)
+        LayoutCache.from_json(layout, engine=self._layout_engine, node_clusters=self._node_clusters).save(
+            self.layout_path
+        )
+        logging.debug(f'Layout stored in {self.layout_path}')
+
+    def _plan_layout(self, graph: CompactGraph, level: str):
+        """Decide which nodes keep their previous position, and switch to the engine that pins them."""
+        self._node_clusters = self._clusters_of_nodes(graph, level)
+        cache = LayoutCache.load(self.layout_path) or LayoutCache()
+        self._layout = cache.plan(
+            self._node_clusters, engine=self.graph.engine, max_incremental_nodes=LARGE_GRAPH_NODES
+        )
+        self._layout_engine = self.graph.engine
+        self.graph.engine = self._layout.engine
+        self.graph.attr(**self._layout.graph_attributes())
+        if self.stats is not None:
+            self.stats.count('pinned_nodes', len(self._layout.pinned))
+
+    def _clusters_of_nodes(self, graph: CompactGraph, level: str) -> dict[str, str]:
+        """{node: cluster} of all nodes that will be drawn, '' for nodes outside of clusters."""
+        clusters = {}
+        called = _called_classes(graph) if level == 'function' else set()
+        for module_id, module_name in enumerate(graph.module_names):
+            for node_id in graph.module_nodes(module_id):
+                kind = graph.kinds[node_id]
+                parent = graph.parents[node_id]
+                if level != 'function' or kind == FUNCTION:
+                    clusters[graph.names[node_id]] = f"cluster_{module_name}"
+                    self._drawn_clusters.add(f"cluster_{module_name}")
+                elif kind == METHOD and parent != NO_ID:
+                    class_name = graph.names[parent]
+                    clusters[graph.names[node_id]] = f"cluster_{class_name.rpartition('.')[0]}_{graph.labels[parent]}"
+                    self._drawn_clusters.update((f"cluster_{module_name}", clusters[graph.names[node_id]]))
+                elif kind == CLASS and node_id in called:
+                    class_name = graph.names[node_id]
+                    clusters[class_name] = f"cluster_{class_name.rpartition('.')[0]}_{graph.labels[node_id]}"
+                    self._drawn_clusters.update((f"cluster_{module_name}", clusters[class_name]))
+        for source, target in graph.edges():
+            clusters.setdefault(graph.names[source], '')
+            clusters.setdefault(graph.names[target], '')
+        if level != 'function':
+            for node_id in range(graph.module_offsets[-1], graph.num_nodes):
+                clusters.setdefault(graph.names[node_id], '')
+        if self.diff is not None and level == 'function':
+            for full_name in self.diff.removed_definitions:
+                clusters.setdefault(full_name, '')
+            for caller, callee in self.diff.removed_edges:
+                clusters.setdefault(caller, '')
+                clusters.setdefault(callee, '')
+        return clusters
+
+    def _is_drawn(self, cluster: str) -> bool:
+        """
+        Whether a cluster has nodes, empty clusters are left out when the layout is cached.
+
+        A laid out graph declares its bounding box before the clusters, which would be inherited by empty clusters
+        and draw them around the whole graph.
+        """
+        return self._layout is None or cluster in self._drawn_clusters
+
+    def _node_layout(self, name: str) -> dict[str, str]:
+        return self._layout.node_attributes(name) if self._layout is not None else {}
+
+    def _cluster_layout(self, name: str) -> dict[str, str]:
+        return self._layout.cluster_attributes(name) if self._layout is not None else {}
+
+    def _init_graph(self, num_nodes: int = 0):
+        # Create empty graph, large graphs use a faster engine and a lower resolution unless set explicitly
+        is_large = num_nodes > LARGE_GRAPH_NODES
+        engine = self.engine or (LARGE_GRAPH_ENGINE if is_large else DEFAULT_ENGINE)
+        self.graph = graphviz.Digraph(engine=engine)
+        self.graph.attr(dpi=self.dpi or (LARGE_GRAPH_DPI if is_large else DEFAULT_DPI))
+        if engine == LARGE_GRAPH_ENGINE:
+            self.graph.attr(overlap='prism', splines='false', outputorder='edgesfirst')
+        logging.debug(f"Graph with {num_nodes} nodes uses the {engine} engine.")
         self._set_format()
 
 
@@ -99,3 +369,8 @@ class CallGraph:
             labelloc='t'
         )
         logging.debug(f"Added title to graph")
+
+
+def _called_classes(graph: CompactGraph) -> set[int]:
+    """The classes that are called, i.e. instantiated, which is only resolved to the class without `__init__`."""
+    return {target for target in graph.targets if graph.kinds[target] == CLASS}
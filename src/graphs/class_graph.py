@@ -0,0 +1,137 @@
+import logging
+import math
+from collections.abc import Iterable
+
+from src.graphs.call_graph import CallGraph
+from src.parser import Class, Module, is_private_name
+from src.parser.inheritance import InheritanceIndex
+from src.parser.symbol_index import SymbolIndex
+from src.stats import RunStats, phase
+
+
+class ClassGraph(CallGraph):
+    """
+    Class diagram of the parsed modules, drawn from the `InheritanceIndex` of the parse.
+
+    Every class is a box with its methods, grouped by module like the call graph. Solid edges with a hollow arrow
+    point to the base classes, and dashed edges to the classes whose methods are called by the methods of a class,
+    drawn thicker for more calls.
+    """
+    def __init__(
+            self,
+            output_path: str = 'class_graph.png',
+            title: str = None,
+            exclude_private: bool = False,
+            exclude_external: bool = False,
+            inherited: bool = False,
+            engine: str = None,
+            dpi: str = None,
+            stats: RunStats = None
+    ):
+        """Initialize the class diagram.
+
+        Args:
+            output_path: The path where the graph should be stored
+            title: Title of the graph, defaults to the name of the output file
+            exclude_private: Leave out private classes and methods
+            exclude_external: Leave out base classes that are not defined in the parsed folder
+            inherited: Also list the inherited methods of a class, with the class that defines them
+            engine: Graphviz layout engine, by default 'dot' or 'sfdp' for large graphs
+            dpi: Resolution of the output, by default 300 or 96 for large graphs
+            stats: Optional `RunStats` that collects the time of building and rendering the graph
+        """
+        super().__init__(output_path=output_path, title=title, exclude_private=exclude_private,
+                         exclude_external=exclude_external, engine=engine, dpi=dpi, stats=stats)
+        self.inherited = inherited
+
+    def build_graph(self, modules: dict[str, Module] | Iterable[tuple[str, Module]], index: SymbolIndex = None,
+                    root_package: str = None):
+        """
+        Build the class diagram from the parsed modules, which are iterated once.
+
+        Args:
+            modules: The parsed modules with resolved calls, or an iterable of (module file name, module), e.g. a
+                `ParsedStream`
+            index: The index of all modules, built from `modules` if it is not given
+            root_package: Name of the parsed folder if it is a package itself, used when the index is built
+        """
+        if index is None:
+            with phase(self.stats, 'index'):
+                index = SymbolIndex(modules, root_package=root_package)
+        if isinstance(modules, dict):
+            modules = modules.items()
+        inheritance = index.inheritance
+
+        with phase(self.stats, 'build_graph'):
+            classes: dict[str, list[str]] = {}  # {module: [qualified class names]}
+            calls: dict[str, dict[str, int]] = {}  # {class: {called class: number of calls}}
+            for module_file, module in modules:
+                module_name = module_file.removesuffix('.py')
+                class_names = classes[module_name] = [
+                    f'{module_name}.{definition.name}' for definition in module.definitions.values()
+                    if isinstance(definition, Class)
+                    and not (self.exclude_private and is_private_name(definition.name))
+                ]
+                if class_names:
+                    calls.update(inheritance.class_calls(module_name, module))
+            drawn = {class_name for class_names in classes.values() for class_name in class_names}
+            self._init_graph(num_nodes=len(drawn))
+            self.graph.attr(rankdir='BT')
+
+            for module_name, class_names in classes.items():
+                if not class_names:
+                    continue
+                with self.graph.subgraph(name=f'cluster_{module_name}') as subgraph:
+                    subgraph.attr(label=module_name, style='dotted', color='black')
+                    for class_name in class_names:
+                        self._add_class_node(subgraph, class_name, inheritance)
+
+            external_bases = set()
+            num_edges = 0
+            for class_name in sorted(drawn):
+                for base in inheritance.bases(class_name):
+                    if base == class_name:
+                        # A class that inherits from the name it shadows, e.g. `class Config(Config)`
+                        continue
+                    if base not in drawn:
+                        if self.exclude_external or inheritance.is_class(base):
+                            # A private base class is left out together with its inheritance edges
+                            continue
+                        if base not in external_bases:
+                            external_bases.add(base)
+                            self.graph.node(base, label=base, shape='box', style='dashed')
+                    self.graph.edge(class_name, base, arrowhead='empty')
+                    num_edges += 1
+                for callee, weight in calls.get(class_name, {}).items():
+                    if callee in drawn and callee != class_name and callee not in inheritance.bases(class_name):
+                        self._add_uses(class_name, callee, weight)
+                        num_edges += 1
+            self._add_title()
+
+        logging.debug(f'Class diagram with {len(drawn)} classes and {len(external_bases)} external base classes')
+        if self.stats is not None:
+            self.stats.count('nodes', len(drawn) + len(external_bases))
+            self.stats.count('edges', num_edges)
+
+    def _add_class_node(self, graph, class_name: str, inheritance: InheritanceIndex):
+        """Add a class as a record with its name and its methods."""
+        definition = inheritance.index.definitions[class_name]
+        methods = [
+            f'{name}()' for name in definition.methods if not (self.exclude_private and is_private_name(name))
+        ]
+        if self.inherited:
+            methods += [
+                f'{name}() ({full_name.rpartition(".")[0].rpartition(".")[2]})'
+                for name, full_name in inheritance.methods(class_name).items()
+                if name not in definition.methods and not (self.exclude_private and is_private_name(name))
+            ]
+        label = '{' + definition.name + '|' + ''.join(f'{method}\\l' for method in methods) + '}'
+        graph.node(class_name, label=label, shape='record', style='filled', fillcolor='#f2f2f2')
+
+    def _add_uses(self, class_name: str, callee: str, weight: int):
+        """Add a dashed edge for the calls from the methods of a class to those of another class."""
+        if weight > 1:
+            self.graph.edge(class_name, callee, style='dashed', arrowhead='vee', weight=str(weight),
+                            penwidth=f'{1 + math.log2(weight):.2f}', tooltip=f'{weight} calls')
+        else:
+            self.graph.edge(class_name, callee, style='dashed', arrowhead='vee')
@@ -0,0 +1,335 @@
+import logging
+import sys
+from array import array
+from collections.abc import Iterable
+
+from src.parser import Class, Definition, Module, is_private_name
+
+# Node kinds, stored per node as an index into this tuple
+NODE_KINDS: tuple[str, ...] = ('function', 'method', 'class', 'external', 'module', 'package')
+FUNCTION, METHOD, CLASS, EXTERNAL, MODULE, PACKAGE = range(len(NODE_KINDS))
+
+# Levels of detail of a graph, see `CompactGraph.collapse`
+LEVELS: tuple[str, ...] = ('function', 'module', 'package')
+ROOT_PACKAGE = '<root>'
+
+NO_ID = -1
+
+
+def is_private_node(label: str, parent_private: bool = False) -> bool:
+    """Whether a node is private, by its short name or, for a method, by the privacy of its class."""
+    return parent_private or is_private_name(label)
+
+
+def is_excluded(private: bool, external: bool, exclude_private: bool, exclude_external: bool) -> bool:
+    """Whether a node is left out of a graph that excludes private and/or external nodes."""
+    return (exclude_private and private) or (exclude_external and external)
+
+
+class CompactGraph:
+    """
+    Memory efficient representation of the call graph of parsed modules.
+
+    Every definition, and every external function that is called, is a node with an integer id. Names are
+    interned and the attributes of the nodes are stored in flat arrays indexed by node id. The calls are
+    stored as a compressed sparse row (CSR) adjacency: the callees of node `i` are
+    `targets[offsets[i]:offsets[i + 1]]`, with the number of calls of each edge in `weights`.
+
+    Nodes are added module by module, and the methods of a class directly follow the class, so the nodes
+    of a module form the contiguous range `module_offsets[m]:module_offsets[m + 1]`. External nodes come
+    after the nodes of all modules.
+
+    The graph always holds the complete parse result. Private nodes (including the methods of private classes)
+    and external nodes are marked, and `filter` projects the graph onto the nodes that should be shown.
+    """
+    def __init__(self):
+        self.names: list[str] = []  # {node_id: qualified name}
+        self.labels: list[str] = []  # {node_id: short name}
+        self.ids: dict[str, int] = {}  # {qualified name: node_id}
+        self.kinds = array('b')
+        self.module_ids = array('i')  # NO_ID for external nodes
+        self.parents = array('i')  # node id of the class of a method, NO_ID otherwise
+        self.private = bytearray()  # 1 for private nodes
+        self.start_lines = array('i')  # NO_ID if unknown
+        self.end_lines = array('i')
+        self.module_names: list[str] = []
+        self.module_offsets = array('i', [0])
+        self.offsets = array('i', [0])
+        self.targets = array('i')
+        self.weights = array('i')
+
+    @classmethod
+    def from_modules(cls, modules: dict[str, Module]) -> 'CompactGraph':
+        """Build the graph from the parsed modules."""
+        return cls.from_stream(modules, modules.values())
+
+    @classmethod
+    def from_stream(cls, summaries: dict[str, Module], modules: Iterable[Module]) -> 'CompactGraph':
+        """
+        Build the graph from the definitions of all modules, and the calls of modules that are streamed one by one.
+
+        Args:
+            summaries: The modules keyed by module name, only their definitions are used
+            modules: The modules with resolved calls, e.g. read back one at a time after they were spilled to disk
+        """
+        graph = cls()
+        for module_name, module in summaries.items():
+            module_id = len(graph.module_names)
+            graph.module_names.append(sys.intern(module_name))
+            for full_name, definition in module.definitions.items():
+                if isinstance(definition, Class):
+                    class_name = f'{definition.module}.{definition.name}'
+                    class_id = graph._add_node(class_name, definition.name, CLASS, module_id, definition=definition)
+                    for method in definition.methods.values():
+                        graph._add_node(
+                            f'{class_name}.{method.name}', method.name, METHOD, module_id, parent=class_id,
+                            definition=method
+                        )
+                else:
+                    kind = METHOD if definition.type == 'method' else FUNCTION
+                    graph._add_node(full_name, definition.name, kind, module_id, definition=definition)
+            graph.module_offsets.append(len(graph.names))
+
+        # Collect the calls as edge lists weighted by the number of call sites, adding the external functions as nodes
+        sources = array('i')
+        targets = array('i')
+        weights = array('i')
+        for module in modules:
+            for caller, callees in module.calls.items():
+                source = graph.ids.get(caller)
+                if source is None:
+                    continue
+                for callee, lines in callees.items():
+                    target = graph.ids.get(callee)
+                    if target is None:
+                        target = graph._add_node(callee, callee, EXTERNAL, NO_ID)
+                    sources.append(source)
+                    targets.append(target)
+                    weights.append(len(lines))
+        graph._set_edges(sources, targets, weights)
+        logging.debug(f'Built compact graph with {graph.num_nodes} nodes and {graph.num_edges} edges')
+        return graph
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.names)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.targets)
+
+    def node_id(self, name: str) -> int:
+        """The id of the node with the given qualified name, NO_ID if there is no such node."""
+        return self.ids.get(name, NO_ID)
+
+    def kind(self, node_id: int) -> str:
+        return NODE_KINDS[self.kinds[node_id]]
+
+    def successors(self, node_id: int) -> array:
+        """The ids of the nodes called by `node_id`."""
+        return self.targets[self.offsets[node_id]:self.offsets[node_id + 1]]
+
+    def successor_weights(self, node_id: int) -> array:
+        """The number of calls from `node_id` to each of its successors."""
+        return self.weights[self.offsets[node_id]:self.offsets[node_id + 1]]
+
+    def out_degree(self, node_id: int) -> int:
+        return self.offsets[node_id + 1] - self.offsets[node_id]
+
+    def module_nodes(self, module_id: int) -> range:
+        """The ids of the nodes defined in a module."""
+        return range(self.module_offsets[module_id], self.module_offsets[module_id + 1])
+
+    def edges(self):
+        """Iterate over all (caller, callee) pairs of node ids."""
+        offsets, targets = self.offsets, self.targets
+        for source in range(self.num_nodes):
+            for i in range(offsets[source], offsets[source + 1]):
+                yield source, targets[i]
+
+    def filter(self, exclude_private: bool = False, exclude_external: bool = False) -> 'CompactGraph':
+        """
+        Project the graph onto its public and/or internal nodes, the original graph is not modified.
+
+        Args:
+            exclude_private: Leave out private functions, methods and classes, and the calls from and to them
+            exclude_external: Leave out external functions and the calls to them
+        """
+        if not exclude_private and not exclude_external:
+            return self
+        keep = bytearray(b'\x01') * self.num_nodes
+        for node_id in range(self.num_nodes):
+            if is_excluded(self.private[node_id], self.kinds[node_id] == EXTERNAL, exclude_private, exclude_external):
+                keep[node_id] = 0
+        return self.subgraph(keep)
+
+    def select_package(self, package: str) -> 'CompactGraph':
+        """
+        Project the graph onto the modules of a package, e.g. `package1` keeps `package1.baz.py`.
+
+        External functions are kept if they are called from the package.
+        """
+        keep = bytearray(self.num_nodes)
+        for module_id, module_name in enumerate(self.module_names):
+            module_name = module_name.removesuffix('.py')
+            if module_name == package or module_name.startswith(f'{package}.'):
+                for node_id in self.module_nodes(module_id):
+                    keep[node_id] = 1
+        for source, target in self.edges():
+            if keep[source] and self.kinds[target] == EXTERNAL:
+                keep[target] = 1
+        return self.subgraph(keep)
+
+    def subgraph(self, keep: bytearray) -> 'CompactGraph':
+        """
+        Build the subgraph induced by the nodes for which `keep` is set, in linear time.
+
+        Module and class ordering is preserved, methods are only kept if their class is kept.
+        """
+        graph = CompactGraph()
+        new_ids = array('i', [NO_ID]) * self.num_nodes
+        for module_id, module_name in enumerate(self.module_names):
+            graph.module_names.append(module_name)
+            for node_id in self.module_nodes(module_id):
+                parent = self.parents[node_id]
+                new_parent = new_ids[parent] if parent != NO_ID else NO_ID
+                if keep[node_id] and (parent == NO_ID or new_parent != NO_ID):
+                    new_ids[node_id] = graph._copy_node(self, node_id, module_id, new_parent=new_parent)
+            graph.module_offsets.append(graph.num_nodes)
+        for node_id in range(self.module_offsets[-1], self.num_nodes):
+            if keep[node_id]:
+                new_ids[node_id] = graph._copy_node(self, node_id, NO_ID, new_parent=NO_ID)
+
+        sources = array('i')
+        targets = array('i')
+        weights = array('i')
+        for source in range(self.num_nodes):
+            if new_ids[source] == NO_ID:
+                continue
+            for i in range(self.offsets[source], self.offsets[source + 1]):
+                target = self.targets[i]
+                if new_ids[target] != NO_ID:
+                    sources.append(new_ids[source])
+                    targets.append(new_ids[target])
+                    weights.append(self.weights[i])
+        graph._set_edges(sources, targets, weights)
+        return graph
+
+    def collapse(self, level: str) -> 'CompactGraph':
+        """
+        Collapse the functions into one node per module or per package, with aggregated edge weights.
+
+        In the collapsed graph, the "modules" are the groups in which the nodes are clustered: module nodes are
+        grouped by package, package nodes by their parent package. External functions are collapsed into their
+        top-level package, calls within a single module or package are left out.
+
+        Args:
+            level: 'function' (no collapse), 'module' or 'package'
+        """
+        if level not in LEVELS:
+            raise ValueError(f"Unknown level '{level}', choose from {LEVELS}")
+        if level == 'function':
+            return self
+
+        # Map the modules to their (sorted) groups
+        node_kind = MODULE if level == 'module' else PACKAGE
+        group_of_module = []
+        for module_name in self.module_names:
+            module_name = module_name.removesuffix('.py')
+            package = module_name.rpartition('.')[0] or ROOT_PACKAGE
+            group_of_module.append(module_name if level == 'module' else package)
+        group_names = sorted(set(group_of_module))
+
+        graph = CompactGraph()
+        clusters = {}
+        for group_name in group_names:
+            parent = group_name.rpartition('.')[0] if group_name != ROOT_PACKAGE else ''
+            clusters.setdefault(parent or ROOT_PACKAGE, []).append(group_name)
+        for cluster_id, (cluster_name, members) in enumerate(sorted(clusters.items())):
+            graph.module_names.append(cluster_name)
+            for group_name in members:
+                graph._add_node(group_name, group_name.rpartition('.')[2], node_kind, cluster_id)
+            graph.module_offsets.append(graph.num_nodes)
+
+        new_ids = array('i', [NO_ID]) * self.num_nodes
+        for module_id, group_name in enumerate(group_of_module):
+            group_id = graph.ids[group_name]
+            for node_id in self.module_nodes(module_id):
+                new_ids[node_id] = group_id
+        for node_id in range(self.module_offsets[-1], self.num_nodes):
+            package = self.names[node_id].partition('.')[0]
+            external_name = f'{package} (external)'
+            group_id = graph.ids.get(external_name)
+            if group_id is None:
+                group_id = graph._add_node(external_name, package, EXTERNAL, NO_ID)
+            new_ids[node_id] = group_id
+
+        # Aggregate the weights of the edges between groups
+        aggregated = {}
+        for source in range(self.num_nodes):
+            for i in range(self.offsets[source], self.offsets[source + 1]):
+                edge = (new_ids[source], new_ids[self.targets[i]])
+                if edge[0] != edge[1]:
+                    aggregated[edge] = aggregated.get(edge, 0) + self.weights[i]
+        graph._set_edges(
+            array('i', (source for source, _ in aggregated)),
+            array('i', (target for _, target in aggregated)),
+            array('i', aggregated.values())
+        )
+        logging.debug(f'Collapsed graph to {graph.num_nodes} {level} nodes and {graph.num_edges} edges')
+        return graph
+
+    def _copy_node(self, other: 'CompactGraph', node_id: int, module_id: int, new_parent: int) -> int:
+        new_id = len(self.names)
+        name = other.names[node_id]
+        self.names.append(name)
+        self.labels.append(other.labels[node_id])
+        self.ids[name] = new_id
+        self.kinds.append(other.kinds[node_id])
+        self.module_ids.append(module_id)
+        self.parents.append(new_parent)
+        self.private.append(other.private[node_id])
+        self.start_lines.append(other.start_lines[node_id])
+        self.end_lines.append(other.end_lines[node_id])
+        return new_id
+
+    def _add_node(
+            self, name: str, label: str, kind: int, module_id: int, parent: int = NO_ID,
+            definition: Definition | Class = None
+    ) -> int:
+        node_id = len(self.names)
+        name = sys.intern(name)
+        self.names.append(name)
+        self.labels.append(sys.intern(label))
+        self.ids[name] = node_id
+        self.kinds.append(kind)
+        self.module_ids.append(module_id)
+        self.parents.append(parent)
+        self.private.append(is_private_node(label, parent_private=parent != NO_ID and bool(self.private[parent])))
+        start_line = definition.start_line if definition is not None else None
+        end_line = definition.end_line if definition is not None else None
+        self.start_lines.append(NO_ID if start_line is None else start_line)
+        self.end_lines.append(NO_ID if end_line is None else end_line)
+        return node_id
+
+    def _set_edges(self, sources: array, targets: array, weights: array = None):
+        """Store the edges in CSR format using a stable counting sort on the source node, weights default to 1."""
+        if weights is None:
+            weights = array('i', [1]) * len(targets)
+        num_nodes = self.num_nodes
+        offsets = array('i', bytes(array('i').itemsize * (num_nodes + 1)))
+        for source in sources:
+            offsets[source + 1] += 1
+        for i in range(num_nodes):
+            offsets[i + 1] += offsets[i]
+
+        positions = array('i', offsets[:-1])
+        sorted_targets = array('i', bytes(array('i').itemsize * len(targets)))
+        sorted_weights = array('i', bytes(array('i').itemsize * len(targets)))
+        for source, target, weight in zip(sources, targets, weights):
+            sorted_targets[positions[source]] = target
+            sorted_weights[positions[source]] = weight
+            positions[source] += 1
+        self.offsets = offsets
+        self.targets = sorted_targets
+        self.weights = sorted_weights
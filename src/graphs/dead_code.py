@@ -0,0 +1,150 @@
+import fnmatch
+import logging
+from array import array
+from dataclasses import asdict, dataclass, field
+
+from src.graphs.compact_graph import CLASS, EXTERNAL, METHOD, NO_ID, NODE_KINDS, CompactGraph
+
+# Functions with these names are always entry points, e.g. the `main` of a CLI
+DEFAULT_ENTRY_POINTS: tuple[str, ...] = ('main',)
+# All definitions in modules whose file name matches one of these patterns are entry points
+ENTRY_POINT_MODULES: tuple[str, ...] = ('__main__.py', 'test_*.py', '*_test.py', 'conftest.py')
+# All definitions in modules inside packages with these names are entry points
+TEST_PACKAGES: tuple[str, ...] = ('test', 'tests')
+
+
+@dataclass(slots=True)
+class DeadDefinition:
+    """A definition that cannot be reached from any entry point."""
+    module: str
+    name: str  # Qualified name
+    kind: str  # 'function', 'method' or 'class'
+    start_line: int = None
+    end_line: int = None
+    private: bool = False
+
+
+@dataclass
+class DeadCodeReport:
+    """The definitions of a call graph that none of the entry points reaches."""
+    entry_points: list[str] = field(default_factory=list)
+    num_definitions: int = 0
+    num_reachable: int = 0
+    unreachable: list[DeadDefinition] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.unreachable)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def summary(self) -> str:
+        return (f'{len(self.unreachable)} of {self.num_definitions} definitions are unreachable from '
+                f'{len(self.entry_points)} entry points')
+
+
+def is_entry_point_module(module_name: str) -> bool:
+    """Whether a module, e.g. `pkg.tests.test_mod.py`, holds entry points: a `__main__` module or tests."""
+    parts = module_name[:-len('.py')].split('.') if module_name.endswith('.py') else module_name.split('.')
+    file_name = parts[-1] + '.py'
+    return (any(fnmatch.fnmatchcase(file_name, pattern) for pattern in ENTRY_POINT_MODULES)
+            or any(part in TEST_PACKAGES for part in parts[:-1]))
+
+
+def entry_points(graph: CompactGraph, roots: list[str] = None) -> list[int]:
+    """
+    The ids of the entry points of a graph.
+
+    These are the functions named like `DEFAULT_ENTRY_POINTS`, all definitions in `__main__` and test modules (see
+    `is_entry_point_module`), and the definitions that match one of the `roots`, by qualified name or by a glob
+    pattern such as `pkg.api.*`.
+    """
+    roots = roots or []
+    patterns = [root for root in roots if any(c in root for c in '*?[')]
+    names = set(roots) - set(patterns)
+    entry_modules = {
+        module_id for module_id, module_name in enumerate(graph.module_names) if is_entry_point_module(module_name)
+    }
+    ids = []
+    for node_id in range(graph.num_nodes):
+        kind = graph.kinds[node_id]
+        if kind == EXTERNAL:
+            continue
+        name = graph.names[node_id]
+        if ((kind != CLASS and graph.labels[node_id] in DEFAULT_ENTRY_POINTS)
+                or graph.module_ids[node_id] in entry_modules
+                or name in names
+                or any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)):
+            ids.append(node_id)
+    return ids
+
+
+def find_dead_code(
+        graph: CompactGraph,
+        roots: list[str] = None,
+        match_attribute_calls: bool = True
+) -> DeadCodeReport:
+    """
+    Find the definitions that cannot be reached from the entry points of a graph, see `entry_points`.
+
+    Reachability is a single depth-first pass over the CSR adjacency, with the reached nodes in a bytearray. A
+    method keeps its class alive, and a reached class, e.g. one that is instantiated, reaches its constructor and all
+    its methods, since the methods of an instance are usually called through a variable of unknown type. Calls that
+    could not be resolved, e.g. `graph.render()` on a local variable of unknown type, reach every method with that
+    name when `match_attribute_calls` is set. Other dynamic calls do not reach anything, so the report should be
+    reviewed rather than trusted blindly.
+
+    Args:
+        graph: The complete graph, the entry points and the paths to a definition may be private functions
+        roots: Extra entry points, by qualified name or glob pattern
+        match_attribute_calls: Let an unresolved call `x.name()` reach all methods called `name`
+    """
+    sources = entry_points(graph, roots)
+    num_nodes = graph.num_nodes
+    offsets, targets, parents, kinds, labels = graph.offsets, graph.targets, graph.parents, graph.kinds, graph.labels
+    methods_by_name = {}
+    if match_attribute_calls:
+        for node_id in range(num_nodes):
+            if kinds[node_id] == METHOD:
+                methods_by_name.setdefault(labels[node_id], []).append(node_id)
+    reached = bytearray(num_nodes)
+    stack = array('i', sources)
+    for node_id in sources:
+        reached[node_id] = 1
+    while stack:
+        node_id = stack.pop()
+        implicit = []
+        if kinds[node_id] == METHOD and parents[node_id] != NO_ID:
+            implicit.append(parents[node_id])
+        elif kinds[node_id] == CLASS:
+            # The methods of a class directly follow the class node
+            method_id = node_id + 1
+            while method_id < num_nodes and parents[method_id] == node_id:
+                implicit.append(method_id)
+                method_id += 1
+        elif kinds[node_id] == EXTERNAL and methods_by_name and '.' in graph.names[node_id]:
+            # Every method name is matched once, by the first unresolved call that uses it
+            implicit = methods_by_name.pop(graph.names[node_id].rpartition('.')[2], [])
+        for target in (*targets[offsets[node_id]:offsets[node_id + 1]], *implicit):
+            if not reached[target]:
+                reached[target] = 1
+                stack.append(target)
+
+    report = DeadCodeReport(entry_points=[graph.names[node_id] for node_id in sources])
+    for node_id in range(num_nodes):
+        if kinds[node_id] == EXTERNAL:
+            continue
+        report.num_definitions += 1
+        if reached[node_id]:
+            report.num_reachable += 1
+            continue
+        report.unreachable.append(DeadDefinition(
+            module=graph.module_names[graph.module_ids[node_id]],
+            name=graph.names[node_id],
+            kind=NODE_KINDS[kinds[node_id]],
+            start_line=None if graph.start_lines[node_id] == NO_ID else graph.start_lines[node_id],
+            end_line=None if graph.end_lines[node_id] == NO_ID else graph.end_lines[node_id],
+            private=bool(graph.private[node_id]),
+        ))
+    logging.info(report.summary())
+    return report
@@ -0,0 +1,280 @@
+import json
+import logging
+import math
+import os
+import sys
+from abc import ABC, abstractmethod
+from typing import Iterable
+from xml.sax.saxutils import escape, quoteattr
+
+from src.graphs.compact_graph import is_excluded, is_private_node
+from src.parser import Class, Module
+
+
+class GraphExporter(ABC):
+    """
+    Base class of exporters that stream the call graph of parsed modules to a file or stdout.
+
+    The exporters do not build a graph in memory: the nodes and edges of every module are written, and flushed,
+    as soon as the module is processed, so downstream tools can start reading before the export has finished.
+    External functions are written the first time they are called.
+    """
+    extensions: tuple[str, ...] = ()
+
+    def __init__(self, output_path: str = '-', exclude_private: bool = False, exclude_external: bool = False):
+        """ Initializes the exporter
+
+        Args:
+            output_path: The path of the output file, '-' writes to stdout
+            exclude_private: Leave out private functions and the calls from and to them
+            exclude_external: Leave out calls to external functions
+        """
+        self.output_path = output_path
+        self.exclude_private = exclude_private
+        self.exclude_external = exclude_external
+
+    def export(self, modules: dict[str, Module] | Iterable[tuple[str, Module]], internal: dict[str, bool] = None):
+        """
+        Write the call graph of the modules.
+
+        Args:
+            modules: The parsed modules, or an iterable of (module name, module) pairs
+            internal: {qualified name: is_private} of all definitions, required to recognize external calls when
+                `modules` is an iterable that can only be consumed once
+        """
+        if internal is None:
+            if not isinstance(modules, dict):
+                raise ValueError('The internal definitions are required when exporting an iterable of modules')
+            internal = internal_definitions(modules.values())
+        items = modules.items() if isinstance(modules, dict) else modules
+
+        stream = sys.stdout if self.output_path == '-' else open(self.output_path, 'w', encoding='utf-8')
+        try:
+            self.out = stream
+            self.written_externals = set()
+            self.write_header()
+            n_modules = 0
+            for module_name, module in items:
+                self._export_module(module_name, module, internal)
+                stream.flush()
+                n_modules += 1
+            self.write_footer()
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        logging.info(f'Exported {n_modules} modules to {self.output_path}')
+
+    def _export_module(self, module_name: str, module: Module, internal: dict[str, bool]):
+        # Collect the visible calls first, so leaf functions can be recognized
+        calls = {}
+        for caller, callees in module.calls.items():
+            if caller not in internal or self._is_excluded(internal[caller]):
+                continue
+            visible = {}
+            for callee, lines in callees.items():
+                is_external = callee not in internal
+                is_private = internal[callee] if not is_external else is_private_node(callee)
+                if self._is_excluded(is_private, is_external):
+                    continue
+                visible[callee] = lines
+            if visible:
+                calls[caller] = visible
+
+        nodes = []
+        for full_name, definition in module.definitions.items():
+            if isinstance(definition, Class):
+                class_name = f'{definition.module}.{definition.name}'
+                if self._is_excluded(internal.get(class_name, False)):
+                    continue
+                methods = [(f'{class_name}.{method.name}', method) for method in definition.methods.values()]
+                methods = [(name, method) for name, method in methods if not self._is_excluded(internal[name])]
+                nodes.append((class_name, definition, methods))
+            elif not self._is_excluded(internal[full_name]):
+                nodes.append((full_name, definition, None))
+        self.write_module(module_name, nodes, calls)
+
+        for caller, callees in calls.items():
+            for callee, lines in callees.items():
+                if callee not in internal and callee not in self.written_externals:
+                    self.written_externals.add(callee)
+                    self.write_external(callee)
+                self.write_edge(caller, callee, lines)
+
+    def _is_excluded(self, private: bool, external: bool = False) -> bool:
+        return is_excluded(private, external, self.exclude_private, self.exclude_external)
+
+    def write_header(self):
+        pass
+
+    @abstractmethod
+    def write_module(self, module_name: str, nodes: list, calls: dict[str, dict[str, list[int]]]):
+        """Write a module and its definitions, `nodes` holds (name, definition, methods or None for functions)."""
+
+    @abstractmethod
+    def write_external(self, name: str):
+        """Write an external function, the first time it is called."""
+
+    @abstractmethod
+    def write_edge(self, caller: str, callee: str, lines: list[int]):
+        """Write the calls from a caller to a callee, with the lines of the call sites."""
+
+    def write_footer(self):
+        pass
+
+
+class DotExporter(GraphExporter):
+    """Streams the call graph as Graphviz DOT source, in the same layout as `CallGraph`."""
+    extensions = ('.dot', '.gv')
+
+    def write_header(self):
+        self.out.write('digraph {\n\tdpi=300\n')
+
+    def write_module(self, module_name, nodes, calls):
+        self.out.write(f'\tsubgraph {_dot_id("cluster_" + module_name)} {{\n')
+        self.out.write(f'\t\tcolor=black label={_dot_id(module_name)} style=dotted\n')
+        for name, definition, methods in nodes:
+            if methods is None:
+                color = 'lightblue' if name in calls else 'green'
+                self._write_function(name, definition.name, color, indent='\t\t')
+                continue
+            module = name.rpartition('.')[0]
+            self.out.write(f'\t\tsubgraph {_dot_id(f"cluster_{module}_{definition.name}")} {{\n')
+            self.out.write(f'\t\t\tbgcolor="#f2f2f2" color=black label={_dot_id("Class: " + definition.name)} '
+                           f'penwidth=0.7 style=solid\n')
+            if '__init__' not in definition.methods:
+                # Calls that instantiate the class refer to the class itself, whose callers are not known yet
+                self._write_function(name, definition.name, 'lightblue', indent='\t\t\t')
+            for method_name, method in methods:
+                self._write_function(method_name, method.name, 'lightblue', indent='\t\t\t')
+            self.out.write('\t\t}\n')
+        self.out.write('\t}\n')
+
+    def write_external(self, name):
+        self.out.write(f'\t{_dot_id(name)}\n')
+
+    def write_edge(self, caller, callee, lines):
+        weight = len(lines)
+        attributes = ''
+        if weight > 1:
+            attributes = f' [penwidth={1 + math.log2(weight):.2f} tooltip="{weight} calls" weight={weight}]'
+        self.out.write(f'\t{_dot_id(caller)} -> {_dot_id(callee)}{attributes}\n')
+
+    def write_footer(self):
+        self.out.write('}\n')
+
+    def _write_function(self, name: str, label: str, color: str, indent: str):
+        self.out.write(f'{indent}{_dot_id(name)} [label={_dot_id(label)} fillcolor={color} style=filled]\n')
+
+
+class JsonLinesExporter(GraphExporter):
+    """Streams the call graph as JSON Lines, one module, node or edge object per line."""
+    extensions = ('.jsonl', '.ndjson')
+
+    def write_module(self, module_name, nodes, calls):
+        self._write(type='module', name=module_name)
+        for name, definition, methods in nodes:
+            if methods is None:
+                self._write_definition(name, definition, kind='function', module=module_name)
+                continue
+            self._write(type='node', id=name, label=definition.name, kind='class', module=module_name)
+            for method_name, method in methods:
+                self._write_definition(method_name, method, kind='method', module=module_name, parent=name)
+
+    def write_external(self, name):
+        self._write(type='node', id=name, label=name, kind='external')
+
+    def write_edge(self, caller, callee, lines):
+        self._write(type='edge', source=caller, target=callee, weight=len(lines), lines=lines)
+
+    def _write_definition(self, name, definition, kind: str, module: str, parent: str = None):
+        self._write(type='node', id=name, label=definition.name, kind=kind, module=module, parent=parent,
+                    start_line=definition.start_line, end_line=definition.end_line)
+
+    def _write(self, **record):
+        self.out.write(json.dumps({k: v for k, v in record.items() if v is not None}) + '\n')
+
+
+class GraphMLExporter(GraphExporter):
+    """Streams the call graph as GraphML."""
+    extensions = ('.graphml',)
+    node_keys = (('label', 'string'), ('kind', 'string'), ('module', 'string'), ('parent', 'string'),
+                 ('start_line', 'int'), ('end_line', 'int'))
+    edge_keys = (('weight', 'int'), ('lines', 'string'))
+
+    def write_header(self):
+        self.out.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                       '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        for name, key_type in self.node_keys:
+            self.out.write(f'  <key id="{name}" for="node" attr.name="{name}" attr.type="{key_type}"/>\n')
+        for name, key_type in self.edge_keys:
+            self.out.write(f'  <key id="{name}" for="edge" attr.name="{name}" attr.type="{key_type}"/>\n')
+        self.out.write('  <graph id="calls" edgedefault="directed">\n')
+
+    def write_module(self, module_name, nodes, calls):
+        for name, definition, methods in nodes:
+            if methods is None:
+                self._write_node(name, label=definition.name, kind='function', module=module_name,
+                                 start_line=definition.start_line, end_line=definition.end_line)
+                continue
+            self._write_node(name, label=definition.name, kind='class', module=module_name)
+            for method_name, method in methods:
+                self._write_node(method_name, label=method.name, kind='method', module=module_name, parent=name,
+                                 start_line=method.start_line, end_line=method.end_line)
+
+    def write_external(self, name):
+        self._write_node(name, label=name, kind='external')
+
+    def write_edge(self, caller, callee, lines):
+        self.out.write(f'    <edge source={quoteattr(caller)} target={quoteattr(callee)}>'
+                       f'<data key="weight">{len(lines)}</data>'
+                       f'<data key="lines">{" ".join(map(str, lines))}</data></edge>\n')
+
+    def write_footer(self):
+        self.out.write('  </graph>\n</graphml>\n')
+
+    def _write_node(self, name: str, **data):
+        values = ''.join(f'<data key="{key}">{escape(str(value))}</data>'
+                         for key, value in data.items() if value is not None)
+        self.out.write(f'    <node id={quoteattr(name)}>{values}</node>\n')
+
+
+EXPORTERS: tuple[type[GraphExporter], ...] = (DotExporter, JsonLinesExporter, GraphMLExporter)
+EXPORT_FORMATS: dict[str, type[GraphExporter]] = {'dot': DotExporter, 'jsonl': JsonLinesExporter,
+                                                  'graphml': GraphMLExporter}
+
+
+def get_exporter(output_path: str, export_format: str = None) -> type[GraphExporter] | None:
+    """The exporter for a format or output file extension, None if the output should be rendered instead."""
+    if export_format is not None:
+        return EXPORT_FORMATS[export_format]
+    extension = os.path.splitext(output_path)[1].lower()
+    for exporter in EXPORTERS:
+        if extension in exporter.extensions:
+            return exporter
+    return None
+
+
+def internal_definitions(modules: Iterable[Module]) -> dict[str, bool]:
+    """
+    The qualified names of all functions and methods in the modules, mapped on whether they are private.
+
+    A definition is private by the same rule as a node of a `CompactGraph`, see `is_private_node`. The classes
+    themselves are included, to filter private classes.
+    """
+    internal = {}
+    for module in modules:
+        for full_name, definition in module.definitions.items():
+            if isinstance(definition, Class):
+                class_name = f'{definition.module}.{definition.name}'
+                class_is_private = is_private_node(definition.name)
+                internal[class_name] = class_is_private
+                for method in definition.methods.values():
+                    internal[f'{class_name}.{method.name}'] = is_private_node(method.name, class_is_private)
+            else:
+                internal[full_name] = is_private_node(definition.name)
+    return internal
+
+
+def _dot_id(name: str) -> str:
+    """Quote a DOT identifier."""
+    return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
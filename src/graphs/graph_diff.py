@@ -0,0 +1,52 @@
+from dataclasses import asdict, dataclass, field
+
+from src.graphs.compact_graph import EXTERNAL, CompactGraph
+
+
+@dataclass
+class GraphDiff:
+    """The definitions and calls that were added and removed between two call graphs."""
+    base: str = None  # Name of the base version, e.g. a commit
+    head: str = None
+    added_definitions: list[str] = field(default_factory=list)
+    removed_definitions: list[str] = field(default_factory=list)
+    added_edges: list[tuple[str, str]] = field(default_factory=list)  # (caller, callee)
+    removed_edges: list[tuple[str, str]] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added_definitions or self.removed_definitions or self.added_edges or self.removed_edges)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def summary(self) -> str:
+        return (f'{len(self.added_definitions)} definitions added, {len(self.removed_definitions)} removed, '
+                f'{len(self.added_edges)} calls added, {len(self.removed_edges)} removed')
+
+
+def diff_graphs(base: CompactGraph, head: CompactGraph) -> GraphDiff:
+    """
+    Compare two call graphs by the qualified names of their nodes.
+
+    Definitions are the internal nodes, external functions only appear as the callee of an edge. Both graphs should
+    be filtered the same way, e.g. with the same `exclude_private` and `exclude_external` settings.
+    """
+    base_definitions = _definitions(base)
+    head_definitions = _definitions(head)
+    base_edges = _edges(base)
+    head_edges = _edges(head)
+    return GraphDiff(
+        added_definitions=sorted(head_definitions - base_definitions),
+        removed_definitions=sorted(base_definitions - head_definitions),
+        added_edges=sorted(head_edges - base_edges),
+        removed_edges=sorted(base_edges - head_edges),
+    )
+
+
+def _definitions(graph: CompactGraph) -> set[str]:
+    return {graph.names[node_id] for node_id in range(graph.num_nodes) if graph.kinds[node_id] != EXTERNAL}
+
+
+def _edges(graph: CompactGraph) -> set[tuple[str, str]]:
+    names = graph.names
+    return {(names[source], names[target]) for source, target in graph.edges()}
@@ -0,0 +1,520 @@
+import html
+import json
+import logging
+import os
+import sys
+from array import array
+
+from src.graphs.call_graph import CallGraph
+from src.graphs.compact_graph import CLASS, EXTERNAL, METHOD, NO_ID, CompactGraph
+from src.graphs.queries import CALLEES
+from src.stats import RunStats, phase
+
+HTML_EXTENSIONS: tuple[str, ...] = ('.html', '.htm')
+# Cluster of the external functions, which are not part of a module
+EXTERNAL_MODULE = '(external)'
+# Kinds of the nodes in the viewer
+VIEWER_KINDS: dict[int, str] = {METHOD: 'method', CLASS: 'class', EXTERNAL: 'external'}
+
+
+def is_html_output(output_path: str) -> bool:
+    """Whether a graph should be written as an interactive HTML viewer rather than rendered by Graphviz."""
+    return os.path.splitext(output_path)[1].lower() in HTML_EXTENSIONS
+
+
+class HtmlViewer(CallGraph):
+    """
+    Self-contained interactive HTML viewer of a call graph, for graphs that are too large to render as an image.
+
+    The graph is written as compact JSON: an overview with the modules and the aggregated calls between them, and
+    a separate block per module with its functions and their calls. The viewer shows the modules collapsed and
+    parses the block of a module only when the module is expanded, or when one of its functions is a neighbour of
+    a clicked function, so the browser only loads what is visible. Nodes are laid out by a force simulation in the
+    browser, there is no Graphviz layout step.
+    """
+    def __init__(
+            self,
+            output_path: str = 'graph.html',
+            title: str = None,
+            exclude_private: bool = False,
+            exclude_external: bool = False,
+            stats: RunStats = None,
+            focus: list[str] = None,
+            depth: int = None,
+            direction: str = CALLEES
+    ):
+        """Initialize the viewer.
+
+        Args:
+            output_path: The path of the HTML file, '-' writes to stdout
+            title: Title of the graph, defaults to the name of the output file
+            exclude_private: Leave out private functions and the calls from and to them
+            exclude_external: Leave out calls to external functions
+            stats: Optional `RunStats` that collects the time of building and writing the viewer
+            focus: Only show the functions reachable from these functions, see `GraphQuery.focus`
+            depth: Maximum number of calls from a focused function, None for no limit
+            direction: Follow calls from the focused functions to their 'callees', 'callers' or 'both'
+        """
+        super().__init__(output_path=output_path, title=title, exclude_private=exclude_private,
+                         exclude_external=exclude_external, level='function', stats=stats, focus=focus, depth=depth,
+                         direction=direction)
+        self.overview: dict = {}
+        self.chunks: list[dict] = []
+
+    def _add_graph(self, graph: CompactGraph, level: str):
+        """Split the filtered graph into the overview and one block per module."""
+        num_modules = len(graph.module_names)
+        has_externals = graph.num_nodes > graph.module_offsets[-1]
+        module_names = [name.removesuffix('.py') for name in graph.module_names]
+        offsets = list(graph.module_offsets)
+        if has_externals:
+            module_names.append(EXTERNAL_MODULE)
+            offsets.append(graph.num_nodes)
+        module_of = array('i', [NO_ID]) * graph.num_nodes
+        for module_id in range(len(module_names)):
+            for node_id in range(offsets[module_id], offsets[module_id + 1]):
+                module_of[node_id] = module_id
+
+        self.chunks = [
+            {'ids': [], 'names': [], 'labels': [], 'kinds': [], 'lines': [], 'edges': [], 'in': []}
+            for _ in module_names
+        ]
+        sizes = [0] * len(module_names)
+        called = {target for target in graph.targets if graph.kinds[target] == CLASS}
+        for node_id in range(graph.num_nodes):
+            kind = graph.kinds[node_id]
+            if kind == CLASS and node_id not in called:
+                # Classes are shown through their methods, and as a node of their own if they are instantiated
+                continue
+            module_id = module_of[node_id]
+            chunk = self.chunks[module_id]
+            parent = graph.parents[node_id]
+            chunk['ids'].append(node_id)
+            chunk['names'].append(graph.names[node_id])
+            chunk['labels'].append(
+                f'{graph.labels[parent]}.{graph.labels[node_id]}' if parent != NO_ID else graph.labels[node_id]
+            )
+            chunk['kinds'].append(VIEWER_KINDS.get(kind, 'function'))
+            chunk['lines'].append(graph.start_lines[node_id])
+            sizes[module_id] += 1
+
+        module_edges: dict[tuple[int, int], int] = {}
+        for source in range(graph.num_nodes):
+            source_module = module_of[source]
+            for target, weight in zip(graph.successors(source), graph.successor_weights(source)):
+                target_module = module_of[target]
+                self.chunks[source_module]['edges'].extend((source, target, weight))
+                if target_module != source_module:
+                    self.chunks[target_module]['in'].extend((source, target, weight))
+                    key = (source_module, target_module)
+                    module_edges[key] = module_edges.get(key, 0) + weight
+
+        self.overview = {
+            'title': self.title,
+            'modules': module_names,
+            'offsets': offsets,
+            'sizes': sizes,
+            'external': num_modules if has_externals else None,
+            'edges': [value for (source, target), weight in module_edges.items()
+                      for value in (source, target, weight)],
+        }
+        logging.debug(f'HTML viewer with {len(module_names)} modules and {len(module_edges)} calls between modules')
+
+    def render(self):
+        """Write the viewer to a single HTML file, the JSON blocks are parsed by the browser on demand."""
+        with phase(self.stats, 'render'):
+            blocks = [_json_block('poseidon-overview', self.overview)]
+            blocks += [
+                _json_block(f'poseidon-module-{module_id}', chunk) for module_id, chunk in enumerate(self.chunks)
+            ]
+            document = (VIEWER_TEMPLATE
+                        .replace('__TITLE__', html.escape(self.title))
+                        .replace('__DATA__', '\n'.join(blocks)))
+            if self.output_path == '-':
+                sys.stdout.write(document)
+            else:
+                with open(self.output_path, 'w', encoding='utf-8') as f:
+                    f.write(document)
+        logging.info(f'Viewer of {sum(self.overview["sizes"])} nodes saved to {self.output_path} '
+                     f'({len(document) / 2**20:.1f} MB)')
+
+
+def _json_block(element_id: str, data: dict) -> str:
+    """A JSON script element, which the browser does not parse until it is read."""
+    text = json.dumps(data, separators=(',', ':')).replace('</', '<\\/')
+    return f'<script type="application/json" id="{element_id}">{text}</script>'
+
+
+# The viewer, the JSON blocks replace __DATA__
+VIEWER_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<style>
+  html, body { margin: 0; height: 100%; overflow: hidden; font: 13px Helvetica, Arial, sans-serif; }
+  canvas { display: block; cursor: grab; }
+  #panel { position: fixed; top: 8px; left: 8px; max-width: 420px; padding: 8px 12px; background: #fffe;
+           border: 1px solid #ccc; border-radius: 4px; }
+  #panel h1 { font-size: 18px; margin: 0 0 4px; }
+  #panel p { margin: 4px 0; color: #444; }
+  #info { word-break: break-all; }
+  button { margin-right: 4px; }
+</style>
+</head>
+<body>
+<div id="panel">
+  <h1>__TITLE__</h1>
+  <p>Click a module to expand it, click an expanded module's name to collapse it. Click a function to show its
+     callers and callees, click it again to hide them. Drag to pan, scroll to zoom.</p>
+  <p><button id="collapse">Collapse all</button><button id="fit">Fit</button></p>
+  <p id="info"></p>
+</div>
+<canvas id="canvas"></canvas>
+__DATA__
+<script>
+"use strict";
+const overview = JSON.parse(document.getElementById('poseidon-overview').textContent);
+const modules = overview.modules, offsets = overview.offsets, sizes = overview.sizes;
+const chunks = new Map();  // Parsed module blocks, by module id
+const expanded = new Set();  // Module ids
+const revealed = new Map();  // {node id: number of clicked functions that revealed it}
+const revealedBy = new Map();  // {clicked node id: [revealed node ids]}
+const pos = new Map();  // {key: {x, y, vx, vy}}, keys are 'm<module id>' and 'n<node id>'
+let selected = null, alpha = 1, dirty = true, view = {x: 0, y: 0, k: 1};
+
+const canvas = document.getElementById('canvas'), ctx = canvas.getContext('2d');
+
+function moduleOf(id) {
+  let lo = 0, hi = offsets.length - 2;
+  while (lo < hi) {
+    const mid = (lo + hi + 1) >> 1;
+    if (offsets[mid] <= id) lo = mid; else hi = mid - 1;
+  }
+  return lo;
+}
+
+function chunk(m) {
+  if (!chunks.has(m)) {
+    const c = JSON.parse(document.getElementById('poseidon-module-' + m).textContent);
+    c.index = new Map(c.ids.map((id, i) => [id, i]));
+    chunks.set(m, c);
+  }
+  return chunks.get(m);
+}
+
+function node(id) {
+  const c = chunk(moduleOf(id)), i = c.index.get(id);
+  return {id: id, name: c.names[i], label: c.labels[i], kind: c.kinds[i], line: c.lines[i]};
+}
+
+function isShown(id) { return expanded.has(moduleOf(id)) || revealed.has(id); }
+function rep(id) { return isShown(id) ? 'n' + id : 'm' + moduleOf(id); }
+
+function moduleRadius(m) { return 6 + 2 * Math.sqrt(sizes[m]); }
+function radius(key) { return key[0] === 'm' ? moduleRadius(+key.slice(1)) : 5; }
+
+function place(key, x, y) {
+  if (!pos.has(key)) pos.set(key, {x: x, y: y, vx: 0, vy: 0});
+}
+
+// Modules start on a spiral in the order of their names, so modules of a package start close together
+modules.forEach((name, m) => {
+  const r = 30 * Math.sqrt(m), a = m * 2.399963;
+  place('m' + m, r * Math.cos(a), r * Math.sin(a));
+});
+
+function visibleNodes() {
+  const keys = [];
+  modules.forEach((name, m) => {
+    if (expanded.has(m)) chunk(m).ids.forEach(id => keys.push('n' + id));
+    else if (sizes[m] > 0) keys.push('m' + m);
+  });
+  revealed.forEach((count, id) => { if (!expanded.has(moduleOf(id))) keys.push('n' + id); });
+  return keys;
+}
+
+function visibleEdges() {
+  const edges = new Map(), residual = new Map(), seen = new Set(), M = modules.length;
+  const add = (a, b, w) => { if (a !== b) edges.set(a + '|' + b, (edges.get(a + '|' + b) || 0) + w); };
+  for (let i = 0; i < overview.edges.length; i += 3) {
+    residual.set(overview.edges[i] * M + overview.edges[i + 1], overview.edges[i + 2]);
+  }
+  chunks.forEach(c => {
+    for (const list of [c.edges, c['in']]) {
+      for (let i = 0; i < list.length; i += 3) {
+        const u = list[i], v = list[i + 1], w = list[i + 2], key = u + ',' + v;
+        if (seen.has(key)) continue;
+        seen.add(key);
+        const a = rep(u), b = rep(v);
+        if (a[0] === 'm' && b[0] === 'm') continue;  // Counted in the calls between the modules
+        add(a, b, w);
+        const mu = moduleOf(u), mv = moduleOf(v);
+        if (mu !== mv) residual.set(mu * M + mv, residual.get(mu * M + mv) - w);
+      }
+    }
+  });
+  residual.forEach((w, k) => {
+    const a = Math.floor(k / M), b = k % M;
+    if (w > 0 && !expanded.has(a) && !expanded.has(b)) add('m' + a, 'm' + b, w);
+  });
+  return Array.from(edges, ([k, w]) => { const [a, b] = k.split('|'); return {a: a, b: b, w: w}; });
+}
+
+let nodes = [], edges = [];
+function update() {
+  nodes = visibleNodes();
+  edges = visibleEdges();
+  alpha = Math.max(alpha, 0.5);
+  dirty = true;
+}
+
+function expand(m) {
+  const c = chunk(m), center = pos.get('m' + m), r = 12 * Math.sqrt(c.ids.length) + 10;
+  c.ids.forEach((id, i) => {
+    const a = 2 * Math.PI * i / c.ids.length;
+    place('n' + id, center.x + r * Math.cos(a), center.y + r * Math.sin(a));
+  });
+  expanded.add(m);
+  update();
+}
+
+function collapse(m) {
+  expanded.delete(m);
+  chunk(m).ids.forEach(id => { if (!revealed.has(id)) pos.delete('n' + id); });
+  update();
+}
+
+function neighbours(id) {
+  const result = new Set(), c = chunk(moduleOf(id));
+  for (const list of [c.edges, c['in']]) {
+    for (let i = 0; i < list.length; i += 3) {
+      if (list[i] === id) result.add(list[i + 1]);
+      if (list[i + 1] === id) result.add(list[i]);
+    }
+  }
+  result.delete(id);
+  return Array.from(result);
+}
+
+function toggleNeighbourhood(id) {
+  if (revealedBy.has(id)) {
+    for (const other of revealedBy.get(id)) {
+      const count = revealed.get(other) - 1;
+      if (count > 0) revealed.set(other, count);
+      else { revealed.delete(other); if (!isShown(other)) pos.delete('n' + other); }
+    }
+    revealedBy.delete(id);
+  } else {
+    const p = pos.get('n' + id), found = neighbours(id);
+    found.forEach((other, i) => {
+      revealed.set(other, (revealed.get(other) || 0) + 1);
+      const a = 2 * Math.PI * i / found.length;
+      chunk(moduleOf(other));
+      place('n' + other, p.x + 60 * Math.cos(a), p.y + 60 * Math.sin(a));
+    });
+    revealedBy.set(id, found);
+  }
+  update();
+}
+
+function clusterBoxes() {
+  const boxes = [];
+  expanded.forEach(m => {
+    let x0 = Infinity, y0 = Infinity, x1 = -Infinity, y1 = -Infinity;
+    chunk(m).ids.forEach(id => {
+      const p = pos.get('n' + id);
+      x0 = Math.min(x0, p.x); y0 = Math.min(y0, p.y); x1 = Math.max(x1, p.x); y1 = Math.max(y1, p.y);
+    });
+    if (x0 <= x1) boxes.push({m: m, x0: x0 - 20, y0: y0 - 30, x1: x1 + 20, y1: y1 + 20});
+  });
+  return boxes;
+}
+
+// Force simulation: springs along the edges, repulsion between nearby nodes on a grid, and functions of an
+// expanded module are pulled to its position
+function step() {
+  const cell = 120, grid = new Map(), points = nodes.map(k => pos.get(k));
+  points.forEach((p, i) => {
+    const key = Math.floor(p.x / cell) + ',' + Math.floor(p.y / cell);
+    if (!grid.has(key)) grid.set(key, []);
+    grid.get(key).push(i);
+  });
+  points.forEach((p, i) => {
+    const gx = Math.floor(p.x / cell), gy = Math.floor(p.y / cell), ri = radius(nodes[i]);
+    for (let dx = -1; dx <= 1; dx++) for (let dy = -1; dy <= 1; dy++) {
+      for (const j of grid.get((gx + dx) + ',' + (gy + dy)) || []) {
+        if (j <= i) continue;
+        const q = points[j];
+        let x = p.x - q.x, y = p.y - q.y, d2 = x * x + y * y;
+        if (d2 === 0) { x = Math.random() - 0.5; y = Math.random() - 0.5; d2 = x * x + y * y; }
+        const min = ri + radius(nodes[j]) + 20, f = alpha * min * min / d2 / 4;
+        p.vx += x * f; p.vy += y * f; q.vx -= x * f; q.vy -= y * f;
+      }
+    }
+  });
+  edges.forEach(e => {
+    const p = pos.get(e.a), q = pos.get(e.b);
+    if (!p || !q) return;
+    const x = q.x - p.x, y = q.y - p.y, d = Math.sqrt(x * x + y * y) || 1;
+    const f = alpha * 0.02 * (d - (radius(e.a) + radius(e.b) + 60)) / d;
+    p.vx += x * f; p.vy += y * f; q.vx -= x * f; q.vy -= y * f;
+  });
+  nodes.forEach(k => {
+    const p = pos.get(k);
+    if (k[0] === 'n') {
+      const m = moduleOf(+k.slice(1));
+      if (expanded.has(m)) {
+        const c = pos.get('m' + m);
+        p.vx += (c.x - p.x) * alpha * 0.01; p.vy += (c.y - p.y) * alpha * 0.01;
+      }
+    } else {
+      p.vx -= p.x * alpha * 0.0005; p.vy -= p.y * alpha * 0.0005;
+    }
+    p.x += p.vx *= 0.5; p.y += p.vy *= 0.5;
+  });
+  alpha *= 0.99;
+}
+
+function toScreen(p) { return [p.x * view.k + view.x, p.y * view.k + view.y]; }
+function toWorld(x, y) { return [(x - view.x) / view.k, (y - view.y) / view.k]; }
+
+function draw() {
+  const w = canvas.width = window.innerWidth, h = canvas.height = window.innerHeight;
+  ctx.clearRect(0, 0, w, h);
+  ctx.save();
+  ctx.translate(view.x, view.y);
+  ctx.scale(view.k, view.k);
+  ctx.font = '11px Helvetica, Arial, sans-serif';
+  clusterBoxes().forEach(b => {
+    ctx.setLineDash([3, 3]);
+    ctx.strokeStyle = '#000';
+    ctx.lineWidth = 1 / view.k;
+    ctx.strokeRect(b.x0, b.y0, b.x1 - b.x0, b.y1 - b.y0);
+    ctx.setLineDash([]);
+    ctx.fillStyle = '#000';
+    ctx.fillText(modules[b.m], b.x0 + 4, b.y0 + 14);
+  });
+  const neighbourhood = selected === null ? null : new Set(neighbours(selected).map(rep).concat(['n' + selected]));
+  edges.forEach(e => {
+    const p = pos.get(e.a), q = pos.get(e.b);
+    if (!p || !q) return;
+    const highlighted = neighbourhood && neighbourhood.has(e.a) && neighbourhood.has(e.b);
+    ctx.strokeStyle = highlighted ? '#d33' : '#0005';
+    ctx.fillStyle = ctx.strokeStyle;
+    ctx.lineWidth = 1 + Math.log2(e.w);
+    const x = q.x - p.x, y = q.y - p.y, d = Math.sqrt(x * x + y * y) || 1, r = radius(e.b);
+    const ex = q.x - x / d * r, ey = q.y - y / d * r;
+    ctx.beginPath(); ctx.moveTo(p.x, p.y); ctx.lineTo(ex, ey); ctx.stroke();
+    ctx.beginPath(); ctx.moveTo(ex, ey);
+    ctx.lineTo(ex - (x * 8 - y * 4) / d, ey - (y * 8 + x * 4) / d);
+    ctx.lineTo(ex - (x * 8 + y * 4) / d, ey - (y * 8 - x * 4) / d);
+    ctx.fill();
+  });
+  nodes.forEach(k => {
+    const p = pos.get(k), r = radius(k);
+    let label, color;
+    if (k[0] === 'm') {
+      const m = +k.slice(1);
+      label = modules[m] + ' (' + sizes[m] + ')';
+      color = m === overview.external ? '#eee' : 'lightsteelblue';
+    } else {
+      const n = node(+k.slice(1));
+      label = n.label;
+      color = n.kind === 'external' ? '#fff' : (n.id === selected ? 'orange' : 'lightblue');
+    }
+    ctx.beginPath(); ctx.arc(p.x, p.y, r, 0, 2 * Math.PI);
+    ctx.fillStyle = color; ctx.fill();
+    ctx.strokeStyle = '#000'; ctx.lineWidth = 1 / view.k; ctx.stroke();
+    if (view.k > 0.5 || k[0] === 'm') { ctx.fillStyle = '#000'; ctx.fillText(label, p.x + r + 2, p.y + 4); }
+  });
+  ctx.restore();
+}
+
+function hit(x, y) {
+  const [wx, wy] = toWorld(x, y);
+  for (let i = nodes.length - 1; i >= 0; i--) {
+    const p = pos.get(nodes[i]), r = radius(nodes[i]) + 2;
+    if ((p.x - wx) ** 2 + (p.y - wy) ** 2 <= r * r) return {node: nodes[i]};
+  }
+  for (const b of clusterBoxes()) {
+    if (wx >= b.x0 && wx <= b.x1 && wy >= b.y0 && wy <= b.y0 + 20) return {cluster: b.m};
+  }
+  return null;
+}
+
+function showInfo(id) {
+  const info = document.getElementById('info');
+  if (id === null) { info.textContent = ''; return; }
+  const n = node(id);
+  info.textContent = n.name + ' (' + n.kind + (n.line >= 0 ? ', line ' + n.line : '') + '), '
+    + neighbours(id).length + ' callers and callees';
+}
+
+function fit() {
+  if (!nodes.length) return;
+  let x0 = Infinity, y0 = Infinity, x1 = -Infinity, y1 = -Infinity;
+  nodes.forEach(k => {
+    const p = pos.get(k);
+    x0 = Math.min(x0, p.x); y0 = Math.min(y0, p.y); x1 = Math.max(x1, p.x); y1 = Math.max(y1, p.y);
+  });
+  view.k = Math.min(2, 0.9 * Math.min(window.innerWidth / (x1 - x0 + 100), window.innerHeight / (y1 - y0 + 100)));
+  view.x = window.innerWidth / 2 - (x0 + x1) / 2 * view.k;
+  view.y = window.innerHeight / 2 - (y0 + y1) / 2 * view.k;
+  dirty = true;
+}
+
+let drag = null;
+canvas.addEventListener('mousedown', e => {
+  drag = {x: e.clientX, y: e.clientY, vx: view.x, vy: view.y, moved: false};
+});
+window.addEventListener('mousemove', e => {
+  if (!drag) return;
+  if (Math.abs(e.clientX - drag.x) + Math.abs(e.clientY - drag.y) > 3) drag.moved = true;
+  view.x = drag.vx + e.clientX - drag.x; view.y = drag.vy + e.clientY - drag.y;
+  dirty = true;
+});
+window.addEventListener('mouseup', e => {
+  if (drag && !drag.moved) {
+    const target = hit(e.clientX, e.clientY);
+    if (target && target.cluster !== undefined) collapse(target.cluster);
+    else if (target && target.node[0] === 'm') expand(+target.node.slice(1));
+    else if (target) {
+      const id = +target.node.slice(1);
+      toggleNeighbourhood(id);
+      selected = revealedBy.has(id) ? id : null;
+      showInfo(selected);
+    }
+  }
+  drag = null;
+});
+canvas.addEventListener('wheel', e => {
+  e.preventDefault();
+  const k = view.k * Math.exp(-e.deltaY * 0.001);
+  view.x = e.clientX - (e.clientX - view.x) * k / view.k;
+  view.y = e.clientY - (e.clientY - view.y) * k / view.k;
+  view.k = k;
+  dirty = true;
+}, {passive: false});
+document.getElementById('collapse').addEventListener('click', () => {
+  Array.from(expanded).forEach(collapse);
+  revealed.forEach((count, id) => pos.delete('n' + id));
+  revealed.clear(); revealedBy.clear(); selected = null; showInfo(null);
+  update();
+});
+document.getElementById('fit').addEventListener('click', fit);
+
+update();
+for (let i = 0; i < 100 && alpha > 0.05; i++) step();
+fit();
+window.addEventListener('resize', () => { dirty = true; });
+// Only redraw while the layout moves or the view changed
+(function frame() {
+  if (alpha > 0.01) { step(); dirty = true; }
+  if (dirty) { draw(); dirty = false; }
+  requestAnimationFrame(frame);
+})();
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+
+# The layout of a rendered graph is stored next to it, e.g. `graph.layout.json` for `graph.png`
+LAYOUT_CACHE_SUFFIX = '.layout.json'
+# Increase when the content of the layout files changes, which invalidates existing files
+LAYOUT_FORMAT_VERSION = 1
+# Above this fraction of new or moved nodes, the graph is laid out from scratch
+MAX_CHANGED_FRACTION = 0.25
+# Engine that places new nodes around the pinned nodes, and that draws a fully positioned graph with `-n2`
+PIN_ENGINE = 'neato'
+# Distance in points between the new nodes that are placed next to each other before the layout
+NEW_NODE_SPACING = 72.0
+
+# Ways to lay out a graph, see `LayoutPlan`
+FULL = 'full'
+INCREMENTAL = 'incremental'
+FIXED = 'fixed'
+
+
+@dataclass
+class LayoutPlan:
+    """
+    How a graph is laid out, given the layout of its previous render.
+
+    - `FULL`: there is no usable previous layout, the graph is laid out from scratch by its own engine
+    - `INCREMENTAL`: some nodes are new or moved to another cluster, the unchanged nodes are pinned to their previous
+      positions and `PIN_ENGINE` places only the other nodes, starting next to their cluster
+    - `FIXED`: all nodes have a previous position, nothing is laid out and `PIN_ENGINE -n2` only routes the edges
+      that are new, the previous splines of the other edges are reused
+    """
+    mode: str = FULL
+    engine: str = None  # Engine that lays out the graph
+    positions: dict[str, tuple[float, float]] = field(default_factory=dict)  # {node: (x, y)} in points
+    pinned: set[str] = field(default_factory=set)
+    clusters: dict[str, dict[str, str]] = field(default_factory=dict)  # {cluster: {'bb': ..., 'lp': ...}}
+    edges: dict[str, dict[str, str]] = field(default_factory=dict)  # {tail: {head: spline}}
+
+    def graph_attributes(self) -> dict[str, str]:
+        """Positions are given in points, and are not moved to the origin when new nodes are placed."""
+        if self.mode != INCREMENTAL:
+            return {}
+        return {'inputscale': '72', 'notranslate': 'true'}
+
+    @property
+    def no_op(self) -> int | None:
+        """The `-n` flag of `PIN_ENGINE` when nothing is laid out, which keeps the positions and the splines."""
+        return 2 if self.mode == FIXED else None
+
+    def node_attributes(self, name: str) -> dict[str, str]:
+        """The Graphviz attributes that place a node, a trailing '!' pins it."""
+        if name not in self.positions:
+            return {}
+        x, y = self.positions[name]
+        return {'pos': f'{x:.2f},{y:.2f}!' if name in self.pinned else f'{x:.2f},{y:.2f}'}
+
+    def cluster_attributes(self, name: str) -> dict[str, str]:
+        """The bounding box and label position of a cluster, only needed when nothing is laid out."""
+        if self.mode != FIXED:
+            return {}
+        return self.clusters.get(name, {})
+
+    def edge_attributes(self, tail: str, head: str) -> dict[str, str]:
+        """The previous spline of an edge, only reused when nothing is laid out."""
+        if self.mode != FIXED or head not in self.edges.get(tail, {}):
+            return {}
+        return {'pos': self.edges[tail][head]}
+
+
+@dataclass
+class LayoutCache:
+    """
+    The node and cluster positions and the edge splines of a rendered graph, in points.
+
+    Nodes are identified by their name, and remember the cluster they were drawn in. A node that is in the same
+    cluster again keeps its position on the next render, so small changes to the code leave the picture stable,
+    see `plan`.
+    """
+    engine: str = None
+    nodes: dict[str, tuple[float, float, str]] = field(default_factory=dict)  # {node: (x, y, cluster)}
+    clusters: dict[str, dict[str, str]] = field(default_factory=dict)  # {cluster: {'bb': ..., 'lp': ...}}
+    edges: dict[str, dict[str, str]] = field(default_factory=dict)  # {tail: {head: spline}}
+
+    @classmethod
+    def load(cls, path: str) -> 'LayoutCache | None':
+        """Load the layout stored at `path`, returns None if there is no (valid) layout."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f'Ignoring unreadable layout cache {path}: {e}')
+            return None
+        if data.get('version') != LAYOUT_FORMAT_VERSION:
+            logging.info(f'Ignoring layout cache {path} of another version')
+            return None
+        return cls(
+            engine=data['engine'],
+            nodes={name: tuple(node) for name, node in data['nodes'].items()},
+            clusters=data['clusters'],
+            edges=data['edges'],
+        )
+
+    def save(self, path: str):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': LAYOUT_FORMAT_VERSION,
+                'engine': self.engine,
+                'nodes': self.nodes,
+                'clusters': self.clusters,
+                'edges': self.edges,
+            }, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_json(cls, layout: bytes | str, engine: str, node_clusters: dict[str, str]) -> 'LayoutCache':
+        """
+        Read the positions from the `json0` output of Graphviz.
+
+        Args:
+            layout: The laid out graph in the `json0` format
+            engine: The engine of the graph, a layout is only reused for the same engine
+            node_clusters: {node: cluster} of the nodes as they were added to the graph
+        """
+        graph = json.loads(layout)
+        cache = cls(engine=engine)
+        names = {}
+        for graph_object in graph.get('objects', []):
+            name = graph_object.get('name', '')
+            if 'nodes' in graph_object or 'pos' not in graph_object:
+                # A subgraph, only clusters with nodes are drawn
+                if name.startswith('cluster') and graph_object.get('nodes') and 'bb' in graph_object:
+                    cache.clusters[name] = {key: graph_object[key] for key in ('bb', 'lp') if key in graph_object}
+                continue
+            names[graph_object['_gvid']] = name
+            x, y = graph_object['pos'].split(',')[:2]
+            cache.nodes[name] = (float(x), float(y), node_clusters.get(name, ''))
+        for edge in graph.get('edges', []):
+            if 'pos' in edge:
+                cache.edges.setdefault(names[edge['tail']], {})[names[edge['head']]] = edge['pos']
+        return cache
+
+    def plan(self, node_clusters: dict[str, str], engine: str, max_incremental_nodes: int = None) -> LayoutPlan:
+        """
+        Decide how a graph is laid out, reusing the positions of the nodes that are in the same cluster again.
+
+        Args:
+            node_clusters: {node: cluster} of all nodes of the graph, '' for nodes outside of clusters
+            engine: The engine that lays out the graph from scratch
+            max_incremental_nodes: Graphs with more nodes are laid out from scratch rather than incrementally when
+                nodes changed, since `PIN_ENGINE` does not scale as well as the engines of large graphs
+        """
+        if self.engine != engine or not node_clusters:
+            return LayoutPlan(mode=FULL, engine=engine)
+        pinned = {
+            name for name, cluster in node_clusters.items()
+            if name in self.nodes and self.nodes[name][2] == cluster
+        }
+        changed = len(node_clusters) - len(pinned)
+        if changed == 0:
+            mode = FIXED
+        elif (changed / len(node_clusters) > MAX_CHANGED_FRACTION
+              or (max_incremental_nodes is not None and len(node_clusters) > max_incremental_nodes)):
+            return LayoutPlan(mode=FULL, engine=engine)
+        else:
+            mode = INCREMENTAL
+        plan = LayoutPlan(mode=mode, engine=PIN_ENGINE, pinned=pinned, clusters=self.clusters, edges=self.edges)
+        plan.positions = {name: self.nodes[name][:2] for name in pinned}
+        plan.positions.update(self._initial_positions(node_clusters, pinned))
+        logging.info(f'Layout cache: {len(pinned)} of {len(node_clusters)} nodes keep their position ({mode})')
+        return plan
+
+    def _initial_positions(self, node_clusters: dict[str, str], pinned: set[str]) -> dict[str, tuple[float, float]]:
+        """Start every new node below the pinned nodes of its cluster, or below the whole graph."""
+        bottom = {}  # {cluster: (mean x, lowest y)} of the pinned nodes
+        for name in pinned:
+            x, y, cluster = self.nodes[name]
+            for key in (cluster, None):
+                total_x, count, lowest = bottom.get(key, (0.0, 0, y))
+                bottom[key] = (total_x + x, count + 1, min(lowest, y))
+        placed = {}  # {cluster: number of new nodes placed below it}
+        positions = {}
+        for name, cluster in node_clusters.items():
+            if name in pinned:
+                continue
+            key = cluster if cluster in bottom else None
+            total_x, count, lowest = bottom.get(key, (0.0, 1, 0.0))
+            index = placed.get(key, 0)
+            placed[key] = index + 1
+            positions[name] = (total_x / count + index * NEW_NODE_SPACING, lowest - NEW_NODE_SPACING)
+        return positions
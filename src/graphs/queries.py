@@ -0,0 +1,225 @@
+import logging
+from array import array
+from collections import deque
+
+from src.graphs.compact_graph import EXTERNAL, NO_ID, CompactGraph
+
+# Directions of a reachability query
+CALLEES = 'callees'
+CALLERS = 'callers'
+BOTH = 'both'
+DIRECTIONS: tuple[str, ...] = (CALLEES, CALLERS, BOTH)
+
+
+class GraphQuery:
+    """
+    Queries on a `CompactGraph`: reachability, strongly connected components and topological layers.
+
+    All queries are iterative, so deep call chains do not hit the recursion limit, and run in time linear in the
+    number of nodes and edges. The callers of every node are indexed on first use, in the same CSR layout as the
+    callees of the graph.
+    """
+    def __init__(self, graph: CompactGraph):
+        self.graph = graph
+        self._caller_offsets: array = None
+        self._callers: array = None
+
+    def find(self, name: str) -> int:
+        """
+        The id of a node by its qualified name, or by the end of it, e.g. `func` or `mod.func` for `pkg.mod.func`.
+
+        Raises:
+            ValueError: if no node or more than one node matches
+        """
+        node_id = self.graph.node_id(name)
+        if node_id != NO_ID:
+            return node_id
+        suffix = f'.{name}'
+        candidates = [
+            node_id for node_id, full_name in enumerate(self.graph.names)
+            if full_name.endswith(suffix) and self.graph.kinds[node_id] != EXTERNAL
+        ]
+        if not candidates:
+            raise ValueError(f"No function, method or class named '{name}'")
+        if len(candidates) > 1:
+            names = ', '.join(self.graph.names[node_id] for node_id in candidates[:10])
+            raise ValueError(f"'{name}' is ambiguous, it matches {names}")
+        return candidates[0]
+
+    def callers(self, node_id: int) -> array:
+        """The ids of the nodes that call `node_id`."""
+        if self._callers is None:
+            self._index_callers()
+        return self._callers[self._caller_offsets[node_id]:self._caller_offsets[node_id + 1]]
+
+    def reachable(self, sources: list[int], depth: int = None, direction: str = CALLEES) -> dict[int, int]:
+        """
+        Breadth-first search from the source nodes.
+
+        Args:
+            sources: The ids of the nodes to start from
+            depth: Maximum number of calls between a source and a reached node, None for no limit
+            direction: Follow calls to callees, to callers, or both
+
+        Returns:
+            The reached nodes, including the sources, as {node_id: distance from the nearest source}.
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction '{direction}', choose from {DIRECTIONS}")
+        if direction != CALLEES and self._callers is None:
+            self._index_callers()
+        graph = self.graph
+        distances = {source: 0 for source in sources}
+        queue = deque(sources)
+        while queue:
+            node_id = queue.popleft()
+            distance = distances[node_id]
+            if depth is not None and distance >= depth:
+                continue
+            neighbours = []
+            if direction != CALLERS:
+                neighbours.append(graph.targets[graph.offsets[node_id]:graph.offsets[node_id + 1]])
+            if direction != CALLEES:
+                neighbours.append(self._callers[self._caller_offsets[node_id]:self._caller_offsets[node_id + 1]])
+            for neighbour_ids in neighbours:
+                for neighbour in neighbour_ids:
+                    if neighbour not in distances:
+                        distances[neighbour] = distance + 1
+                        queue.append(neighbour)
+        return distances
+
+    def strongly_connected_components(self) -> list[list[int]]:
+        """
+        The strongly connected components of the graph, found with an iterative version of Tarjan's algorithm.
+
+        Returns:
+            The components as lists of node ids, a component is listed after all components it calls into.
+        """
+        graph = self.graph
+        offsets, targets = graph.offsets, graph.targets
+        num_nodes = graph.num_nodes
+        index = array('i', [NO_ID]) * num_nodes
+        lowlink = array('i', [0]) * num_nodes
+        on_stack = bytearray(num_nodes)
+        stack = []
+        components = []
+        counter = 0
+        for root in range(num_nodes):
+            if index[root] != NO_ID:
+                continue
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            # The nodes on the current path, with the position of the next edge to visit
+            path = [(root, offsets[root])]
+            while path:
+                node_id, position = path[-1]
+                end = offsets[node_id + 1]
+                while position < end:
+                    target = targets[position]
+                    position += 1
+                    if index[target] == NO_ID:
+                        # Descend into the callee, the remaining edges are visited when it is finished
+                        path[-1] = (node_id, position)
+                        index[target] = lowlink[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        on_stack[target] = 1
+                        path.append((target, offsets[target]))
+                        break
+                    if on_stack[target] and index[target] < lowlink[node_id]:
+                        lowlink[node_id] = index[target]
+                else:
+                    # All edges of the node are visited
+                    path.pop()
+                    if path:
+                        parent = path[-1][0]
+                        if lowlink[node_id] < lowlink[parent]:
+                            lowlink[parent] = lowlink[node_id]
+                    if lowlink[node_id] == index[node_id]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack[member] = 0
+                            component.append(member)
+                            if member == node_id:
+                                break
+                        components.append(component)
+        logging.debug(f'Found {len(components)} strongly connected components')
+        return components
+
+    def cycles(self) -> list[list[int]]:
+        """The groups of nodes that call each other (recursion), including functions that call themselves."""
+        graph = self.graph
+        return [
+            component for component in self.strongly_connected_components()
+            if len(component) > 1 or component[0] in graph.successors(component[0])
+        ]
+
+    def topological_layers(self) -> list[list[int]]:
+        """
+        Assign every node to a layer, such that callers are in an earlier layer than their callees.
+
+        The nodes of a cycle share a layer. A node is in the layer after the deepest of its callers, so the first
+        layer holds the entry points that are not called by any other node.
+
+        Returns:
+            The node ids of every layer.
+        """
+        graph = self.graph
+        components = self.strongly_connected_components()
+        component_of = array('i', [0]) * graph.num_nodes
+        for component_id, component in enumerate(components):
+            for node_id in component:
+                component_of[node_id] = component_id
+
+        # Components are found callees first, so visiting them in reverse visits all callers before their callees
+        layer_of = array('i', [0]) * len(components)
+        for component_id in range(len(components) - 1, -1, -1):
+            next_layer = layer_of[component_id] + 1
+            for node_id in components[component_id]:
+                for target in graph.successors(node_id):
+                    target_component = component_of[target]
+                    if target_component != component_id and layer_of[target_component] < next_layer:
+                        layer_of[target_component] = next_layer
+
+        layers = [[] for _ in range(max(layer_of, default=-1) + 1)]
+        for node_id in range(graph.num_nodes):
+            layers[layer_of[component_of[node_id]]].append(node_id)
+        return layers
+
+    def focus(self, names: list[str], depth: int = None, direction: str = CALLEES) -> CompactGraph:
+        """
+        The subgraph of the nodes reachable from the named nodes, see `find` and `reachable`.
+
+        The classes of reached methods are kept as well, so methods are drawn inside their class.
+        """
+        distances = self.reachable([self.find(name) for name in names], depth=depth, direction=direction)
+        keep = bytearray(self.graph.num_nodes)
+        parents = self.graph.parents
+        for node_id in distances:
+            keep[node_id] = 1
+            if parents[node_id] != NO_ID:
+                keep[parents[node_id]] = 1
+        logging.debug(f'Focused on {len(distances)} nodes reachable from {names}')
+        return self.graph.subgraph(keep)
+
+    def _index_callers(self):
+        """Index the callers of every node with a counting sort on the callee."""
+        graph = self.graph
+        num_nodes = graph.num_nodes
+        offsets = array('i', bytes(array('i').itemsize * (num_nodes + 1)))
+        for target in graph.targets:
+            offsets[target + 1] += 1
+        for i in range(num_nodes):
+            offsets[i + 1] += offsets[i]
+        positions = array('i', offsets[:-1])
+        callers = array('i', bytes(array('i').itemsize * graph.num_edges))
+        for source in range(num_nodes):
+            for i in range(graph.offsets[source], graph.offsets[source + 1]):
+                target = graph.targets[i]
+                callers[positions[target]] = source
+                positions[target] += 1
+        self._caller_offsets = offsets
+        self._callers = callers
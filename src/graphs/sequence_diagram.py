@@ -0,0 +1,303 @@
+import logging
+import os
+import shutil
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Iterable
+
+from src.parser import Class, Module, is_private_name
+from src.stats import RunStats, phase
+
+# Default limits of the expansion, see `SequenceDiagram`
+DEFAULT_MAX_DEPTH = 6
+DEFAULT_MAX_CALLS = 25
+
+# Syntaxes of the diagram text
+PLANTUML = 'plantuml'
+MERMAID = 'mermaid'
+# {extension: syntax} of the text outputs, other extensions are rendered by PlantUML, e.g. png or svg
+SEQUENCE_FORMATS: dict[str, str] = {'puml': PLANTUML, 'plantuml': PLANTUML, 'mmd': MERMAID, 'mermaid': MERMAID}
+PLANTUML_COMMAND = 'plantuml'
+# Lifeline of external functions that are not part of a module, e.g. builtins
+EXTERNAL_PARTICIPANT = 'external'
+
+# Kinds of messages
+CALL = 'call'  # A call that is expanded, followed by the messages of the callee and a RETURN
+RETURN = 'return'
+LEAF = 'leaf'  # A call of a function without calls, or an external function
+REPEATED = 'repeated'  # A call of a function that is expanded earlier in the diagram
+RECURSIVE = 'recursive'  # A call of a function that is being expanded, which is not followed
+DEPTH_LIMIT = 'depth_limit'  # A call of a function with calls, at the maximum depth
+OMITTED = 'omitted'  # Calls left out of a function above the maximum number of calls
+
+
+@dataclass(slots=True)
+class Message:
+    """A message of a sequence diagram, from the caller to the callee."""
+    kind: str
+    caller: str
+    callee: str
+    line: int = None  # Line of the call site in the caller
+    count: int = 0  # Number of calls left out, for OMITTED messages
+
+
+class SequenceDiagram:
+    """
+    Sequence diagram of the calls made by an entry function, as PlantUML or Mermaid text.
+
+    The resolved calls are expanded depth-first in source order, ordered by the line numbers of the call sites,
+    with a lifeline per class for methods and per module for functions. Every function is expanded at most once:
+    later calls of it refer to the earlier expansion, calls of a function that is being expanded are recursive and
+    not followed, and both the depth of the expansion and the number of calls shown per function are limited. The
+    diagram therefore grows linearly with the number of reachable call sites, also for hubs that are called from
+    everywhere.
+    """
+    def __init__(
+            self,
+            output_path: str = 'sequence.puml',
+            title: str = None,
+            exclude_private: bool = False,
+            exclude_external: bool = False,
+            max_depth: int = DEFAULT_MAX_DEPTH,
+            max_calls: int = DEFAULT_MAX_CALLS,
+            stats: RunStats = None
+    ):
+        """Initialize the sequence diagram.
+
+        Args:
+            output_path: The path of the diagram, .puml/.plantuml and .mmd/.mermaid files are written as text, other
+                extensions such as .png and .svg are rendered with PlantUML, '-' writes PlantUML text to stdout
+            title: Title of the diagram, defaults to the entry function
+            exclude_private: Leave out calls of private functions
+            exclude_external: Leave out calls of external functions
+            max_depth: Maximum number of nested calls from the entry function that are expanded, None for no limit
+            max_calls: Maximum number of calls shown per function, None for no limit
+            stats: Optional `RunStats` that collects the time of building and rendering the diagram
+        """
+        self.output_path = output_path
+        self.title = title
+        self.exclude_private = exclude_private
+        self.exclude_external = exclude_external
+        self.max_depth = max_depth
+        self.max_calls = max_calls
+        self.stats = stats
+        self.calls: dict[str, dict[str, list[int]]] = {}  # {caller: {callee: [lines]}}
+        self.participants: dict[str, str] = {}  # {function: lifeline} of the definitions in the parsed folder
+        self.private: dict[str, bool] = {}  # {function: is_private}
+        self.messages: list[Message] = []
+        self.entry: str = None
+        self._call_sites: dict[str, list[tuple[int, str]]] = {}
+
+    def build_graph(self, modules: dict[str, Module] | Iterable[tuple[str, Module]], entry: str):
+        """
+        Expand the calls of the entry function.
+
+        Args:
+            modules: The parsed modules with resolved calls, or an iterable of (module file name, module)
+            entry: The entry function, by qualified name or the end of it, e.g. `func` or `mod.Class.method`
+        """
+        items = modules.items() if isinstance(modules, dict) else modules
+        with phase(self.stats, 'build_graph'):
+            for _, module in items:
+                self._add_module(module)
+            self.entry = self.find(entry)
+            self.messages = self.expand(self.entry)
+        logging.debug(f'Sequence diagram of {self.entry} with {len(self.messages)} messages')
+        if self.stats is not None:
+            self.stats.count('messages', len(self.messages))
+
+    def _add_module(self, module: Module):
+        """Index the definitions and the calls of a module."""
+        for full_name, definition in module.definitions.items():
+            if isinstance(definition, Class):
+                class_name = f'{definition.module}.{definition.name}'
+                # A call of a class without `__init__` refers to the class itself
+                self.participants[class_name] = class_name
+                self.private[class_name] = is_private_name(definition.name)
+                for method in definition.methods.values():
+                    method_name = f'{class_name}.{method.name}'
+                    self.participants[method_name] = class_name
+                    self.private[method_name] = is_private_name(definition.name) or is_private_name(method.name)
+            else:
+                self.participants[full_name] = definition.module
+                self.private[full_name] = is_private_name(full_name)
+        self.calls.update(module.calls)
+
+    def find(self, name: str) -> str:
+        """
+        The qualified name of a function by its qualified name, or by the end of it.
+
+        Raises:
+            ValueError: if no function or more than one function matches
+        """
+        if name in self.participants:
+            return name
+        suffix = f'.{name}'
+        candidates = [full_name for full_name in self.participants if full_name.endswith(suffix)]
+        if not candidates:
+            raise ValueError(f"No function or method named '{name}'")
+        if len(candidates) > 1:
+            raise ValueError(f"'{name}' is ambiguous, it matches {', '.join(candidates[:10])}")
+        return candidates[0]
+
+    def call_sites(self, caller: str) -> list[tuple[int, str]]:
+        """The (line, callee) of every call of a function in source order, without the excluded callees."""
+        if caller not in self._call_sites:
+            self._call_sites[caller] = sorted(
+                (line, callee) for callee, lines in self.calls.get(caller, {}).items() if self._is_shown(callee)
+                for line in lines
+            )
+        return self._call_sites[caller]
+
+    def _is_shown(self, callee: str) -> bool:
+        if callee not in self.participants:
+            return not self.exclude_external
+        return not (self.exclude_private and self.private[callee])
+
+    def expand(self, entry: str) -> list[Message]:
+        """
+        The messages of the calls made by a function, iteratively in depth-first order.
+
+        Returns:
+            The messages in the order they appear in the diagram, every CALL is eventually followed by its RETURN.
+        """
+        messages = []
+        expanded = {entry}
+        # Frames of (function, remaining call sites, index of the next call site), the stack holds the active calls
+        stack = [(entry, self._limit(entry), [0])]
+        on_stack = {entry}
+        while stack:
+            function, sites, position = stack[-1]
+            while position[0] < len(sites):
+                line, callee = sites[position[0]]
+                position[0] += 1
+                if callee in on_stack:
+                    messages.append(Message(RECURSIVE, function, callee, line))
+                elif not self.call_sites(callee):
+                    messages.append(Message(LEAF, function, callee, line))
+                elif callee in expanded:
+                    messages.append(Message(REPEATED, function, callee, line))
+                elif self.max_depth is not None and len(stack) > self.max_depth:
+                    messages.append(Message(DEPTH_LIMIT, function, callee, line))
+                else:
+                    messages.append(Message(CALL, function, callee, line))
+                    expanded.add(callee)
+                    on_stack.add(callee)
+                    stack.append((callee, self._limit(callee), [0]))
+                    break
+            else:
+                omitted = len(self.call_sites(function)) - len(sites)
+                if omitted:
+                    messages.append(Message(OMITTED, function, function, count=omitted))
+                stack.pop()
+                on_stack.discard(function)
+                if stack:
+                    messages.append(Message(RETURN, function, stack[-1][0]))
+        return messages
+
+    def _limit(self, function: str) -> list[tuple[int, str]]:
+        sites = self.call_sites(function)
+        return sites if self.max_calls is None else sites[:self.max_calls]
+
+    def participant(self, function: str) -> str:
+        """The lifeline of a function: its class for methods, its module for functions."""
+        if function in self.participants:
+            return self.participants[function]
+        return function.rpartition('.')[0] or EXTERNAL_PARTICIPANT
+
+    @staticmethod
+    def label(function: str) -> str:
+        return f"{function.rpartition('.')[2]}()"
+
+    def to_plantuml(self) -> str:
+        """The diagram in PlantUML syntax."""
+        aliases = self._aliases()
+        entry = aliases[self.participant(self.entry)]
+        lines = ['@startuml', f'title {self.title or self.entry}']
+        lines += [f'participant "{name}" as {alias}' for name, alias in aliases.items()]
+        lines += [f'[-> {entry} : {self.label(self.entry)}', f'activate {entry}']
+        for message in self.messages:
+            caller = aliases[self.participant(message.caller)]
+            callee = aliases[self.participant(message.callee)]
+            label = self.label(message.callee)
+            if message.kind == RETURN:
+                lines += [f'{caller} --> {callee}', f'deactivate {caller}']
+            elif message.kind == OMITTED:
+                lines.append(f'note over {caller} : {message.count} more calls')
+            else:
+                lines.append(f'{caller} -> {callee} : {label}')
+                if message.kind == CALL:
+                    lines.append(f'activate {callee}')
+                elif message.kind != LEAF:
+                    lines.append(f'note right : {self._note(message)}')
+        lines += [f'[<-- {entry}', f'deactivate {entry}', '@enduml']
+        return '\n'.join(lines) + '\n'
+
+    def to_mermaid(self) -> str:
+        """The diagram in Mermaid syntax."""
+        aliases = self._aliases()
+        entry = aliases[self.participant(self.entry)]
+        lines = ['---', f'title: {self.title or self.entry}', '---', 'sequenceDiagram']
+        lines += [f'    participant {alias} as {name}' for name, alias in aliases.items()]
+        lines.append(f'    activate {entry}')
+        for message in self.messages:
+            caller = aliases[self.participant(message.caller)]
+            callee = aliases[self.participant(message.callee)]
+            label = self.label(message.callee)
+            if message.kind == RETURN:
+                lines.append(f'    {caller}-->>-{callee}: {self.label(message.caller)}')
+            elif message.kind == OMITTED:
+                lines.append(f'    Note over {caller}: {message.count} more calls')
+            elif message.kind == CALL:
+                lines.append(f'    {caller}->>+{callee}: {label}')
+            else:
+                lines.append(f'    {caller}->>{callee}: {label}')
+                if message.kind != LEAF:
+                    lines.append(f'    Note right of {callee}: {self._note(message)}')
+        lines.append(f'    deactivate {entry}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _note(message: Message) -> str:
+        if message.kind == REPEATED:
+            return 'expanded above'
+        if message.kind == RECURSIVE:
+            return 'recursive call'
+        return 'not expanded, maximum depth'
+
+    def _aliases(self) -> dict[str, str]:
+        """{lifeline: alias} in the order the lifelines appear, the names contain dots that neither syntax allows."""
+        aliases = {self.participant(self.entry): 'P0'}
+        for message in self.messages:
+            for function in (message.caller, message.callee):
+                participant = self.participant(function)
+                if participant not in aliases:
+                    aliases[participant] = f'P{len(aliases)}'
+        return aliases
+
+    def render(self):
+        """Write the diagram as text, or render it with PlantUML for other output formats."""
+        extension = os.path.splitext(self.output_path)[1].lstrip('.').lower()
+        syntax = SEQUENCE_FORMATS.get(extension, PLANTUML)
+        text = self.to_mermaid() if syntax == MERMAID else self.to_plantuml()
+        with phase(self.stats, 'render'):
+            if self.output_path == '-':
+                sys.stdout.write(text)
+            elif extension in SEQUENCE_FORMATS:
+                with open(self.output_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+            else:
+                self._render_plantuml(text, extension or 'png')
+        logging.info(f'Sequence diagram saved to {self.output_path}')
+
+    def _render_plantuml(self, text: str, output_format: str):
+        if shutil.which(PLANTUML_COMMAND) is None:
+            raise RuntimeError(f"Rendering a sequence diagram as {output_format} needs '{PLANTUML_COMMAND}' on the "
+                               f"PATH, write the text with a .puml or .mmd output instead")
+        result = subprocess.run([PLANTUML_COMMAND, '-pipe', f'-t{output_format}'], input=text.encode('utf-8'),
+                                capture_output=True, check=False)
+        if result.returncode != 0:
+            raise RuntimeError(f'PlantUML failed: {result.stderr.decode("utf-8", "replace").strip()}')
+        with open(self.output_path, 'wb') as f:
+            f.write(result.stdout)
@@ -1,3 +1,7 @@
-from .data_classes import Definition, Class, Module
+from .data_classes import Definition, Class, Module, is_private_name
 from .ast_walker import AstWalker
-from .parser import Parser
+from .cache import ParseCache
+from .discovery import FileDiscovery
+from .parser import Parser, make_parser
+from .inheritance import InheritanceIndex
+from .externals import ExternalResolver, default_search_paths
@@ -1,11 +1,18 @@
 import ast
 import logging
+import sys
 from collections import defaultdict
-from typing import Tuple
+from dataclasses import dataclass
 
 from src.parser.data_classes import Definition, Class
 
-PRIVATE_INDICATORS: tuple[str, str] = ('_', '__')
+
+@dataclass
+class Scope:
+    """A class or function scope on the scope stack of the walker."""
+    name: str  # Qualified name for functions, class name for classes
+    type: str  # 'class' or 'function'
+    self_class: str = None  # Class that 'self' refers to within the scope
 
 
 def get_full_attribute_name(node):
@@ -23,29 +30,32 @@ def get_full_attribute_name(node):
         # Handle other cases (e.g., constants, literals)
         return None
 
+
+def get_base_class_name(node) -> str | None:
+    """
+    Extract the name of a base class, e.g. 'typing.Generic' for `typing.Generic[T]`.
+    Returns None for bases that are not a (subscripted) name, such as calls.
+    """
+    if isinstance(node, ast.Subscript):
+        node = node.value
+    return get_full_attribute_name(node)
+
+
 class AstWalker(ast.NodeVisitor):
     """
     Class to walk through an Abstract Syntax Tree (AST) and extract function, method,
     and class definitions along with calls.
-    """
-    def __init__(self,
-                 exclude_external: bool = True,
-                 exclude_private: bool = True):
-        """ Initializes the walker with the available settings
-        Args:
-            exclude_private: Ignore definitions and calls to private functions
-            exclude_external: Ignore calls to external functions.
-
-        """
-        self.exclude_external = exclude_external
-        self.exclude_private = exclude_private
 
+    The walker keeps all definitions and calls, including private ones. The extracted calls are not resolved,
+    since that requires the definitions of all modules, this is done by the `Parser`.
+    """
     def reset(self):
         # Initialize attributes used to store visited node information
         self.definitions = {}
-        self.calls = defaultdict(list)
+        self.calls = defaultdict(dict)
         self.imports = {}
-        self.class_stack = []
+        self.class_bases = {}  # {class name: [base class names]}
+        self.scope_stack = []
         self.module_name = None
 
     def walk(self, tree: ast.AST, module_name: str) -> [dict, defaultdict]:
@@ -56,10 +66,6 @@ class AstWalker(ast.NodeVisitor):
         self.module_name = module_name
 
         self.visit(tree)
-        if self.exclude_private:
-            self._remove_private_definitions()
-            self._remove_private_calls()
-        self._resolve_calls()
         self._resolve_classes_in_definitions()
 
         logging.debug(f'Extracted definitions and calls for module: {module_name}')
@@ -71,7 +77,6 @@ class AstWalker(ast.NodeVisitor):
         """
         class_name = node.name
         logging.debug(f"Found class definition: {class_name}")
-        self.class_stack.append(class_name)
         self.definitions[class_name] = Definition(
             name=node.name,
             type="class",
@@ -79,19 +84,32 @@ class AstWalker(ast.NodeVisitor):
             start_line=node.lineno,
             end_line=getattr(node, 'end_lineno', None),
         )
+        # `object` is a base of every class, it is left out like in most class definitions
+        self.class_bases[class_name] = [
+            name for name in map(get_base_class_name, node.bases) if name is not None and name != 'object'
+        ]
 
-        self.generic_visit(node)
-        self.class_stack.pop()
+        # Decorators, bases and keywords are evaluated in the enclosing scope
+        self._visit_nodes(node.decorator_list, node.bases, node.keywords)
+        self.scope_stack.append(Scope(name=class_name, type='class', self_class=class_name))
+        self._visit_nodes(node.body)
+        self.scope_stack.pop()
 
     def visit_FunctionDef(self, node: ast.FunctionDef):
         """
         Handle function or method definition nodes.
         """
-        if self.class_stack:
+        enclosing = self.scope_stack[-1] if self.scope_stack else None
+        if enclosing is not None and enclosing.type == 'class':
             # Method within a class
-            class_name = self.class_stack[-1]
+            class_name = enclosing.name
             func_type = 'method'
             func_name = f"{self.module_name}.{class_name}.{node.name}"
+        elif enclosing is not None:
+            # Function nested in another function
+            class_name = None
+            func_type = 'function'
+            func_name = f"{enclosing.name}.{node.name}"
         else:
             # Top-level function
             class_name = None
@@ -107,114 +125,93 @@ class AstWalker(ast.NodeVisitor):
             end_line=getattr(node, 'end_lineno', None),
         )
         logging.debug(f"Found function definition: {func_name}")
-        self._extract_calls_from_function(node, func_name, class_name=class_name)
-        self.generic_visit(node)
 
-    def _extract_calls_from_function(self, node: ast.FunctionDef, func_name: str, class_name: str = None):
+        # Decorators, defaults and annotations are evaluated in the enclosing scope, the body in the function scope
+        self._visit_nodes(node.decorator_list, [node.args], [node.returns] if node.returns else [])
+        self_class = enclosing.self_class if enclosing is not None else None
+        self.scope_stack.append(Scope(name=func_name, type='function', self_class=self_class))
+        self._visit_nodes(node.body)
+        self.scope_stack.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Call(self, node: ast.Call):
         """
-        Extract all function or method calls from a function or method body.
+        Handle call nodes, the call is assigned to the innermost enclosing function.
+
+        Calls are stored as {caller: {callee: [line numbers of the call sites]}}.
         """
-        for child_node in ast.walk(node):
-            if isinstance(child_node, ast.Call):
-                func = child_node.func
-                if isinstance(func, ast.Name):  # Simple call
-                    self.calls[func_name].append(func.id)
-                elif isinstance(func, ast.Attribute):
-                    full_name = get_full_attribute_name(func)# Object.method()
-                    if class_name: # If a class name is supplied, replace 'self' by the name of the class
-                       full_name = full_name.replace('self', class_name)
-                    self.calls[func_name].append(full_name)
+        scope = self.scope_stack[-1] if self.scope_stack else None
+        if scope is not None and scope.type == 'function':
+            func = node.func
+            callee = None
+            if isinstance(func, ast.Name):  # Simple call
+                callee = func.id
+            elif isinstance(func, ast.Attribute):
+                callee = get_full_attribute_name(func)  # Object.method()
+                if callee is not None and scope.self_class and callee.startswith('self.'):
+                    # Replace 'self' by the name of the class
+                    callee = f'{scope.self_class}{callee[len("self"):]}'
+            if callee is not None:
+                self.calls[scope.name].setdefault(sys.intern(callee), []).append(node.lineno)
+        self.generic_visit(node)
+
+    def _visit_nodes(self, *node_lists: list):
+        """Visit the nodes of the given lists in order."""
+        for nodes in node_lists:
+            for node in nodes:
+                self.visit(node)
 
     def visit_Import(self, node: ast.Import):
         """
         Handle import statements.
         """
         for alias in node.names:
-            self.imports[alias.asname or alias.name] = alias.name
-        logging.debug(f"Found import: {self.imports}")
+            name = alias.asname or alias.name
+            self.imports[name] = alias.name
+            logging.debug(f"Found import: {name} -> {alias.name}")
 
     def visit_ImportFrom(self, node: ast.ImportFrom):
         """
         Handle from-import statements.
         """
-        module = node.module
+        module = self._absolute_module_name(node.module, node.level)
         for alias in node.names:
             name = alias.asname or alias.name
             full_name = f"{module}.{alias.name}" if module else alias.name
             self.imports[name] = full_name
-        logging.debug(f"Found import from: {self.imports}")
-
-    ##Todo: move resolve to parser!
-    def _resolve_calls(self):
-        """
-        Resolve function and method calls based on imports and classify all calls.
-        """
-        logging.debug(f'Resolving calls for module {self.module_name}')
-        resolved_calls = defaultdict(list)
-        for caller, callees in self.calls.items():
-            for callee in callees:
-
-                if callee in self.imports:
-                    # Function is defined in another module
-                    callee_full_name = self.imports[callee]
-                elif '.' in callee:
-                    # Check if object called is extern or intern
-                    obj_id = '.'.join(callee.split('.')[:-1])
-                    if obj_id not in self.definitions.keys():
-                        # External function call
-                        if self.exclude_external:
-                            continue
-                        callee_full_name = callee
-                    else:
-                        # Function is defined in the current module
-                        callee_full_name = f'{self.module_name}.{callee}'
-                else:
-                    full_name = f'{self.module_name}.{callee}'
-                    if full_name in self.definitions.keys():
-                        callee_full_name = f'{self.module_name}.{callee}'
-                    else:
-                        # Std function call
-                        if self.exclude_external:
-                            continue
-                        callee_full_name = callee
-                resolved_calls[caller].append(callee_full_name)
-        self.calls = resolved_calls
-        logging.debug(f'Finished resolving calls for module {self.module_name}')
-
-    def _remove_private_definitions(self):
-        for key, definition in list(self.definitions.items()):
-            if definition.name.startswith(PRIVATE_INDICATORS):
-                self.definitions.pop(key)
-                logging.debug(f'removed private definition {definition}')
-
-    def _remove_private_calls(self):
-        for caller, callees in list(self.calls.items()):
-            # Remove private callers
-            caller_fun = caller.split('.')[-1:][0]
-            if caller_fun.startswith(PRIVATE_INDICATORS):
-                self.calls.pop(caller)
-                logging.info(f'removed private caller {caller}')
-            # Remove private callees
-            for callee in list(callees):
-                callee_fun = callee.split('.')[-1:][0]
-                if callee_fun.startswith(PRIVATE_INDICATORS):
-                    self.calls[caller].remove(callee)
-                    logging.info(f'removed private callee {callee}')
+            logging.debug(f"Found import from: {name} -> {full_name}")
 
+    def _absolute_module_name(self, module: str | None, level: int) -> str | None:
+        """
+        Convert a (relative) import to an absolute module name, e.g. `..foo` in `package.sub.bar` is `package.foo`.
+        """
+        if not level:
+            return module
+        # The package of a module is its parent, except for `__init__` modules which are the package itself
+        package = self.module_name.split('.')[:-1]
+        if level > 1:
+            package = package[:-(level - 1)]
+        return '.'.join(package + [module] if module else package) or None
 
     def _resolve_classes_in_definitions(self):
-        #Todo: fix in a different way -> Should be read in the correct format upon read..
-        definitions = self.definitions
-        classes = {node.name: node for node in definitions.values() if node.type == 'class'}
-        methods = [node for node in definitions.values() if node.type == 'method']
-
-        resolved_classes = {}
-        for class_name, definition in classes.items():
-            module = definition.module
-            methods_of_class = {method.name:  method for method in methods if method.class_name == class_name}
-            resolved_classes[class_name] = Class(name=class_name, module=module, methods=methods_of_class)
-
-        # Clean defintions
-        other_defintions = {k: v for k,v in definitions.items() if v.type not in ['method', 'class']}
-        resolved_definitions = {**other_defintions, **resolved_classes}
-        self.definitions = resolved_definitions
+        """
+        Group the methods into their classes in a single pass over the definitions.
+
+        Functions keep their order and are followed by the classes, a class is always visited before its methods.
+        """
+        functions = {}
+        classes = {}
+        for full_name, definition in self.definitions.items():
+            if definition.type == 'class':
+                classes[full_name] = Class(name=definition.name, module=definition.module, methods={},
+                                           start_line=definition.start_line, end_line=definition.end_line,
+                                           bases=self.class_bases.get(definition.name, []))
+            elif definition.type == 'method':
+                owner = classes.get(definition.class_name)
+                if owner is not None:
+                    owner.methods[definition.name] = definition
+            else:
+                functions[full_name] = definition
+        functions.update(classes)
+        self.definitions = functions
@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import os
+import pickle
+
+from src import __version__
+from src.parser.data_classes import Module
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'poseidon'
+)
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024  # bytes
+
+# Increase when the content of the parse results changes, which invalidates existing entries
+CACHE_FORMAT_VERSION = 7
+
+ENTRY_SUFFIX = '.pkl'
+STAT_INDEX_FILE = 'stat_index.pickle'
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed `Module` objects for incremental runs.
+
+    An entry is keyed on the module path, the content hash of the file, the parser options and the
+    Poseidon version. The content hash itself is remembered per file together with its mtime and size,
+    so unchanged files are not even read. Entries are refreshed on every hit, which turns evicting the
+    oldest entries into LRU eviction.
+
+    The entries are pickles that are loaded without validation, and unpickling can run arbitrary code. The cache
+    folder must therefore only be writable by the user that runs the parser: it is created with mode 0o700, and a
+    warning is logged if an existing folder is writable by others. The CLI enables the cache in `DEFAULT_CACHE_DIR`,
+    library callers opt in by passing a cache.
+    """
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_size: int = DEFAULT_CACHE_SIZE):
+        """ Initializes the cache
+
+        Args:
+            cache_dir: Folder in which the cache entries are stored, created if it does not exist. Anyone who can
+                write to it can run code in the parser, see above
+            max_size: Maximum total size of the cache entries in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        if os.stat(cache_dir).st_mode & 0o022:
+            logging.warning(f'The parse cache {cache_dir} is writable by other users, who can run code through it')
+        self.stat_index = self._load_stat_index()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, file_path: str, module_name: str, options: tuple = ()) -> str:
+        """
+        Compute the cache key of a file.
+
+        Args:
+            file_path: The path to the Python file
+            module_name: The module name of the file relative to the parsed folder
+            options: Parser options that influence the parse result
+        """
+        stat = os.stat(file_path)
+        abs_path = os.path.abspath(file_path)
+        cached_stat = self.stat_index.get(abs_path)
+        if cached_stat is not None and cached_stat[:2] == (stat.st_mtime_ns, stat.st_size):
+            content_hash = cached_stat[2]
+        else:
+            with open(file_path, 'rb') as f:
+                content_hash = hashlib.sha256(f.read()).hexdigest()
+        key = self.content_key(content_hash, module_name, options)
+        # The key is remembered so the eviction can drop the stat of a file together with its entry
+        self.stat_index[abs_path] = (stat.st_mtime_ns, stat.st_size, content_hash, key)
+        return key
+
+    @staticmethod
+    def content_key(content_hash: str, module_name: str, options: tuple = ()) -> str:
+        """
+        Compute the cache key of a file from a hash of its content, e.g. the blob id of a git object.
+
+        Args:
+            content_hash: Hash of the content of the file
+            module_name: The module name of the file relative to the parsed folder
+            options: Parser options that influence the parse result
+        """
+        # The module name is used rather than the absolute path, so checkouts at other locations can share a cache
+        key_source = repr((__version__, CACHE_FORMAT_VERSION, module_name, content_hash, tuple(options)))
+        return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._entry_path(key))
+
+    def load(self, key: str) -> Module | None:
+        """Load the module stored under `key`, returns None if there is no (valid) entry."""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                module = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logging.warning(f'Removing unreadable cache entry {entry_path}: {e}')
+            self._remove(entry_path)
+            self.misses += 1
+            return None
+        # Mark the entry as recently used
+        os.utime(entry_path)
+        self.hits += 1
+        return module
+
+    def store(self, key: str, module: Module):
+        """Store a parsed module under `key`."""
+        entry_path = self._entry_path(key)
+        tmp_path = f'{entry_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(module, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
+
+    def flush(self):
+        """Evict the least recently used entries above the size limit and persist the stat index."""
+        self._evict()
+        self._save_stat_index()
+        logging.info(f'Parse cache: {self.hits} hits, {self.misses} misses')
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(ENTRY_SUFFIX) or entry.name == STAT_INDEX_FILE:
+                self._remove(entry.path)
+        self.stat_index = {}
+
+    def _evict(self):
+        entries = [
+            (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.cache_dir) if entry.name.endswith(ENTRY_SUFFIX)
+        ]
+        total_size = sum(size for _, size, _ in entries)
+        if total_size > self.max_size:
+            entries.sort()
+            for _, size, path in entries:
+                if total_size <= self.max_size:
+                    break
+                self._remove(path)
+                total_size -= size
+                logging.debug(f'Evicted cache entry {path}')
+        self._prune_stat_index()
+
+    def _prune_stat_index(self):
+        """Drop the stats of files whose entry was evicted, or that no longer exist, so the index stays bounded."""
+        stored = {entry.name[:-len(ENTRY_SUFFIX)] for entry in os.scandir(self.cache_dir)
+                  if entry.name.endswith(ENTRY_SUFFIX)}
+        stale = [
+            path for path, cached_stat in self.stat_index.items()
+            # Stats of an older version of the index have no key
+            if len(cached_stat) < 4 or cached_stat[3] not in stored or not os.path.exists(path)
+        ]
+        for path in stale:
+            del self.stat_index[path]
+        if stale:
+            logging.debug(f'Dropped {len(stale)} stale entries of the stat index')
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ENTRY_SUFFIX)
+
+    def _load_stat_index(self) -> dict[str, tuple[int, int, str]]:
+        try:
+            with open(os.path.join(self.cache_dir, STAT_INDEX_FILE), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning(f'Ignoring unreadable stat index of the parse cache: {e}')
+            return {}
+
+    def _save_stat_index(self):
+        index_path = os.path.join(self.cache_dir, STAT_INDEX_FILE)
+        tmp_path = f'{index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.stat_index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
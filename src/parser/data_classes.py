@@ -1,8 +1,15 @@
 from collections import defaultdict
 from dataclasses import dataclass, field
 
+PRIVATE_INDICATORS: tuple[str, str] = ('_', '__')
 
-@dataclass
+
+def is_private_name(name: str) -> bool:
+    """Check if the last part of a (qualified) name is private, e.g. `module.Class._method`."""
+    return name.rpartition('.')[2].startswith(PRIVATE_INDICATORS)
+
+
+@dataclass(slots=True)
 class Definition:
     """Represents a function, method, or class definition."""
     name: str
@@ -17,13 +24,17 @@ class Definition:
 class Module:
     """Represents a parsed Python module."""
     definitions: dict[str, Definition] = field(default_factory=dict)  # {qualified_name: Definition}
-    calls: defaultdict[str, list[str]] = field(default_factory=lambda: defaultdict(list))  # {caller: [callees]}
+    # {caller: {callee: [line numbers of the call sites]}}, the number of calls is the number of lines
+    calls: defaultdict[str, dict[str, list[int]]] = field(default_factory=lambda: defaultdict(dict))
     imports: dict[str, str] = field(default_factory=dict)  # {imported_name: original_module}
 
 
-@dataclass
+@dataclass(slots=True)
 class Class:
     """Represents a function, method, or class definition."""
     name: str
     module: str
     methods: dict[str, Definition] = None
+    start_line: int = None
+    end_line: int = None
+    bases: list[str] = None  # Names of the base classes as written, e.g. 'abc.ABC', see `InheritanceIndex`
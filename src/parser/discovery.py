@@ -0,0 +1,242 @@
+import logging
+import os
+import re
+
+# Directories that never contain source code of the parsed project, in .gitignore syntax. `build` and `dist` are
+# only excluded at the top level, where they hold build output instead of a package with that name, and so is
+# `venv`, which is also the name of a standard library package.
+DEFAULT_EXCLUDES: tuple[str, ...] = (
+    '.git/', '.hg/', '.svn/', '__pycache__/', '.venv/', '/venv/', 'node_modules/', '.tox/', '.nox/',
+    '.mypy_cache/', '.pytest_cache/', '.ruff_cache/', '*.egg-info/', '/build/', '/dist/',
+)
+
+GITIGNORE_FILE = '.gitignore'
+
+
+class IgnoreRule:
+    """A single pattern in .gitignore syntax, relative to the directory `base` ('' for the parsed folder)."""
+    __slots__ = ('pattern', 'base', 'negate', 'dir_only', 'name', 'regex')
+
+    def __init__(self, pattern: str, base: str = ''):
+        self.pattern = pattern
+        self.base = base
+        self.negate = pattern.startswith('!')
+        if self.negate:
+            pattern = pattern[1:]
+        elif pattern.startswith('\\'):
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+
+        # A pattern with a slash before its end is relative to its base, other patterns match names at any depth
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+        # Patterns without wildcards are compared with the name directly, which is much faster than a regex
+        self.name = pattern if not anchored and not any(c in pattern for c in '*?[\\') else None
+        prefix = '' if anchored else '(?:.*/)?'
+        self.regex = re.compile(prefix + _translate(pattern) + r'\Z', re.DOTALL)
+
+    def matches(self, path: str, name: str, is_dir: bool) -> bool:
+        """Whether the rule matches the file or directory `path`, relative to the parsed folder."""
+        if self.dir_only and not is_dir:
+            return False
+        if self.name is not None:
+            return name == self.name
+        if self.base:
+            if not path.startswith(self.base + '/'):
+                return False
+            path = path[len(self.base) + 1:]
+        return self.regex.match(path) is not None
+
+    def __repr__(self):
+        return f'IgnoreRule({self.pattern!r}, base={self.base!r})'
+
+
+def _translate(pattern: str) -> str:
+    """Translate a .gitignore glob into a regex, `*` and `?` do not match a slash and `**` matches any depth."""
+    regex = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**/', i):
+                regex.append('(?:.*/)?')
+                i += 3
+                continue
+            if pattern.startswith('**', i):
+                regex.append('.*')
+                i += 2
+                continue
+            regex.append('[^/]*')
+        elif c == '?':
+            regex.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                regex.append(re.escape(c))
+            else:
+                characters = pattern[i + 1:end]
+                if characters.startswith('!'):
+                    characters = '^' + characters[1:]
+                regex.append('[' + characters.replace('\\', '\\\\') + ']')
+                i = end
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            regex.append(re.escape(pattern[i]))
+        else:
+            regex.append(re.escape(c))
+        i += 1
+    return ''.join(regex)
+
+
+def parse_ignore_patterns(lines, base: str = '') -> list[IgnoreRule]:
+    """Parse the lines of a .gitignore file, skipping blank lines and comments."""
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n').rstrip('\r')
+        if not line.endswith('\\ '):
+            line = line.rstrip(' ')
+        if not line or line.startswith('#'):
+            continue
+        rules.append(IgnoreRule(line, base))
+    return rules
+
+
+class FileDiscovery:
+    """
+    Finds the Python files in a folder with `os.scandir`.
+
+    Ignored directories are pruned before they are entered, so large trees such as virtual environments and
+    `node_modules` are never listed. A path is ignored if the last matching rule of the default excludes, the
+    .gitignore files (of the folder and of every sub-folder) and the `exclude` patterns ignores it, in that order
+    of precedence. If `include` patterns are given, only files that match one of them are kept.
+    """
+    def __init__(
+            self,
+            include: list[str] = None,
+            exclude: list[str] = None,
+            use_gitignore: bool = True,
+            default_excludes: tuple[str, ...] = DEFAULT_EXCLUDES
+    ):
+        """Initialize the discovery.
+
+        Args:
+            include: Patterns in .gitignore syntax of the files to parse, all Python files by default
+            exclude: Patterns in .gitignore syntax of files and directories to skip
+            use_gitignore: Apply the rules of the .gitignore files in the folder
+            default_excludes: Patterns that are always skipped unless re-included with a negated pattern
+        """
+        self.include = parse_ignore_patterns(include or [])
+        self.exclude = parse_ignore_patterns(exclude or [])
+        self.use_gitignore = use_gitignore
+        self.default_excludes = parse_ignore_patterns(default_excludes)
+
+    def discover(self, folder_path: str, directories: list[str] = None) -> list[tuple[str, str]]:
+        """
+        Find the Python files in a folder.
+
+        Args:
+            folder_path: The folder to search
+            directories: Optional list to which the paths of all directories that are not ignored are appended
+
+        Returns:
+            A list of (file_path, module_name) jobs, sorted by module name.
+        """
+        jobs = []
+        # Stack of (directory path, path relative to the folder, .gitignore rules that apply in the directory)
+        stack = [(folder_path, '', self.default_excludes)]
+        while stack:
+            directory, relative_directory, rules = stack.pop()
+            if directories is not None:
+                directories.append(directory)
+            try:
+                entries = list(os.scandir(directory))
+            except OSError as e:
+                logging.warning(f'Cannot list {directory}: {e}')
+                continue
+
+            if self.use_gitignore and any(entry.name == GITIGNORE_FILE for entry in entries):
+                rules = rules + self._read_gitignore(os.path.join(directory, GITIGNORE_FILE), relative_directory)
+            prefix = relative_directory + '/' if relative_directory else ''
+            for entry in entries:
+                name = entry.name
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if not is_dir and not name.endswith('.py'):
+                    continue
+                relative_path = prefix + name
+                if self._ignored(relative_path, name, is_dir, rules):
+                    continue
+                if is_dir:
+                    stack.append((entry.path, relative_path, rules))
+                elif entry.is_file() and self._included(relative_path, name):
+                    jobs.append((entry.path, relative_path.replace('/', '.')))
+
+        jobs.sort(key=lambda job: job[1])
+        logging.debug(f'Discovered {len(jobs)} files in {folder_path}')
+        return jobs
+
+    def select(self, paths: list[str]) -> list[str]:
+        """
+        Select the Python files that are not ignored among paths relative to the folder, e.g. the files in a git tree.
+
+        .gitignore files are not read, the paths are expected to be tracked files.
+
+        Args:
+            paths: Paths relative to the folder, separated by slashes
+
+        Returns:
+            The selected paths, in the order of `paths`.
+        """
+        ignored_directories = {'': False}
+
+        def is_ignored_directory(directory: str) -> bool:
+            if directory not in ignored_directories:
+                parent, _, name = directory.rpartition('/')
+                ignored_directories[directory] = (
+                    is_ignored_directory(parent) or self._ignored(directory, name, True, self.default_excludes)
+                )
+            return ignored_directories[directory]
+
+        selected = []
+        for path in paths:
+            directory, _, name = path.rpartition('/')
+            if (name.endswith('.py') and not is_ignored_directory(directory)
+                    and not self._ignored(path, name, False, self.default_excludes) and self._included(path, name)):
+                selected.append(path)
+        return selected
+
+    def options(self) -> tuple:
+        """The patterns that determine which files are discovered, e.g. to tell apart cached results."""
+        return (
+            tuple(rule.pattern for rule in self.include),
+            tuple(rule.pattern for rule in self.exclude),
+            tuple(rule.pattern for rule in self.default_excludes),
+            self.use_gitignore,
+        )
+
+    def _ignored(self, path: str, name: str, is_dir: bool, rules: list[IgnoreRule]) -> bool:
+        for rule in reversed(self.exclude):
+            if rule.matches(path, name, is_dir):
+                return not rule.negate
+        for rule in reversed(rules):
+            if rule.matches(path, name, is_dir):
+                return not rule.negate
+        return False
+
+    def _included(self, path: str, name: str) -> bool:
+        if not self.include:
+            return True
+        included = False
+        for rule in self.include:
+            if rule.matches(path, name, is_dir=False):
+                included = not rule.negate
+        return included
+
+    @staticmethod
+    def _read_gitignore(path: str, base: str) -> list[IgnoreRule]:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                return parse_ignore_patterns(f, base)
+        except OSError as e:
+            logging.warning(f'Cannot read {path}: {e}')
+            return []
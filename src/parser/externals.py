@@ -0,0 +1,272 @@
+import glob
+import logging
+import os
+import site
+import sysconfig
+from importlib.machinery import ModuleSpec, PathFinder
+
+from src.parser.data_classes import Class, Definition, Module
+from src.parser.parser import Parser
+from src.parser.symbol_index import MAX_ALIAS_HOPS, SymbolIndex
+
+# Default number of levels of calls that are followed into external packages
+DEFAULT_EXTERNAL_DEPTH = 1
+# Virtual environments inside the parsed folder whose packages are searched as well
+LOCAL_VIRTUAL_ENVIRONMENTS: tuple[str, ...] = ('.venv', 'venv', 'env')
+
+
+def default_search_paths(folder_path: str = None) -> list[str]:
+    """
+    The site-packages folders of the running interpreter, and of virtual environments inside `folder_path`.
+
+    The standard library is not included, pass its folder as an extra root to follow calls into it.
+    """
+    paths = []
+    if folder_path is not None:
+        for environment in LOCAL_VIRTUAL_ENVIRONMENTS:
+            paths += sorted(glob.glob(os.path.join(folder_path, environment, 'lib', 'python*', 'site-packages')))
+            paths += glob.glob(os.path.join(folder_path, environment, 'Lib', 'site-packages'))
+    paths += site.getsitepackages() if hasattr(site, 'getsitepackages') else []
+    paths += [site.getusersitepackages(), sysconfig.get_paths()['purelib'], sysconfig.get_paths()['platlib']]
+    unique_paths = []
+    for path in paths:
+        if os.path.isdir(path) and path not in unique_paths:
+            unique_paths.append(path)
+    return unique_paths
+
+
+class ExternalResolver:
+    """
+    Follows calls to external functions into the source of installed packages, parsing modules only on demand.
+
+    A called name such as `requests.get` is located with `importlib.machinery.PathFinder` on the search paths,
+    without importing anything. Only the module that holds the name is parsed, and the modules it re-exports the
+    name from, e.g. `requests.api` for `requests.get`. The called definitions are added to the graph as modules
+    of their own, and the calls they make are followed up to `depth` levels. Every module is located and parsed
+    at most once per resolver, and through the parse cache of the parser at most once across runs.
+    """
+    def __init__(self, parser: Parser = None, search_paths: list[str] = None, depth: int = DEFAULT_EXTERNAL_DEPTH):
+        """Initialize the resolver.
+
+        Args:
+            parser: Parser used for parsing the external modules, its cache memoizes them across runs
+            search_paths: Folders in which packages are located, by default `default_search_paths()`
+            depth: Number of levels of calls that are followed, 1 only adds the functions called by the parsed
+                folder, 2 also the functions they call, and so on
+        """
+        self.parser = parser if parser is not None else Parser()
+        self.search_paths = search_paths if search_paths is not None else default_search_paths()
+        self.depth = depth
+        self.index = SymbolIndex({})
+        self.modules: dict[str, Module] = {}  # {module file name: parsed module with unresolved calls}
+        self._specs: dict[str, ModuleSpec | None] = {}
+        self._resolved: dict[str, str | None] = {}
+
+    def expand(self, modules: dict[str, Module]) -> dict[str, Module]:
+        """
+        Resolve the external calls of the parsed modules and add the definitions they reach.
+
+        Args:
+            modules: The parsed modules with resolved calls, see `Parser.resolve`
+
+        Returns:
+            The modules with calls to located external definitions renamed to their qualified name, followed by
+            a module for every external module that is reached, holding only the reached definitions.
+        """
+        defined = _definition_names(modules)
+        reached: dict[str, int] = {}  # {qualified name of an external definition: level}
+        expanded = {}
+        for module_name, module in modules.items():
+            calls = self._rename_calls(module.calls, module.imports, defined)
+            for callees in calls.values():
+                for callee in callees:
+                    if callee not in defined and callee in self.index.definitions:
+                        reached.setdefault(callee, 1)
+            expanded[module_name] = Module(definitions=module.definitions, calls=calls, imports=module.imports)
+
+        # Breadth-first over the levels, the calls of every reached definition are resolved once
+        external_calls = {}
+        frontier = list(reached)
+        for level in range(2, self.depth + 2):
+            next_frontier = []
+            for full_name in frontier:
+                # The calls of the deepest level are only linked to modules that are parsed already
+                calls = self._calls_of(full_name, defined, load=level <= self.depth)
+                external_calls[full_name] = calls
+                if level > self.depth:
+                    continue
+                for callee in calls:
+                    if callee not in defined and callee in self.index.definitions and callee not in reached:
+                        reached[callee] = level
+                        next_frontier.append(callee)
+            frontier = next_frontier
+
+        for module_file, module in self._reached_modules(reached, external_calls).items():
+            if module_file in expanded:
+                logging.warning(f'External module {module_file} has the name of a parsed module, it is skipped')
+                continue
+            expanded[module_file] = module
+        logging.info(f'Followed external calls into {len(reached)} definitions of {len(self.modules)} modules')
+        return expanded
+
+    def resolve(self, name: str) -> str | None:
+        """
+        The qualified name of the external definition a called name refers to, locating and parsing its module.
+
+        A call of a class resolves to its constructor if it has one. Returns None if the name cannot be located,
+        e.g. built-in functions, names of the standard library and modules that are not written in Python.
+        """
+        if name not in self._resolved:
+            self._resolved[name] = self._resolve(name)
+        return self._resolved[name]
+
+    def _resolve(self, name: str) -> str | None:
+        for _ in range(MAX_ALIAS_HOPS):
+            if not self._load_module_of(name):
+                return None
+            full_name = self._lookup(name)
+            if full_name is not None:
+                return full_name
+            # The name may be re-exported from a module that is not parsed yet, e.g. `requests.get`
+            imported_name = self._exported_name(name)
+            if imported_name is None or imported_name == name:
+                return None
+            name = imported_name
+        return None
+
+    def _lookup(self, name: str) -> str | None:
+        """Look up a name in the modules that are parsed already, a class resolves to its constructor."""
+        full_name = self.index.lookup(name)
+        if full_name is not None and isinstance(self.index.definitions[full_name], Class):
+            constructor = f'{full_name}.__init__'
+            return constructor if constructor in self.index.definitions else full_name
+        return full_name
+
+    def _exported_name(self, name: str) -> str | None:
+        """The name that an imported name refers to, following the import of its longest imported prefix."""
+        parts = name.split('.')
+        for i in range(len(parts), 0, -1):
+            prefix = '.'.join(parts[:i])
+            if prefix in self.index.exports:
+                return '.'.join([self.index.exports[prefix]] + parts[i:])
+        return None
+
+    def _load_module_of(self, name: str) -> bool:
+        """Parse the deepest module that a name can be inside of, returns False if none can be located."""
+        parts = name.split('.')
+        spec = None
+        module_name = None
+        # The last part is the called name itself
+        for i in range(1, len(parts)):
+            candidate = self._find_spec('.'.join(parts[:i]), spec)
+            if candidate is None:
+                break
+            spec, module_name = candidate, '.'.join(parts[:i])
+        if spec is None or not (spec.origin or '').endswith('.py'):
+            return False
+
+        is_package = os.path.basename(spec.origin) == '__init__.py'
+        module_file = f'{module_name}.__init__.py' if is_package else f'{module_name}.py'
+        if module_file not in self.modules:
+            module = self.parser.parse_files([(spec.origin, module_file)])[module_file]
+            self.modules[module_file] = module
+            self.index.add_module(module_file.removesuffix('.py'), module)
+            logging.debug(f'Parsed external module {module_file} from {spec.origin}')
+        return True
+
+    def _find_spec(self, module_name: str, parent: ModuleSpec | None) -> ModuleSpec | None:
+        if module_name not in self._specs:
+            if parent is None:
+                path = self.search_paths
+            else:
+                path = parent.submodule_search_locations
+            try:
+                self._specs[module_name] = PathFinder.find_spec(module_name, path) if path is not None else None
+            except (ImportError, ValueError):
+                self._specs[module_name] = None
+        return self._specs[module_name]
+
+    def _rename_calls(
+            self, calls: dict[str, dict[str, list[int]]], imports: dict[str, str], defined: set[str], load: bool = True
+    ) -> dict:
+        """
+        The calls with the callees that are not defined in the parsed folder resolved to external definitions.
+
+        Only callees that start with an imported name are resolved, others such as `loader.load` on a local variable
+        could otherwise be mistaken for an installed package of the same name. With `load` unset, no modules are
+        located or parsed and callees in modules that are not parsed yet keep their name.
+        """
+        imported_names = set(imports.values())
+        renamed = {}
+        for caller, callees in calls.items():
+            renamed_callees = renamed[caller] = {}
+            for callee, lines in callees.items():
+                if callee not in defined and _starts_with_any(callee, imported_names):
+                    callee = (self.resolve(callee) if load else self._lookup(callee)) or callee
+                if callee in renamed_callees:
+                    renamed_callees[callee] = sorted(renamed_callees[callee] + lines)
+                else:
+                    renamed_callees[callee] = lines
+        return renamed
+
+    def _calls_of(self, full_name: str, defined: set[str], load: bool = True) -> dict[str, list[int]]:
+        """The resolved calls made by an external definition."""
+        definition = self.index.definitions[full_name]
+        module_file = f'{definition.module}.py'
+        module = self.modules[module_file]
+        if full_name not in module.calls:
+            return {}
+        caller_only = Module(definitions=module.definitions, calls={full_name: module.calls[full_name]},
+                             imports=module.imports)
+        resolved = self.parser.resolve_module(self.index, module_file, caller_only)
+        return self._rename_calls(resolved.calls, module.imports, defined, load=load)[full_name]
+
+    def _reached_modules(self, reached: dict[str, int], calls: dict[str, dict]) -> dict[str, Module]:
+        """Modules with only the reached definitions of every external module, in the order they were parsed."""
+        by_module: dict[str, Module] = {}
+        for full_name in reached:
+            definition = self.index.definitions[full_name]
+            module_file = f'{definition.module}.py'
+            module = by_module.setdefault(module_file, Module())
+            if isinstance(definition, Definition) and definition.type == 'method':
+                owner = self.index.definitions[full_name.rpartition('.')[0]]
+                class_copy = module.definitions.setdefault(owner.name, Class(
+                    name=owner.name, module=owner.module, methods={}, start_line=owner.start_line,
+                    end_line=owner.end_line, bases=owner.bases
+                ))
+                class_copy.methods[definition.name] = definition
+            elif isinstance(definition, Class):
+                module.definitions.setdefault(definition.name, Class(
+                    name=definition.name, module=definition.module, methods={}, start_line=definition.start_line,
+                    end_line=definition.end_line, bases=definition.bases
+                ))
+            else:
+                module.definitions[full_name] = definition
+            module.calls[full_name] = calls.get(full_name, {})
+        return {module_file: by_module[module_file] for module_file in self.modules if module_file in by_module}
+
+
+def _starts_with_any(name: str, prefixes: set[str]) -> bool:
+    """Whether a dotted name is one of the prefixes or inside of one."""
+    if name in prefixes:
+        return True
+    end = name.rfind('.')
+    while end > 0:
+        if name[:end] in prefixes:
+            return True
+        end = name.rfind('.', 0, end)
+    return False
+
+
+def _definition_names(modules: dict[str, Module]) -> set[str]:
+    """The qualified names of all definitions of the parsed modules, like the nodes of a `CompactGraph`."""
+    names = set()
+    for module in modules.values():
+        for full_name, definition in module.definitions.items():
+            if isinstance(definition, Class):
+                class_name = f'{definition.module}.{definition.name}'
+                names.add(class_name)
+                names.update(f'{class_name}.{method}' for method in definition.methods)
+            else:
+                names.add(full_name)
+    return names
@@ -0,0 +1,172 @@
+import logging
+from collections import Counter
+
+from src.parser.data_classes import Class, Module
+
+
+class InheritanceIndex:
+    """
+    Base classes, method resolution orders (MRO) and inherited methods of the classes of a `SymbolIndex`.
+
+    The bases of a class are recorded as written when its module is added to the symbol index, and looked up on
+    first use, since a base class may be defined in a module that is added later. The MRO of a class is computed
+    once with C3 linearization from the MROs of its bases, so the MROs of all classes take time linear in their
+    total length rather than in the number of classes times the depth of the hierarchy. Bases that are not defined
+    in the parsed folder are external: they end the MRO, without bases of their own.
+    """
+    def __init__(self, index):
+        """Initialize the index.
+
+        Args:
+            index: The `SymbolIndex` that base class names are looked up in
+        """
+        self.index = index
+        self.declared_bases: dict[str, list[tuple[str, str]]] = {}  # {class: [(name to look up, external name)]}
+        self._bases: dict[str, list[str]] = {}
+        self._mros: dict[str, list[str]] = {}
+        self._methods: dict[tuple[str, str], str | None] = {}
+
+    def add_class(self, class_name: str, definition: Class, module_name: str, imports: dict[str, str]):
+        """Record the bases of a class, as the names they are looked up by later."""
+        declared = []
+        for base in definition.bases or ():
+            head, _, attribute = base.partition('.')
+            if head in imports:
+                imported_name = imports[head] + (f'.{attribute}' if attribute else '')
+                declared.append((imported_name, imported_name))
+            else:
+                declared.append((f'{module_name}.{base}', base))
+        self.declared_bases[class_name] = declared
+
+    def clear(self):
+        """Forget the resolved bases, e.g. after a module is added to the symbol index."""
+        self._bases.clear()
+        self._mros.clear()
+        self._methods.clear()
+
+    def is_class(self, name: str) -> bool:
+        """Whether a qualified name is a class in the parsed folder."""
+        return isinstance(self.index.definitions.get(name), Class)
+
+    def bases(self, class_name: str) -> list[str]:
+        """The qualified names of the base classes of a class, external bases keep their (imported) name."""
+        if class_name not in self._bases:
+            bases = []
+            for name, external_name in self.declared_bases.get(class_name, ()):
+                full_name = self.index.lookup(name)
+                bases.append(full_name if full_name is not None and self.is_class(full_name) else external_name)
+            self._bases[class_name] = bases
+        return self._bases[class_name]
+
+    def mro(self, class_name: str) -> list[str]:
+        """
+        The method resolution order of a class, starting with the class itself.
+
+        The MROs of the bases are computed first, iteratively so deep hierarchies do not hit the recursion limit.
+        A base that inherits from the class itself, which is only possible with unresolved or shadowed names, is
+        left out.
+        """
+        if class_name in self._mros:
+            return self._mros[class_name]
+        stack = [(class_name, iter(self.bases(class_name)))]
+        on_stack = {class_name}
+        while stack:
+            current, bases = stack[-1]
+            for base in bases:
+                if base not in self._mros and base not in on_stack and self.is_class(base):
+                    on_stack.add(base)
+                    stack.append((base, iter(self.bases(base))))
+                    break
+            else:
+                stack.pop()
+                on_stack.discard(current)
+                self._mros[current] = self._linearize(current)
+        return self._mros[class_name]
+
+    def resolve_method(self, class_name: str | None, method: str) -> str | None:
+        """
+        The qualified name of the method that `class_name.method` refers to.
+
+        Returns:
+            The method of the first class in the MRO that defines it, None if the class is not in the parsed folder
+            or no class of its MRO in the parsed folder defines the method.
+        """
+        if class_name is None or not self.is_class(class_name):
+            return None
+        key = (class_name, method)
+        if key not in self._methods:
+            candidates = (f'{owner}.{method}' for owner in self.mro(class_name))
+            self._methods[key] = next((name for name in candidates if name in self.index.definitions), None)
+        return self._methods[key]
+
+    def methods(self, class_name: str) -> dict[str, str]:
+        """{method name: qualified name} of the methods of a class, including the inherited ones."""
+        methods = {}
+        for owner in reversed(self.mro(class_name)):
+            if self.is_class(owner):
+                methods.update(
+                    (name, f'{owner}.{name}') for name in self.index.definitions[owner].methods
+                )
+        return methods
+
+    def class_calls(self, module_name: str, module: Module) -> dict[str, dict[str, int]]:
+        """
+        The resolved calls of the methods of every class of a module, grouped by class.
+
+        Calls to methods are grouped by the class that defines the method, other calls keep their name.
+
+        Returns:
+            {qualified class name: {called class or function: number of calls}}
+        """
+        grouped = {}
+        for definition in module.definitions.values():
+            if not isinstance(definition, Class):
+                continue
+            class_name = f'{module_name}.{definition.name}'
+            calls = grouped[class_name] = {}
+            for method in definition.methods.values():
+                for callee, lines in module.calls.get(f'{class_name}.{method.name}', {}).items():
+                    callee_definition = self.index.definitions.get(callee)
+                    if getattr(callee_definition, 'type', None) == 'method':
+                        callee = callee.rpartition('.')[0]
+                    calls[callee] = calls.get(callee, 0) + len(lines)
+        return grouped
+
+    def _linearize(self, class_name: str) -> list[str]:
+        """The C3 linearization of a class whose bases have an MRO already, bases in a cycle are left out."""
+        bases = [base for base in self.bases(class_name) if base in self._mros or not self.is_class(base)]
+        if len(bases) < len(self.bases(class_name)):
+            logging.debug(f'Ignoring cyclic bases of {class_name}')
+        sequences = [self._mros.get(base, [base]) for base in bases] + [bases]
+        merged = _c3_merge(sequences)
+        if merged is None:
+            # Python rejects such a class, fall back to a depth-first order without duplicates
+            logging.debug(f'No consistent MRO for {class_name}')
+            merged = list(dict.fromkeys(name for sequence in sequences for name in sequence))
+        return [class_name] + merged
+
+
+def _c3_merge(sequences: list[list[str]]) -> list[str] | None:
+    """
+    Merge the MROs of the bases and the list of bases, None if there is no consistent order.
+
+    Every name counts the sequences it is in the tail of, so a head can be taken once the count is zero, which makes
+    the merge linear in the total length of the sequences times the number of bases.
+    """
+    positions = [0] * len(sequences)
+    in_tails = Counter(name for sequence in sequences for name in sequence[1:])
+    merged = []
+    while True:
+        head = None
+        for sequence, position in zip(sequences, positions):
+            if position < len(sequence) and in_tails[sequence[position]] == 0:
+                head = sequence[position]
+                break
+        if head is None:
+            return merged if all(position == len(seq) for seq, position in zip(sequences, positions)) else None
+        merged.append(head)
+        for i, sequence in enumerate(sequences):
+            if positions[i] < len(sequence) and sequence[positions[i]] == head:
+                positions[i] += 1
+                if positions[i] < len(sequence):
+                    in_tails[sequence[positions[i]]] -= 1
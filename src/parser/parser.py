@@ -1,43 +1,295 @@
 import os
 import ast
 import logging
+import sys
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 
 from src.parser.ast_walker import AstWalker
-from src.parser.data_classes import Module
+from src.parser.cache import DEFAULT_CACHE_SIZE, ParseCache
+from src.parser.data_classes import Class, Module
+from src.parser.discovery import FileDiscovery
+from src.parser.symbol_index import SymbolIndex
+from src.stats import FileStats, RunStats, phase
+
+# Below this number of files per worker, the start-up cost of a process pool outweighs its gain
+MIN_FILES_PER_WORKER = 50
+
+# Parser used inside a worker process, created once per process by `_init_worker`
+_worker_parser = None
+
+
+def _init_worker():
+    """Create the parser that is reused for all files handled by a worker process."""
+    global _worker_parser
+    _worker_parser = Parser()
+
+
+def _parse_file_in_worker(job: tuple[str, str]) -> tuple[Module, FileStats]:
+    """Parse a single (file_path, module_name) job inside a worker process."""
+    file_path, module_name = job
+    return _worker_parser.parse_file_with_stats(file_path, module_name)
 
 
 class Parser:
     def __init__(
              self,
-             exclude_private: bool = False,
-             exclude_external: bool = False,
+             workers: int = 1,
+             cache: ParseCache = None,
+             stats: RunStats = None,
+             discovery: FileDiscovery = None,
         ):
         """Initialize the parser with a folder path.
 
+        The parser keeps all definitions and calls, private definitions and external calls are filtered when
+        a graph is built, see `CompactGraph.filter`.
+
         Args:
-            exclude_external: exclude calls to external functions from parsed results
-            exclude_private: exclude private calls from parsed results
+            workers: number of processes used to parse a folder, values below 1 use all available cores
+            cache: optional cache from which unchanged files are loaded instead of parsed
+            stats: optional `RunStats` that collects the time of every phase and file
+            discovery: finds the files to parse in a folder, by default all Python files that are not ignored
+                by a .gitignore file or `DEFAULT_EXCLUDES`
         """
-        self.ast_walker = AstWalker(exclude_private=exclude_private, exclude_external=exclude_external)
+        self.workers = workers if workers >= 1 else (os.cpu_count() or 1)
+        self.cache = cache
+        self.stats = stats
+        self.discovery = discovery if discovery is not None else FileDiscovery()
+        self.ast_walker = AstWalker()
+        # The index of the modules resolved last, see `resolve`, e.g. to build a class diagram without indexing again
+        self.index: SymbolIndex = None
 
     def parse_folder(self, folder_path) -> dict[str, Module]:
         """
         Parse all Python files in the folder and store results in `parse_results`.
 
+        Files are parsed in sorted order, so the returned modules are ordered deterministically
+        regardless of the number of workers. After parsing, the calls of all modules are resolved
+        against a repository-wide `SymbolIndex`, which is kept in `index`.
+
         Args:
             folder_path (str): The path to the folder containing Python files.
         """
         logging.info(f'Starting to parse folder: {folder_path}')
-        modules = {}
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                if file.endswith('.py'):
-                    file_path = os.path.join(root, file)
-                    module_name = os.path.relpath(file_path, folder_path).replace('\\', '.')
-                    logging.info(f'Parsing module: {module_name}')
-                    modules[module_name] = self.parse_file(file_path, module_name)
+        with phase(self.stats, 'discover'):
+            jobs = self.discover_files(folder_path)
+        with phase(self.stats, 'parse'):
+            modules = self.parse_files(jobs)
         logging.info('Finished parsing folder')
-        return modules
+        with phase(self.stats, 'resolve'):
+            return self.resolve(modules, root_package=self.root_package(folder_path))
+
+    def discover_files(self, folder_path) -> list[tuple[str, str]]:
+        """
+        Find the Python files in a folder, see `FileDiscovery`.
+
+        Returns:
+            A list of (file_path, module_name) jobs, sorted by module name.
+        """
+        return self.discovery.discover(folder_path)
+
+    def parse_files(self, jobs: list[tuple[str, str]]) -> dict[str, Module]:
+        """
+        Parse the files of a list of (file_path, module_name) jobs, without resolving the calls.
+
+        Returns:
+            The parsed modules keyed by module name, in the order of the jobs.
+        """
+        return dict(self.iter_parse_files(jobs))
+
+    def iter_parse_files(self, jobs: list[tuple[str, str]]) -> Iterator[tuple[str, Module]]:
+        """
+        Parse the files of a list of jobs like `parse_files`, yielding (module_name, module) in the order of the jobs.
+
+        Cached modules are loaded when it is their turn, and files are parsed one by one or by worker processes that
+        run ahead, so the caller decides how many modules are kept in memory.
+        """
+        # Unchanged files are loaded from the cache, only the remaining files need to be parsed
+        keys = [None] * len(jobs)
+        cached = [False] * len(jobs)
+        if self.cache is not None:
+            for i, (file_path, module_name) in enumerate(jobs):
+                keys[i] = self.cache.key(file_path, module_name)
+                cached[i] = keys[i] in self.cache
+        missing_jobs = [job for job, is_cached in zip(jobs, cached) if not is_cached]
+        if self.cache is not None:
+            self.cache.misses += len(missing_jobs)
+
+        workers = self._effective_workers(len(missing_jobs))
+        if workers > 1:
+            logging.info(f'Parsing {len(missing_jobs)} files with {workers} workers')
+            parsed = self._parse_parallel(missing_jobs, workers)
+        else:
+            parsed = (self.parse_file_with_stats(file_path, module_name) for file_path, module_name in missing_jobs)
+
+        try:
+            for i, (file_path, module_name) in enumerate(jobs):
+                module = self.cache.load(keys[i]) if cached[i] else None
+                if module is not None:
+                    if self.stats is not None:
+                        self.stats.add_file(FileStats(module=module_name, cached=True))
+                else:
+                    # A cached entry may have been evicted in the meantime by another process
+                    module, file_stats = next(parsed) if not cached[i] else self.parse_file_with_stats(*jobs[i])
+                    if self.stats is not None:
+                        self.stats.add_file(file_stats)
+                    if self.cache is not None:
+                        self.cache.store(keys[i], module)
+                logging.info(f'Parsed module: {module_name}')
+                yield module_name, module
+        finally:
+            parsed.close()
+            if self.cache is not None:
+                self.cache.flush()
+
+    @staticmethod
+    def root_package(folder_path) -> str | None:
+        """The name of the folder if it is a package itself, None otherwise."""
+        if os.path.isfile(os.path.join(folder_path, '__init__.py')):
+            return os.path.basename(os.path.abspath(folder_path))
+        return None
+
+    def resolve(self, modules: dict[str, Module], root_package: str = None) -> dict[str, Module]:
+        """
+        Resolve the calls of all modules to fully qualified names in one pass.
+
+        The `SymbolIndex` of the modules is kept in `index`, the resolved modules share their definitions with it.
+
+        Args:
+            modules: The parsed modules with unresolved calls, keyed by module file name
+            root_package: Name of the parsed folder if it is a package itself
+
+        Returns:
+            The modules with resolved calls, calls to external functions keep their (imported) name.
+        """
+        logging.debug('Resolving calls')
+        index = SymbolIndex(modules, root_package=root_package)
+        resolved_modules = {
+            module_file: self.resolve_module(index, module_file, module) for module_file, module in modules.items()
+        }
+        if self.stats is not None:
+            self.stats.count('definitions', len(index.definitions))
+        self.index = index
+        logging.debug('Finished resolving calls')
+        return resolved_modules
+
+    def resolve_module(self, index: SymbolIndex, module_file: str, module: Module) -> Module:
+        """
+        Resolve the calls of a single module against an index of all modules.
+
+        Args:
+            index: The index of all parsed modules, see `SymbolIndex`
+            module_file: The file name of the module, e.g. `package.module.py`
+            module: The parsed module with unresolved calls
+
+        Returns:
+            A copy of the module with resolved calls.
+        """
+        module_name = module_file.removesuffix('.py')
+        resolved_names = {}  # {callee: resolved name} of the calls that do not depend on the caller
+        resolved_calls = defaultdict(dict)
+        merged = set()
+        for caller, callees in module.calls.items():
+            resolved_callees = resolved_calls[caller]
+            for callee, lines in callees.items():
+                callee_full_name = self._resolve_call(index, module_name, module, caller, callee, resolved_names)
+                if callee_full_name is None:
+                    continue
+                callee_full_name = sys.intern(callee_full_name)
+                if callee_full_name in resolved_callees:
+                    # Different names that refer to the same function, e.g. an alias and the original name
+                    if callee_full_name not in merged:
+                        merged.add(callee_full_name)
+                        resolved_callees[callee_full_name] = list(resolved_callees[callee_full_name])
+                    resolved_callees[callee_full_name].extend(lines)
+                else:
+                    resolved_callees[callee_full_name] = lines
+            for callee_full_name in merged:
+                resolved_callees[callee_full_name].sort()
+            merged.clear()
+            if self.stats is not None:
+                self.stats.count('calls', len(resolved_callees))
+        return Module(
+            definitions=module.definitions,
+            calls=resolved_calls,
+            imports=module.imports
+        )
+
+    def _resolve_call(
+            self, index: SymbolIndex, module_name: str, module: Module, caller: str, callee: str,
+            resolved_names: dict[str, str | None]
+    ) -> str | None:
+        """
+        Resolve a single call, returns None if the call should not be part of the results.
+
+        Only plain names can refer to a function of an enclosing scope, all other calls resolve the same for every
+        caller of the module and are memoized in `resolved_names`.
+        """
+        if '.' not in callee:
+            # Functions defined in an enclosing function, e.g. `module.outer.inner` called from `module.outer`
+            scope = caller
+            while len(scope) > len(module_name):
+                candidate = index.lookup(f'{scope}.{callee}')
+                if candidate is not None and getattr(index.definitions[candidate], 'type', None) != 'method':
+                    return self._call_target(index, candidate)
+                scope = scope.rpartition('.')[0]
+        if callee not in resolved_names:
+            resolved_names[callee] = self._resolve_name(index, module_name, module, callee)
+        return resolved_names[callee]
+
+    def _resolve_name(self, index: SymbolIndex, module_name: str, module: Module, callee: str) -> str | None:
+        """Resolve a called name through the imports and the definitions of a module."""
+        head, _, attribute = callee.partition('.')
+        if head in module.imports:
+            # Function is defined in another module, or external if it is not in the index
+            imported_name = module.imports[head] + (f'.{attribute}' if attribute else '')
+            full_name = index.lookup(imported_name) or self._inherited_method(index, module.imports[head], attribute)
+            if full_name is None:
+                return imported_name
+        else:
+            full_name = index.lookup(f'{module_name}.{callee}') or self._inherited_method(
+                index, f'{module_name}.{head}', attribute
+            )
+        if full_name is None:
+            # Std or external function call
+            return callee
+        return self._call_target(index, full_name)
+
+    @staticmethod
+    def _inherited_method(index: SymbolIndex, class_name: str, attribute: str) -> str | None:
+        """
+        The method that a class inherits, e.g. for `self.method()` where `method` is defined by a base class.
+
+        Only single attributes of classes are looked up in their MRO, see `InheritanceIndex.resolve_method`.
+        """
+        if not attribute or '.' in attribute:
+            return None
+        return index.inheritance.resolve_method(index.lookup(class_name), attribute)
+
+    @staticmethod
+    def _call_target(index: SymbolIndex, full_name: str) -> str:
+        """The qualified name that a call of a definition refers to, the class itself for a class without `__init__`."""
+        definition = index.definitions[full_name]
+        if isinstance(definition, Class):
+            # Instantiating a class calls its constructor, or creates the instance directly, e.g. of a dataclass
+            constructor = f'{full_name}.__init__'
+            return constructor if constructor in index.definitions else full_name
+        return full_name
+
+    def _effective_workers(self, n_files: int) -> int:
+        """Number of workers worth starting for `n_files`, 1 means serial parsing."""
+        return max(1, min(self.workers, n_files // MIN_FILES_PER_WORKER))
+
+    def _parse_parallel(self, jobs: list[tuple[str, str]], workers: int) -> Iterator[tuple[Module, FileStats]]:
+        """Parse the jobs on a pool of worker processes, yielding the results in the order of the jobs."""
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker
+        ) as executor:
+            yield from executor.map(_parse_file_in_worker, jobs, chunksize=chunksize)
 
     def parse_file(self, file_path, module_name):
         """
@@ -50,20 +302,72 @@ class Parser:
         Returns:
             Module: A `Module` instance containing definitions, calls, and imports.
         """
-        module_name = module_name.removesuffix('.py')
+        return self.parse_file_with_stats(file_path, module_name)[0]
+
+    def parse_file_with_stats(self, file_path, module_name) -> tuple[Module, FileStats]:
+        """Parse a single Python file like `parse_file`, also returns the size and timings of the file."""
+        file_stats = FileStats(module=module_name)
         logging.debug(f'Parsing file: {file_path}')
+        start = time.perf_counter()
         with open(file_path, 'r', encoding='utf-8') as f:
+            file_stats.bytes = os.fstat(f.fileno()).st_size
             source_code = f.read()
+        file_stats.read_time = time.perf_counter() - start
+        return self._parse_source(source_code, module_name, file_path, file_stats), file_stats
 
+    def parse_source(self, source_code: str, module_name: str, file_path: str = '<unknown>') -> Module:
+        """
+        Parse the source code of a module, e.g. read from a git object instead of a file.
+
+        Args:
+            source_code: The source code of the module
+            module_name: The name of the module (file)
+            file_path: The path shown in error messages
+        """
+        file_stats = FileStats(module=module_name, bytes=len(source_code))
+        return self._parse_source(source_code, module_name, file_path, file_stats)
+
+    def _parse_source(self, source_code: str, module_name: str, file_path: str, file_stats: FileStats) -> Module:
+        module_name = module_name.removesuffix('.py')
+        start = time.perf_counter()
         try:
             tree = ast.parse(source_code, filename=file_path)
             logging.debug(f'Parsed AST for {file_path}')
         except SyntaxError as e:
             logging.error(f"Syntax error in {file_path}: {e}")
             return Module()
+        file_stats.parse_time = time.perf_counter() - start
 
         # Use AstWalker to extract definitions and calls
+        start = time.perf_counter()
         definitions, calls, imports = self.ast_walker.walk(tree, module_name)
+        file_stats.walk_time = time.perf_counter() - start
         logging.debug(f'Finished parsing file: {file_path}')
         return Module(definitions=definitions, calls=calls, imports=imports)
 
+
+def make_parser(
+        workers: int = 1,
+        cache_dir: str = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        include: list[str] = None,
+        exclude: list[str] = None,
+        use_gitignore: bool = True,
+        stats: RunStats = None
+    ) -> Parser:
+    """
+    Create the parser of the library entry points such as `poseidon` and `poseidon_batch` from their options.
+
+    Args:
+        workers: Number of processes used for parsing, values below 1 use all available cores
+        cache_dir: Folder of the parse cache for unchanged files, None disables the cache. The entries are
+            unpickled, so only use a folder that no untrusted user can write to
+        cache_size: Maximum size of the parse cache in bytes
+        include: Patterns in .gitignore syntax of the files to parse, all Python files by default
+        exclude: Patterns in .gitignore syntax of files and directories to skip
+        use_gitignore: Skip the files ignored by the .gitignore files in the folder
+        stats: Optional `RunStats` that collects the time of every phase and file
+    """
+    cache = ParseCache(cache_dir=cache_dir, max_size=cache_size) if cache_dir is not None else None
+    discovery = FileDiscovery(include=include, exclude=exclude, use_gitignore=use_gitignore)
+    return Parser(workers=workers, cache=cache, stats=stats, discovery=discovery)
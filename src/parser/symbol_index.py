@@ -0,0 +1,104 @@
+import logging
+
+from src.parser.data_classes import Class, Definition, Module
+from src.parser.inheritance import InheritanceIndex
+
+# Maximum number of import aliases followed when resolving a single name, guards against import cycles
+MAX_ALIAS_HOPS = 32
+
+
+def canonical_module_name(module_name: str) -> str:
+    """The name under which a module is imported, e.g. `package.__init__` is imported as `package`."""
+    if module_name == '__init__':
+        return ''
+    return module_name.removesuffix('.__init__')
+
+
+class SymbolIndex:
+    """
+    Repository-wide index that maps fully qualified names to definitions.
+
+    Besides the definitions themselves, the index knows the names imported by every module. These are used
+    to follow aliases and re-exports, e.g. a function imported in `package/__init__.py` can be referred to
+    as `package.function`. Lookups are memoized, so resolving all calls of a repository takes linear time. The
+    bases of the classes are kept in an `InheritanceIndex`, which resolves inherited methods.
+    """
+    def __init__(self, modules: dict[str, Module], root_package: str = None):
+        """ Builds the index from the parsed modules
+
+        Args:
+            modules: The parsed modules, keyed by module file name
+            root_package: Name of the parsed folder if it is a package itself, names starting with it are
+                treated as relative to the parsed folder
+        """
+        self.definitions: dict[str, Definition | Class] = {}  # {qualified_name: Definition or Class}
+        self.exports: dict[str, str] = {}  # {qualified alias: imported name}
+        self.root_prefix = f'{root_package}.' if root_package else None
+        self._lookups: dict[str, str | None] = {}
+        self.inheritance = InheritanceIndex(self)
+
+        for module_file, module in modules.items():
+            self.add_module(module_file.removesuffix('.py'), module)
+        logging.debug(f'Indexed {len(self.definitions)} definitions and {len(self.exports)} imported names')
+
+    def add_module(self, module_name: str, module: Module):
+        """Add the definitions and imports of a module to the index."""
+        package_name = canonical_module_name(module_name)
+        for qualified_name, definition in module.definitions.items():
+            if isinstance(definition, Class):
+                class_name = f'{module_name}.{definition.name}'
+                self._add_definition(class_name, definition, module_name, package_name)
+                self.inheritance.add_class(class_name, definition, module_name, module.imports)
+                for method in definition.methods.values():
+                    self._add_definition(f'{class_name}.{method.name}', method, module_name, package_name)
+            else:
+                self._add_definition(qualified_name, definition, module_name, package_name)
+
+        for alias, imported_name in module.imports.items():
+            self.exports[_join(package_name, alias)] = imported_name
+        self._lookups.clear()
+        self.inheritance.clear()
+
+    def lookup(self, name: str) -> str | None:
+        """
+        Resolve a (possibly aliased) fully qualified name to the qualified name of its definition.
+
+        Returns:
+            The qualified name of the definition, or None if the name is not defined in the parsed folder.
+        """
+        if self.root_prefix and name.startswith(self.root_prefix):
+            name = name[len(self.root_prefix):]
+        return self._lookup(name, hops=0)
+
+    def _lookup(self, name: str, hops: int) -> str | None:
+        if name in self._lookups:
+            return self._lookups[name]
+        # Mark the name as unresolved while it is being looked up, which breaks cycles between aliases
+        self._lookups[name] = None
+
+        if name in self.definitions:
+            result = name
+        elif name in self.exports and hops < MAX_ALIAS_HOPS:
+            imported_name = self.exports[name]
+            if self.root_prefix and imported_name.startswith(self.root_prefix):
+                imported_name = imported_name[len(self.root_prefix):]
+            result = self._lookup(imported_name, hops + 1)
+        else:
+            # Resolve the owner of the attribute, e.g. an aliased class for `alias.method`
+            owner, _, attribute = name.rpartition('.')
+            resolved_owner = self._lookup(owner, hops) if owner else None
+            candidate = f'{resolved_owner}.{attribute}' if resolved_owner else None
+            result = candidate if candidate in self.definitions else None
+
+        self._lookups[name] = result
+        return result
+
+    def _add_definition(self, qualified_name: str, definition, module_name: str, package_name: str):
+        self.definitions[qualified_name] = definition
+        if package_name != module_name:
+            # Definitions in `package/__init__.py` are also reachable as `package.name`
+            self.exports[_join(package_name, qualified_name[len(module_name) + 1:])] = qualified_name
+
+
+def _join(prefix: str, name: str) -> str:
+    return f'{prefix}.{name}' if prefix else name
@@ -1,8 +1,27 @@
 import argparse
+import cProfile
+import json
 import logging
+import os
+import sys
+import time
 
-from src.parser import Parser
-from src.graphs import CallGraph
+from src.parser import ExternalResolver, Module, Parser, default_search_paths, make_parser
+from src.parser.cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from src.parser.symbol_index import SymbolIndex
+from src.graphs import (
+    CallGraph, ClassGraph, CompactGraph, DeadCodeReport, GraphDiff, HtmlViewer, find_dead_code, get_exporter
+)
+from src.graphs.exporters import EXPORT_FORMATS
+from src.graphs.html_viewer import is_html_output
+from src.graphs.queries import CALLEES, DIRECTIONS
+from src.graphs.sequence_diagram import DEFAULT_MAX_CALLS, DEFAULT_MAX_DEPTH, SequenceDiagram
+from src.batch import DEFAULT_RENDER_WORKERS, poseidon_batch
+from src.pipeline import ParsedStream, StreamingParser
+from src.stats import RunStats, phase
+from src.revisions import RevisionParser
+from src.server import DEFAULT_HOST, DEFAULT_PORT, serve
+from src.watch import DEFAULT_DEBOUNCE, FileChanges, watch
 
 def poseidon(
         folder_path: str,
@@ -10,8 +29,24 @@ def poseidon(
         title: str = None,
         output_path: str = 'graph.png',
         exclude_private: bool = True,
-        exclude_external: bool = True
-    ):
+        exclude_external: bool = True,
+        level: str = 'function',
+        export_format: str = None,
+        workers: int = 1,
+        cache_dir: str = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        include: list[str] = None,
+        exclude: list[str] = None,
+        use_gitignore: bool = True,
+        focus: list[str] = None,
+        depth: int = None,
+        direction: str = CALLEES,
+        external_depth: int = 0,
+        external_roots: list[str] = None,
+        memory_budget: int = None,
+        layout_cache: bool = False,
+        max_calls: int = DEFAULT_MAX_CALLS
+    ) -> RunStats:
     """ The high-level function that combines the parser with the graphs
 
     Args:
@@ -21,18 +56,378 @@ def poseidon(
         output_path: The path where the graph should be stored
         exclude_private: Option to exclude private functions from the graph
         exclude_external: Option to exclude external calls from the graph
+        level: Level of detail of the graph: 'function', 'module', 'package' or 'auto'
+        export_format: Stream the graph as 'dot', 'jsonl' or 'graphml' instead of rendering it, by default
+            derived from the extension of the output path ('-' writes to stdout)
+        workers: Number of processes used for parsing, values below 1 use all available cores
+        cache_dir: Folder of the parse cache for unchanged files, None (the default) disables the cache. The
+            entries are unpickled, so only use a folder that no untrusted user can write to
+        cache_size: Maximum size of the parse cache in bytes
+        include: Patterns in .gitignore syntax of the files to parse, all Python files by default
+        exclude: Patterns in .gitignore syntax of files and directories to skip
+        use_gitignore: Skip the files ignored by the .gitignore files in the folder
+        focus: Only show the functions reachable from these functions, by qualified name or the end of it. A
+            sequence diagram starts at the single focused function
+        depth: Maximum number of calls from a focused function, None for no limit
+        direction: Follow calls from the focused functions to their 'callees', 'callers' or 'both'
+        external_depth: Number of levels of calls followed into installed packages, 0 keeps external calls as names
+        external_roots: Extra folders searched for external packages before the site-packages folders
+        memory_budget: Stream the parsed modules through a `StreamingParser` that keeps at most this many bytes of
+            unresolved calls in memory and spills the rest to disk, None keeps all modules in memory. The
+            definitions and imports of all modules and the graph are not part of the budget, and the budget
+            cannot be combined with `external_depth`
+        layout_cache: Store the layout next to the output and keep unchanged nodes in place on the next render
+        max_calls: Maximum number of calls shown per function of a sequence diagram, None for no limit
+
+    Returns:
+        The timings and counters of the run, see `RunStats`
     """
+    start = time.perf_counter()
+    stats = RunStats()
+
     # Setup the parser
-    parser = Parser(
-        exclude_private=exclude_private,
-        exclude_external=exclude_external
+    parser = make_parser(workers, cache_dir, cache_size, include, exclude, use_gitignore, stats=stats)
+    if memory_budget is not None and external_depth > 0:
+        raise ValueError('Following external calls needs all modules in memory, it cannot be combined with a '
+                         'memory budget')
+    if memory_budget is not None:
+        modules = StreamingParser(parser, memory_budget=memory_budget).parse_folder(folder_path)
+        index = modules.index
+    else:
+        modules = parser.parse_folder(folder_path=folder_path)
+        index = parser.index
+    if external_depth > 0:
+        with phase(stats, 'externals'):
+            search_paths = list(external_roots or []) + default_search_paths(folder_path)
+            modules = ExternalResolver(parser, search_paths=search_paths, depth=external_depth).expand(modules)
+        # The external modules are not in the index of the parsed folder
+        index = None
+    try:
+        _produce_graph(
+            modules,
+            stats=stats,
+            graph_type=graph_type,
+            title=title,
+            output_path=output_path,
+            exclude_private=exclude_private,
+            exclude_external=exclude_external,
+            level=level,
+            export_format=export_format,
+            focus=focus,
+            depth=depth,
+            direction=direction,
+            layout_cache=layout_cache,
+            root_package=parser.root_package(folder_path),
+            max_calls=max_calls,
+            index=index
+        )
+    finally:
+        if isinstance(modules, ParsedStream):
+            modules.close()
+    stats.total_time = time.perf_counter() - start
+    return stats
+
+
+def poseidon_watch(
+        folder_path: str,
+        graph_type: str = 'call',
+        title: str = None,
+        output_path: str = 'graph.png',
+        exclude_private: bool = True,
+        exclude_external: bool = True,
+        level: str = 'function',
+        export_format: str = None,
+        workers: int = 1,
+        cache_dir: str = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        include: list[str] = None,
+        exclude: list[str] = None,
+        use_gitignore: bool = True,
+        focus: list[str] = None,
+        depth: int = None,
+        direction: str = CALLEES,
+        debounce: float = DEFAULT_DEBOUNCE,
+        max_updates: int = None,
+        layout_cache: bool = False,
+        max_calls: int = DEFAULT_MAX_CALLS
+    ):
+    """ Produce the graph like `poseidon`, and produce it again whenever files in the folder change
+
+    Only added and modified files are parsed again, see `IncrementalParser`. Runs until interrupted.
+
+    Args:
+        debounce: Seconds without changes before the graph is updated, a burst of saves results in one update
+        max_updates: Stop after this number of updates, by default watch until interrupted
+
+    The other arguments are the same as for `poseidon`.
+    """
+    parser = make_parser(workers, cache_dir, cache_size, include, exclude, use_gitignore)
+
+    def on_change(modules: dict[str, Module], changes: FileChanges):
+        start = time.perf_counter()
+        _produce_graph(
+            modules,
+            stats=None,
+            graph_type=graph_type,
+            title=title,
+            output_path=output_path,
+            exclude_private=exclude_private,
+            exclude_external=exclude_external,
+            level=level,
+            export_format=export_format,
+            focus=focus,
+            depth=depth,
+            direction=direction,
+            layout_cache=layout_cache,
+            root_package=Parser.root_package(folder_path),
+            max_calls=max_calls
+        )
+        print(f'Updated {output_path} in {time.perf_counter() - start + changes.time:.2f} s'
+              + (f' ({changes.summary()})' if changes else ''), file=sys.stderr)
+
+    watch(folder_path, on_change, parser=parser, debounce=debounce, max_updates=max_updates)
+
+
+def poseidon_diff(
+        folder_path: str,
+        base: str,
+        head: str = 'HEAD',
+        title: str = None,
+        output_path: str = 'graph.png',
+        diff_output: str = None,
+        exclude_private: bool = True,
+        exclude_external: bool = True,
+        cache_dir: str = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        include: list[str] = None,
+        exclude: list[str] = None,
+        layout_cache: bool = False
+    ) -> GraphDiff:
+    """ Produce the call graph of a git revision, highlighting the differences with a base revision
+
+    The files are read from git, the working tree is not used. The parsed base revision is stored as a snapshot
+    in the cache, so only the files that changed since the base are parsed when it is used again.
+
+    Args:
+        folder_path: The path of the source code to be parsed, inside a git repository
+        base: The revision to compare against, e.g. the target branch of a pull request
+        head: The revision of which the graph is produced
+        title: Title of the graph to be produced
+        output_path: The path where the graph should be stored
+        diff_output: Optional path of a JSON file to which the added and removed definitions and calls are written
+        exclude_private: Option to exclude private functions from the graph
+        exclude_external: Option to exclude external calls from the graph
+        cache_dir: Folder of the parse cache and the snapshots, None (the default) disables the cache. The
+            entries are unpickled, so only use a folder that no untrusted user can write to
+        cache_size: Maximum size of the parse cache in bytes
+        include: Patterns in .gitignore syntax of the files to parse, all Python files by default
+        exclude: Patterns in .gitignore syntax of files and directories to skip
+        layout_cache: Store the layout next to the output, so the graphs of later revisions keep the unchanged
+            definitions in place
+
+    Returns:
+        The added and removed definitions and calls
+    """
+    # Tracked files are parsed, .gitignore files only apply to untracked files
+    parser = make_parser(cache_dir=cache_dir, cache_size=cache_size, include=include, exclude=exclude,
+                         use_gitignore=False)
+    snapshot_dir = os.path.join(cache_dir, 'snapshots') if cache_dir is not None else None
+    revision_diff = RevisionParser(folder_path, parser=parser, snapshot_dir=snapshot_dir).compare(
+        base, head, exclude_private=exclude_private, exclude_external=exclude_external
     )
-    modules = parser.parse_folder(folder_path=folder_path)
+    diff = revision_diff.diff
+    logging.info(f'Parsed {revision_diff.changes.summary()}')
+
+    if diff_output is not None:
+        with open(diff_output, 'w', encoding='utf-8') as f:
+            json.dump(diff.to_dict(), f, indent=2)
+    graph = CallGraph(output_path=output_path, title=title, diff=diff, layout_cache=layout_cache)
+    graph.build_graph(revision_diff.head_graph)
+    graph.render()
+    return diff
 
-    if graph_type == 'call':
-        graph = CallGraph(output_path=output_path, title=title)
-        graph.build_graph(modules)
+
+def poseidon_serve(
+        folder_path: str,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        socket_path: str = None,
+        workers: int = 1,
+        cache_dir: str = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        include: list[str] = None,
+        exclude: list[str] = None,
+        use_gitignore: bool = True,
+        debounce: float = DEFAULT_DEBOUNCE,
+        output_dir: str = None
+    ):
+    """ Keep the parsed folder in memory and answer JSON-RPC queries and render requests until interrupted
+
+    The index is refreshed incrementally when files change, see `AnalysisIndex` for the methods.
+
+    Args:
+        host: Host of the HTTP server
+        port: Port of the HTTP server, 0 picks a free port
+        socket_path: Listen on this Unix socket instead of HTTP
+        debounce: Seconds without changes before the index is refreshed
+        output_dir: The only folder that clients can render graphs to, None only returns their DOT source
+
+    The other arguments are the same as for `poseidon`.
+    """
+    parser = make_parser(workers, cache_dir, cache_size, include, exclude, use_gitignore)
+    serve(folder_path, parser=parser, host=host, port=port, socket_path=socket_path, debounce=debounce,
+          output_dir=output_dir,
+          on_ready=lambda address: print(f'Serving {folder_path} on {address}', file=sys.stderr, flush=True))
+
+
+def poseidon_dead_code(
+        folder_path: str,
+        output_path: str = '-',
+        roots: list[str] = None,
+        workers: int = 1,
+        cache_dir: str = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        include: list[str] = None,
+        exclude: list[str] = None,
+        use_gitignore: bool = True
+    ) -> DeadCodeReport:
+    """ Report the definitions that cannot be reached from any entry point, without rendering a graph
+
+    The entry points are `main` functions, `__main__` modules, tests and the given roots, see `find_dead_code`.
+
+    Args:
+        folder_path: The path of the source code to be parsed
+        output_path: The path of the JSON report, '-' writes to stdout and None skips writing it
+        roots: Extra entry points, by qualified name or glob pattern such as `pkg.api.*`
+        workers: Number of processes used for parsing, values below 1 use all available cores
+        cache_dir: Folder of the parse cache for unchanged files, None (the default) disables the cache. The
+            entries are unpickled, so only use a folder that no untrusted user can write to
+        cache_size: Maximum size of the parse cache in bytes
+        include: Patterns in .gitignore syntax of the files to parse, all Python files by default
+        exclude: Patterns in .gitignore syntax of files and directories to skip
+        use_gitignore: Skip the files ignored by the .gitignore files in the folder
+
+    Returns:
+        The unreachable definitions
+    """
+    parser = make_parser(workers, cache_dir, cache_size, include, exclude, use_gitignore)
+    report = find_dead_code(CompactGraph.from_modules(parser.parse_folder(folder_path=folder_path)), roots=roots)
+    if output_path == '-':
+        json.dump(report.to_dict(), sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    elif output_path is not None:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report.to_dict(), f, indent=2)
+    return report
+
+
+def _produce_graph(
+        modules: dict[str, Module] | ParsedStream,
+        stats: RunStats | None,
+        graph_type: str,
+        title: str,
+        output_path: str,
+        exclude_private: bool,
+        exclude_external: bool,
+        level: str,
+        export_format: str,
+        focus: list[str] = None,
+        depth: int = None,
+        direction: str = CALLEES,
+        layout_cache: bool = False,
+        root_package: str = None,
+        max_calls: int = DEFAULT_MAX_CALLS,
+        index: SymbolIndex = None
+    ):
+    """
+    Export or render the graph of parsed or streamed modules, see `poseidon` for the arguments.
+
+    `root_package` is the name of the parsed folder if it is a package itself, see `Parser.root_package`. `index`
+    is the `SymbolIndex` the modules were resolved with, it is built again for a class diagram if it is not given.
+    """
+    exporter = get_exporter(output_path, export_format) if graph_type == 'call' else None
+    if exporter is not None and focus:
+        raise ValueError('A focused graph can only be rendered, not exported')
+    if exporter is not None:
+        # Stream the graph to the output without building it in memory
+        with phase(stats, 'export'):
+            graph_exporter = exporter(
+                output_path=output_path,
+                exclude_private=exclude_private,
+                exclude_external=exclude_external
+            )
+            if isinstance(modules, ParsedStream):
+                graph_exporter.export(iter(modules), internal=modules.internal_definitions())
+            else:
+                graph_exporter.export(modules)
+    elif graph_type == 'call':
+        # Only the compact representation is kept while the graph is built and rendered
+        with phase(stats, 'compact_graph'):
+            if isinstance(modules, ParsedStream):
+                compact_graph = CompactGraph.from_stream(modules.summaries, modules.modules())
+            else:
+                compact_graph = CompactGraph.from_modules(modules)
+        del modules
+        if is_html_output(output_path):
+            # The viewer lays out the graph in the browser and collapses the modules itself
+            if level != 'function' or layout_cache:
+                logging.warning('Level of detail and layout cache do not apply to the HTML viewer, they are ignored')
+            graph = HtmlViewer(
+                output_path=output_path,
+                title=title,
+                exclude_private=exclude_private,
+                exclude_external=exclude_external,
+                stats=stats,
+                focus=focus,
+                depth=depth,
+                direction=direction
+            )
+            graph.build_graph(compact_graph)
+            graph.render()
+            return
+        graph = CallGraph(
+            output_path=output_path,
+            title=title,
+            exclude_private=exclude_private,
+            exclude_external=exclude_external,
+            level=level,
+            stats=stats,
+            focus=focus,
+            depth=depth,
+            direction=direction,
+            layout_cache=layout_cache
+        )
+        graph.build_graph(compact_graph)
         graph.render()
+    elif graph_type == 'class':
+        if focus or level != 'function' or layout_cache:
+            logging.warning('Focus, level of detail and layout cache only apply to call graphs, they are ignored')
+        graph = ClassGraph(
+            output_path=output_path,
+            title=title,
+            exclude_private=exclude_private,
+            exclude_external=exclude_external,
+            stats=stats
+        )
+        # The parser already indexed the classes of all modules
+        graph.build_graph(modules, index=index, root_package=root_package)
+        graph.render()
+    elif graph_type == 'sequence':
+        if not focus or len(focus) != 1:
+            raise ValueError('A sequence diagram starts at exactly one focused function (--focus)')
+        graph = SequenceDiagram(
+            output_path=output_path,
+            title=title,
+            exclude_private=exclude_private,
+            exclude_external=exclude_external,
+            max_depth=DEFAULT_MAX_DEPTH if depth is None else depth,
+            max_calls=max_calls,
+            stats=stats
+        )
+        graph.build_graph(modules, entry=focus[0])
+        graph.render()
+    else:
+        raise ValueError(f"Graph type '{graph_type}' is not supported")
 
 
 # Define CLI
@@ -42,9 +437,17 @@ def main():
 
     # Add arguments to the parser
     parser.add_argument('folder', type=str, help="Folder to be inspected")
-    parser.add_argument('-o', type=str, default="graph.png", help="Location of output file")
+    parser.add_argument('-o', type=str, default="graph.png",
+                        help="Location of output file, .dot/.gv, .jsonl and .graphml files are exported without "
+                             "rendering, .html files are an interactive viewer for large graphs, '-' exports to "
+                             "stdout")
+    parser.add_argument('-f', '--format', type=str, choices=list(EXPORT_FORMATS), default=None,
+                        help="Export format, overrides the extension of the output file (default: dot for stdout)")
     parser.add_argument('-g', '--graph-type', type=str, choices=['call', 'sequence', 'class'],
-                        default='call', help="Type of graph to generate (call, sequence, class)")
+                        default='call',
+                        help="Type of graph to generate (call, sequence, class), a sequence diagram starts at the "
+                             "--focus function and is written as PlantUML (.puml) or Mermaid (.mmd) text, other "
+                             "extensions are rendered with PlantUML")
     parser.add_argument('-v', '--verbose', action='count', default=0,
                         help="Increase verbosity of output (-v for INFO, -vv for DEBUG)")
     parser.add_argument('-t', '--title',  type=str, default=None,  help="Title of the graph")
@@ -53,6 +456,95 @@ def main():
                         help="Exclude private methods and attributes (default: True)")
     parser.add_argument('--exclude-external', type=bool, default=True,
                         help="Exclude external calls outside the inspected folder (default: True)")
+    parser.add_argument('-l', '--level', type=str, choices=['function', 'module', 'package', 'auto'],
+                        default='function',
+                        help="Level of detail, collapse functions into modules or packages, 'auto' collapses "
+                             "large graphs only (default: function)")
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help="Number of parser processes, 0 uses all cores (default: 1)")
+    # File selection options
+    parser.add_argument('--include', type=str, action='append', default=None, metavar='PATTERN',
+                        help="Only parse files matching this .gitignore-style pattern, can be repeated")
+    parser.add_argument('--exclude', type=str, action='append', default=None, metavar='PATTERN',
+                        help="Skip files and directories matching this .gitignore-style pattern, can be repeated")
+    parser.add_argument('--no-gitignore', action='store_true',
+                        help="Also parse files that are ignored by .gitignore files")
+    # Query options
+    parser.add_argument('--focus', type=str, action='append', default=None, metavar='FUNCTION',
+                        help="Only show the functions reachable from this function, e.g. pkg.mod.func or func, "
+                             "can be repeated")
+    parser.add_argument('--depth', type=int, default=None,
+                        help="Maximum number of calls from a --focus function (default: no limit, "
+                             f"{DEFAULT_MAX_DEPTH} for a sequence diagram)")
+    parser.add_argument('--direction', type=str, choices=list(DIRECTIONS), default=CALLEES,
+                        help="Follow calls from the --focus functions to their callees, callers or both "
+                             "(default: %(default)s)")
+    parser.add_argument('--max-calls', type=int, default=DEFAULT_MAX_CALLS, metavar='N',
+                        help="Maximum number of calls shown per function of a sequence diagram, which starts at the "
+                             "--focus function (default: %(default)s)")
+    # Layout options
+    parser.add_argument('--layout-cache', action='store_true',
+                        help="Store the layout next to the output and keep unchanged functions in place on the next "
+                             "render, which only lays out new functions")
+    # Server options
+    parser.add_argument('--serve', action='store_true',
+                        help="Keep the parsed folder in memory and answer JSON-RPC requests on localhost HTTP or "
+                             "a Unix socket")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help="Port of the --serve HTTP server (default: %(default)s)")
+    parser.add_argument('--socket', type=str, default=None, metavar='PATH',
+                        help="Serve on this Unix socket instead of HTTP")
+    parser.add_argument('--output-dir', type=str, default=None, metavar='FOLDER',
+                        help="Folder that the render method of --serve writes graphs to, paths of clients are "
+                             "relative to it (default: render only returns the DOT source)")
+    # Dead code options
+    parser.add_argument('--dead-code', type=str, default=None, metavar='FILE',
+                        help="Write the definitions that no entry point reaches to a JSON file ('-' for stdout) "
+                             "instead of producing a graph, exits with status 1 if there are any")
+    parser.add_argument('--root', type=str, action='append', default=None, metavar='FUNCTION',
+                        help="Extra entry point for --dead-code, by qualified name or glob pattern, can be repeated")
+    # External options
+    parser.add_argument('--external-depth', type=int, default=0, metavar='N',
+                        help="Follow calls into installed packages for N levels, parsing only the modules they reach "
+                             "(default: 0, external calls are kept as names)")
+    parser.add_argument('--external-root', type=str, action='append', default=None, metavar='FOLDER',
+                        help="Extra folder searched for packages by --external-depth, e.g. the standard library, "
+                             "can be repeated")
+    # Memory options
+    parser.add_argument('--memory-budget', type=int, default=None, metavar='MB',
+                        help="Stream the parsed files and spill their calls to disk beyond this many MB, for very "
+                             "large trees. The definitions and the graph are kept in memory in addition to the "
+                             "budget, cannot be combined with --external-depth (default: keep everything in memory)")
+    # Revision options
+    parser.add_argument('--base', type=str, default=None, metavar='REVISION',
+                        help="Produce the graph of the git revision --head and highlight the differences with this "
+                             "revision")
+    parser.add_argument('--head', type=str, default='HEAD', metavar='REVISION',
+                        help="Revision compared with --base (default: %(default)s)")
+    parser.add_argument('--diff-output', type=str, default=None, metavar='FILE',
+                        help="Write the added and removed definitions and calls between --base and --head to a JSON "
+                             "file")
+    # Cache options
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR,
+                        help=f"Folder of the parse cache (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+                        help="Maximum size of the parse cache in MB (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true', help="Disable the parse cache")
+    # Batch options
+    parser.add_argument('--batch', type=str, default=None, metavar='MANIFEST',
+                        help="JSON or YAML manifest of graphs to produce from a single parse, replaces -o")
+    parser.add_argument('--render-workers', type=int, default=DEFAULT_RENDER_WORKERS,
+                        help="Maximum number of concurrent Graphviz processes in batch mode (default: %(default)s)")
+    # Watch options
+    parser.add_argument('-w', '--watch', action='store_true',
+                        help="Keep running and update the graph whenever files in the folder change")
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                        help="Seconds without changes before the graph is updated in watch mode (default: %(default)s)")
+    # Profiling options
+    parser.add_argument('--profile', action='store_true',
+                        help="Print the time of every phase, the counters and the slowest files")
+    parser.add_argument('--profile-output', type=str, default=None, metavar='FILE',
+                        help="Write the profile to FILE, as JSON for .json files and as a cProfile dump otherwise")
 
     # Parse the arguments
     args = parser.parse_args()
@@ -66,8 +558,145 @@ def main():
         log_lvl = logging.WARNING
     logging.basicConfig(level=log_lvl, format='%(asctime)s - %(levelname)s - %(message)s')
 
+    if args.memory_budget is not None and args.external_depth > 0:
+        parser.error('--memory-budget cannot be combined with --external-depth, which needs all modules in memory')
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.batch is not None:
+        result = poseidon_batch(
+            folder_path=args.folder,
+            jobs=args.batch,
+            render_workers=args.render_workers,
+            workers=args.workers,
+            cache_dir=cache_dir,
+            cache_size=args.cache_size * 1024 * 1024,
+            include=args.include,
+            exclude=args.exclude,
+            use_gitignore=not args.no_gitignore
+        )
+        print(result.summary())
+        sys.exit(1 if result.failed else 0)
+
+    if args.serve:
+        try:
+            poseidon_serve(
+                folder_path=args.folder,
+                port=args.port,
+                socket_path=args.socket,
+                workers=args.workers,
+                cache_dir=cache_dir,
+                cache_size=args.cache_size * 1024 * 1024,
+                include=args.include,
+                exclude=args.exclude,
+                use_gitignore=not args.no_gitignore,
+                debounce=args.debounce,
+                output_dir=args.output_dir
+            )
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.dead_code is not None:
+        report = poseidon_dead_code(
+            folder_path=args.folder,
+            output_path=args.dead_code,
+            roots=args.root,
+            workers=args.workers,
+            cache_dir=cache_dir,
+            cache_size=args.cache_size * 1024 * 1024,
+            include=args.include,
+            exclude=args.exclude,
+            use_gitignore=not args.no_gitignore
+        )
+        print(report.summary(), file=sys.stderr)
+        sys.exit(1 if report else 0)
+
+    if args.base is not None:
+        diff = poseidon_diff(
+            folder_path=args.folder,
+            base=args.base,
+            head=args.head,
+            title=args.title,
+            output_path=args.o,
+            diff_output=args.diff_output,
+            exclude_private=args.exclude_private,
+            exclude_external=args.exclude_external,
+            cache_dir=cache_dir,
+            cache_size=args.cache_size * 1024 * 1024,
+            include=args.include,
+            exclude=args.exclude,
+            layout_cache=args.layout_cache
+        )
+        print(diff.summary())
+        return
+
+    if args.watch:
+        try:
+            poseidon_watch(
+                folder_path=args.folder,
+                graph_type=args.graph_type,
+                title=args.title,
+                output_path=args.o,
+                exclude_private=args.exclude_private,
+                exclude_external=args.exclude_external,
+                level=args.level,
+                export_format=args.format if args.format or args.o != '-' else 'dot',
+                workers=args.workers,
+                cache_dir=cache_dir,
+                cache_size=args.cache_size * 1024 * 1024,
+                include=args.include,
+                exclude=args.exclude,
+                use_gitignore=not args.no_gitignore,
+                focus=args.focus,
+                depth=args.depth,
+                direction=args.direction,
+                debounce=args.debounce,
+                layout_cache=args.layout_cache,
+                max_calls=args.max_calls
+            )
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # A cProfile dump profiles the whole run, the other profiles only need the returned stats
+    profiler = None
+    if args.profile_output is not None and not args.profile_output.endswith('.json'):
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     # Call the poseidon function with the parsed arguments
-    poseidon(**vars(args))
+    stats = poseidon(
+        folder_path=args.folder,
+        graph_type=args.graph_type,
+        title=args.title,
+        output_path=args.o,
+        exclude_private=args.exclude_private,
+        exclude_external=args.exclude_external,
+        level=args.level,
+        export_format=args.format if args.format or args.o != '-' else 'dot',
+        workers=args.workers,
+        cache_dir=cache_dir,
+        cache_size=args.cache_size * 1024 * 1024,
+        include=args.include,
+        exclude=args.exclude,
+        use_gitignore=not args.no_gitignore,
+        focus=args.focus,
+        depth=args.depth,
+        direction=args.direction,
+        external_depth=args.external_depth,
+        external_roots=args.external_root,
+        memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget is not None else None,
+        layout_cache=args.layout_cache,
+        max_calls=args.max_calls
+    )
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile_output)
+    elif args.profile_output is not None:
+        stats.write_json(args.profile_output)
+    if args.profile:
+        print(stats.summary(), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,281 @@
+import hashlib
+import logging
+import os
+import pickle
+import subprocess
+import time
+from dataclasses import dataclass, field
+
+from src import __version__
+from src.graphs import CompactGraph, GraphDiff, diff_graphs
+from src.parser import Module, Parser
+from src.watch import FileChanges
+
+# Increase when the content of the snapshots changes, which invalidates existing snapshots
+SNAPSHOT_FORMAT_VERSION = 3
+SNAPSHOT_SUFFIX = '.snapshot.pickle'
+
+
+class GitError(RuntimeError):
+    """A git command failed."""
+
+
+def git(repo_path: str, *args: str, input: bytes = None) -> bytes:
+    """Run a git command in `repo_path` and return its output."""
+    try:
+        result = subprocess.run(['git', *args], cwd=repo_path, input=input, capture_output=True, check=True)
+    except FileNotFoundError as e:
+        raise GitError('git is not installed') from e
+    except subprocess.CalledProcessError as e:
+        raise GitError(f"git {' '.join(args)} failed: {e.stderr.decode(errors='replace').strip()}") from e
+    return result.stdout
+
+
+def rev_parse(repo_path: str, revision: str) -> str:
+    """The commit id of a revision, e.g. of a branch name."""
+    try:
+        return git(repo_path, 'rev-parse', '--verify', '--quiet', f'{revision}^{{commit}}').decode().strip()
+    except GitError as e:
+        raise GitError(f"Unknown revision '{revision}'") from e
+
+
+def ls_tree(repo_path: str, commit: str, prefix: str = '') -> dict[str, str]:
+    """The files of a commit below `prefix`, as {path relative to `prefix`: blob id}."""
+    args = ['ls-tree', '-r', '-z', '--full-tree', commit]
+    if prefix:
+        args += ['--', prefix]
+    files = {}
+    for entry in git(repo_path, *args).split(b'\0'):
+        if not entry:
+            continue
+        info, _, path = entry.partition(b'\t')
+        _, object_type, blob = info.split()
+        if object_type == b'blob':
+            files[_relative_path(path.decode(), prefix)] = blob.decode()
+    return files
+
+
+def diff_tree(repo_path: str, base: str, head: str, prefix: str = '') -> list[tuple[str, str, str]]:
+    """
+    The files that differ between two commits below `prefix`.
+
+    Returns:
+        A list of (status, path relative to `prefix`, blob id in `head`), the status is 'A' (added),
+        'D' (deleted) or 'M' (modified). Renamed files are reported as deleted and added.
+    """
+    args = ['diff-tree', '-r', '-z', '--no-renames', base, head]
+    if prefix:
+        args += ['--', prefix]
+    fields = git(repo_path, *args).split(b'\0')
+    changes = []
+    # Every change is a ':old_mode new_mode old_blob new_blob status' field followed by a path field
+    for info, path in zip(fields[0::2], fields[1::2]):
+        if not info.startswith(b':'):
+            continue
+        _, _, _, new_blob, status = info[1:].split()
+        status = status.decode()[0]
+        changes.append(('M' if status == 'T' else status, _relative_path(path.decode(), prefix), new_blob.decode()))
+    return changes
+
+
+def read_blobs(repo_path: str, blobs: list[str]) -> dict[str, bytes]:
+    """Read the content of many blobs with a single `git cat-file --batch` process."""
+    if not blobs:
+        return {}
+    output = git(repo_path, 'cat-file', '--batch', input='\n'.join(blobs).encode() + b'\n')
+    contents = {}
+    offset = 0
+    while offset < len(output):
+        header_end = output.index(b'\n', offset)
+        blob, object_type, size = output[offset:header_end].split()
+        size = int(size)
+        contents[blob.decode()] = output[header_end + 1:header_end + 1 + size]
+        # The content is followed by a newline
+        offset = header_end + 1 + size + 1
+    return contents
+
+
+def _relative_path(path: str, prefix: str) -> str:
+    return path[len(prefix) + 1:] if prefix else path
+
+
+@dataclass
+class RevisionSnapshot:
+    """The parsed modules of a folder at a commit, with unresolved calls."""
+    commit: str
+    blobs: dict[str, str] = field(default_factory=dict)  # {module_name: blob id}
+    modules: dict[str, Module] = field(default_factory=dict)
+    root_package: str = None
+
+
+@dataclass
+class RevisionDiff:
+    """The call graphs of a folder at two commits and their difference."""
+    base: RevisionSnapshot
+    head: RevisionSnapshot
+    base_graph: CompactGraph
+    head_graph: CompactGraph
+    changes: FileChanges
+    diff: GraphDiff
+
+
+class RevisionParser:
+    """
+    Parses a folder of a git repository at a commit, without checking it out.
+
+    The files are read from git objects with plain git commands. A snapshot of the parsed modules of a commit is
+    stored in `snapshot_dir`, and the snapshot of another commit is derived from it by parsing only the files
+    that changed in between. Parsed files are cached by their blob id in the cache of the parser.
+    """
+    def __init__(self, folder_path: str, parser: Parser = None, snapshot_dir: str = None):
+        """Initialize the revision parser.
+
+        Args:
+            folder_path: The folder to parse, inside a git repository
+            parser: Parser used for selecting, parsing and resolving files
+            snapshot_dir: Folder in which the snapshots of commits are stored, None disables storing snapshots
+        """
+        self.parser = parser if parser is not None else Parser()
+        self.snapshot_dir = snapshot_dir
+        self.repo_path = git(folder_path, 'rev-parse', '--show-toplevel').decode().strip()
+        prefix = os.path.relpath(os.path.realpath(folder_path), os.path.realpath(self.repo_path))
+        self.prefix = '' if prefix == '.' else prefix.replace(os.sep, '/')
+        self.folder_name = os.path.basename(os.path.realpath(folder_path))
+
+    def snapshot(self, revision: str) -> RevisionSnapshot:
+        """The snapshot of a revision, loaded from `snapshot_dir` or parsed from the complete tree."""
+        commit = rev_parse(self.repo_path, revision)
+        snapshot = self._load(commit)
+        if snapshot is not None:
+            logging.info(f'Loaded snapshot of {commit}')
+            return snapshot
+
+        logging.info(f'Parsing all files of {commit}')
+        files = ls_tree(self.repo_path, commit, self.prefix)
+        paths = self.parser.discovery.select(list(files))
+        snapshot = RevisionSnapshot(commit=commit, root_package=self._root_package(files))
+        snapshot.blobs = dict(sorted((path.replace('/', '.'), files[path]) for path in paths))
+        snapshot.modules = self._parse_blobs(snapshot.blobs)
+        self._store(snapshot)
+        return snapshot
+
+    def apply(self, base: RevisionSnapshot, revision: str) -> tuple[RevisionSnapshot, FileChanges]:
+        """Derive the snapshot of a revision from a snapshot, only the files that differ are parsed."""
+        start = time.perf_counter()
+        commit = rev_parse(self.repo_path, revision)
+        raw_changes = diff_tree(self.repo_path, base.commit, commit, self.prefix)
+        selected = set(self.parser.discovery.select([path for _, path, _ in raw_changes]))
+
+        changes = FileChanges()
+        blobs = dict(base.blobs)
+        changed_blobs = {}
+        for status, path, blob in raw_changes:
+            if path not in selected:
+                continue
+            module_name = path.replace('/', '.')
+            if status == 'D':
+                blobs.pop(module_name, None)
+                changes.deleted.append(module_name)
+            else:
+                blobs[module_name] = changed_blobs[module_name] = blob
+                (changes.modified if module_name in base.blobs else changes.added).append(module_name)
+
+        parsed = self._parse_blobs(changed_blobs)
+        root_package = base.root_package
+        for status, path, _ in raw_changes:
+            if path == '__init__.py' and status != 'M':
+                root_package = self._root_package({} if status == 'D' else {path: ''})
+        snapshot = RevisionSnapshot(commit=commit, root_package=root_package)
+        snapshot.blobs = dict(sorted(blobs.items()))
+        snapshot.modules = {
+            module_name: parsed[module_name] if module_name in parsed else base.modules[module_name]
+            for module_name in snapshot.blobs
+        }
+        changes.time = time.perf_counter() - start
+        self._store(snapshot)
+        return snapshot, changes
+
+    def compare(
+            self,
+            base_revision: str,
+            head_revision: str = 'HEAD',
+            exclude_private: bool = False,
+            exclude_external: bool = False
+    ) -> RevisionDiff:
+        """
+        Build the call graphs of two revisions and compare them.
+
+        Args:
+            base_revision: The revision to compare against, e.g. the target branch of a pull request
+            head_revision: The revision that is compared
+            exclude_private: Leave out private functions when comparing
+            exclude_external: Leave out calls to external functions when comparing
+        """
+        base = self.snapshot(base_revision)
+        head, changes = self.apply(base, head_revision)
+        base_graph = self._graph(base).filter(exclude_private=exclude_private, exclude_external=exclude_external)
+        head_graph = self._graph(head).filter(exclude_private=exclude_private, exclude_external=exclude_external)
+        changes.resolved = list(head.modules)
+        diff = diff_graphs(base_graph, head_graph)
+        diff.base, diff.head = base.commit, head.commit
+        logging.info(f'Compared {base.commit[:12]} with {head.commit[:12]}: {diff.summary()}')
+        return RevisionDiff(base, head, base_graph, head_graph, changes, diff)
+
+    def _graph(self, snapshot: RevisionSnapshot) -> CompactGraph:
+        modules = self.parser.resolve(snapshot.modules, root_package=snapshot.root_package)
+        return CompactGraph.from_modules(modules)
+
+    def _parse_blobs(self, blobs: dict[str, str]) -> dict[str, Module]:
+        """Parse the blobs of {module_name: blob id}, blobs in the parse cache are not read at all."""
+        cache = self.parser.cache
+        modules = {}
+        keys = {}
+        if cache is not None:
+            for module_name, blob in blobs.items():
+                keys[module_name] = cache.content_key(blob, module_name)
+                module = cache.load(keys[module_name])
+                if module is not None:
+                    modules[module_name] = module
+
+        missing = {module_name: blob for module_name, blob in blobs.items() if module_name not in modules}
+        contents = read_blobs(self.repo_path, list(set(missing.values())))
+        for module_name, blob in missing.items():
+            source_code = contents[blob].decode('utf-8', errors='replace')
+            module = self.parser.parse_source(source_code, module_name, file_path=f'{blob[:12]}:{module_name}')
+            modules[module_name] = module
+            if cache is not None:
+                cache.store(keys[module_name], module)
+        if cache is not None:
+            cache.flush()
+        return {module_name: modules[module_name] for module_name in blobs}
+
+    def _root_package(self, files: dict[str, str]) -> str | None:
+        """The name of the folder if it is a package, like `Parser.root_package`, for the paths of its files."""
+        return self.folder_name if '__init__.py' in files else None
+
+    def _snapshot_path(self, commit: str) -> str:
+        key_source = repr((__version__, SNAPSHOT_FORMAT_VERSION, commit, self.prefix, self.folder_name,
+                           self.parser.discovery.options()))
+        return os.path.join(self.snapshot_dir, hashlib.sha256(key_source.encode('utf-8')).hexdigest() + SNAPSHOT_SUFFIX)
+
+    def _load(self, commit: str) -> RevisionSnapshot | None:
+        if self.snapshot_dir is None:
+            return None
+        try:
+            with open(self._snapshot_path(commit), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f'Ignoring unreadable snapshot of {commit}: {e}')
+            return None
+
+    def _store(self, snapshot: RevisionSnapshot):
+        if self.snapshot_dir is None:
+            return
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = self._snapshot_path(snapshot.commit)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
@@ -0,0 +1,479 @@
+import http.client
+import inspect
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from src.graphs import CallGraph, CompactGraph, GraphQuery, find_dead_code
+from src.graphs.compact_graph import EXTERNAL, NO_ID
+from src.graphs.exporters import DotExporter
+from src.graphs.queries import CALLEES
+from src.parser import Parser
+from src.watch import DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL, FileChanges, IncrementalParser, create_watcher
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Seconds between two checks whether the server is stopping, while waiting for changes
+STOP_CHECK_INTERVAL = 0.5
+# Largest accepted request body in bytes
+MAX_REQUEST_SIZE = 1024 * 1024
+# Content type of the requests, browsers cannot send it cross-origin without a preflight request
+JSON_CONTENT_TYPE = 'application/json'
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+QUERY_ERROR = -32000  # E.g. an unknown function name
+
+# Methods that can be called over JSON-RPC, see the methods of `AnalysisIndex` with the same names
+RPC_METHODS: tuple[str, ...] = (
+    'status', 'refresh', 'definition', 'reachable', 'callees', 'callers', 'cycles', 'layers', 'dead_code', 'render',
+)
+
+
+class RpcError(Exception):
+    """An error that is returned to the client as a JSON-RPC error object."""
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+@dataclass
+class IndexState:
+    """A version of the index, replaced as a whole when files change so queries need no lock."""
+    version: int
+    graph: CompactGraph
+    query: GraphQuery
+    updated: float  # Unix time of the update
+    changes: FileChanges = field(default_factory=FileChanges)
+    memo: dict = field(default_factory=dict)  # Results of whole-graph queries, computed on first use
+
+    def memoized(self, key, compute: Callable):
+        if key not in self.memo:
+            self.memo[key] = compute()
+        return self.memo[key]
+
+
+class AnalysisIndex:
+    """
+    Keeps the parsed modules and the call graph of a folder in memory and answers queries on them.
+
+    The modules are parsed once and refreshed incrementally with an `IncrementalParser` when files change, either
+    by the background thread of `start` or by calling `refresh`. Every refresh publishes a new `IndexState`, queries
+    read the current state without locking, so a warm query only costs the graph traversal itself.
+    """
+    def __init__(
+            self,
+            folder_path: str,
+            parser: Parser = None,
+            debounce: float = DEFAULT_DEBOUNCE,
+            poll_interval: float = DEFAULT_POLL_INTERVAL,
+            output_dir: str = None
+    ):
+        """Initialize the index, the folder is parsed right away.
+
+        Args:
+            folder_path: The folder to analyse
+            parser: Parser used for discovering, parsing and resolving files
+            debounce: Seconds without changes before the index is refreshed
+            poll_interval: Seconds between two scans of the folder if inotify is not available
+            output_dir: The folder that `render` writes graphs to, None only returns their DOT source
+        """
+        self.folder_path = folder_path
+        self.output_dir = output_dir
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.incremental = IncrementalParser(folder_path, parser)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        start = time.perf_counter()
+        self.incremental.parse()
+        self.state: IndexState = None
+        self._publish(FileChanges(time=time.perf_counter() - start))
+
+    def start(self):
+        """Refresh the index in a background thread whenever files change."""
+        watcher = create_watcher(self.folder_path, self.incremental.parser.discovery, poll_interval=self.poll_interval)
+        self._thread = threading.Thread(target=self._watch, args=(watcher,), name='poseidon-watch', daemon=True)
+        self._thread.start()
+        logging.info(f'Watching {self.folder_path} with {type(watcher).__name__}')
+
+    def stop(self):
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self, watcher):
+        try:
+            while not self._stop.is_set():
+                if not watcher.wait(STOP_CHECK_INTERVAL):
+                    continue
+                while watcher.wait(self.debounce):
+                    pass
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logging.error(f'Refreshing the index failed: {e}')
+        finally:
+            watcher.close()
+
+    def _publish(self, changes: FileChanges):
+        graph = CompactGraph.from_modules(self.incremental.modules)
+        version = self.state.version + 1 if self.state is not None else 1
+        self.state = IndexState(version, graph, GraphQuery(graph), time.time(), changes)
+        logging.info(f'Index version {version}: {graph.num_nodes} nodes, {graph.num_edges} edges')
+
+    def refresh(self) -> dict:
+        """Parse the files that changed since the last refresh, and publish a new state if any did."""
+        with self._lock:
+            changes = self.incremental.update()
+            if changes:
+                self._publish(changes)
+        return {'changed': bool(changes), 'changes': changes.summary() if changes else '', **self.status()}
+
+    def status(self) -> dict:
+        """The version and size of the index."""
+        state = self.state
+        return {
+            'folder': os.path.abspath(self.folder_path),
+            'version': state.version,
+            'updated': state.updated,
+            'modules': len(state.graph.module_names),
+            'nodes': state.graph.num_nodes,
+            'edges': state.graph.num_edges,
+        }
+
+    def definition(self, name: str) -> dict:
+        """The module, kind and lines of a definition, by qualified name or the end of it."""
+        state = self.state
+        return _node(state.graph, state.query.find(name))
+
+    def reachable(self, names: list[str], depth: int = None, direction: str = CALLEES) -> list[dict]:
+        """The nodes reachable from the named definitions with their distance, see `GraphQuery.reachable`."""
+        state = self.state
+        distances = state.query.reachable([state.query.find(name) for name in names], depth=depth,
+                                          direction=direction)
+        return [{**_node(state.graph, node_id), 'distance': distance} for node_id, distance in distances.items()]
+
+    def callees(self, name: str, depth: int = 1) -> list[dict]:
+        """The functions called by a definition, within `depth` calls."""
+        return [node for node in self.reachable([name], depth=depth, direction='callees') if node['distance']]
+
+    def callers(self, name: str, depth: int = 1) -> list[dict]:
+        """The functions that call a definition, within `depth` calls."""
+        return [node for node in self.reachable([name], depth=depth, direction='callers') if node['distance']]
+
+    def cycles(self) -> list[list[str]]:
+        """The groups of functions that call each other."""
+        state = self.state
+        return state.memoized('cycles', lambda: [
+            [state.graph.names[node_id] for node_id in cycle] for cycle in state.query.cycles()
+        ])
+
+    def layers(self) -> list[list[str]]:
+        """The topological layers of the definitions, entry points first."""
+        state = self.state
+        return state.memoized('layers', lambda: [
+            [state.graph.names[node_id] for node_id in layer if state.graph.kinds[node_id] != EXTERNAL]
+            for layer in state.query.topological_layers()
+        ])
+
+    def dead_code(self, roots: list[str] = None) -> dict:
+        """The definitions that no entry point reaches, see `find_dead_code`."""
+        state = self.state
+        return state.memoized(('dead_code', tuple(roots or ())),
+                              lambda: find_dead_code(state.graph, roots=roots).to_dict())
+
+    def render(
+            self,
+            output_path: str = None,
+            title: str = None,
+            exclude_private: bool = True,
+            exclude_external: bool = True,
+            level: str = 'function',
+            focus: list[str] = None,
+            depth: int = None,
+            direction: str = CALLEES
+    ) -> dict:
+        """
+        Render the call graph to `output_path`, or return its DOT source if no path is given.
+
+        Args:
+            output_path: Path of the output relative to the output folder of the index, .dot and .gv files are
+                written without rendering
+
+        The other arguments are the same as for `CallGraph`.
+
+        Raises:
+            RpcError: if the index has no output folder, or the path is not inside it
+        """
+        if output_path is not None:
+            output_path = self._output_file(output_path)
+        graph = CallGraph(
+            output_path=output_path or 'graph.gv',
+            title=title,
+            exclude_private=exclude_private,
+            exclude_external=exclude_external,
+            level=level,
+            focus=focus,
+            depth=depth,
+            direction=direction
+        )
+        graph.build_graph(self.state.graph)
+        if output_path is None:
+            return {'dot': graph.graph.source}
+        if output_path.endswith(DotExporter.extensions):
+            # Graphviz cannot render DOT source to itself
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(graph.graph.source)
+        else:
+            graph.render()
+        return {'output_path': output_path}
+
+    def _output_file(self, output_path: str) -> str:
+        """The path of an output file in the output folder, a client cannot write anywhere else."""
+        if self.output_dir is None:
+            raise RpcError(INVALID_PARAMS, 'Rendering to a file is disabled, the server has no output folder')
+        if not isinstance(output_path, str) or not output_path:
+            raise RpcError(INVALID_PARAMS, 'output_path must be a non-empty string')
+        parts = output_path.replace('\\', '/').split('/')
+        if os.path.isabs(output_path) or '..' in parts:
+            raise RpcError(INVALID_PARAMS, 'output_path must be relative to the output folder, without ..')
+        output_dir = os.path.realpath(self.output_dir)
+        path = os.path.realpath(os.path.join(output_dir, output_path))
+        if os.path.commonpath([output_dir, path]) != output_dir or path == output_dir:
+            # E.g. a symbolic link in the output folder that points outside of it
+            raise RpcError(INVALID_PARAMS, 'output_path must be inside the output folder')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def call(self, method: str, params: dict | list = None):
+        """Call an RPC method with named or positional parameters."""
+        if method not in RPC_METHODS:
+            raise RpcError(METHOD_NOT_FOUND, f"Method '{method}' not found")
+        function = getattr(self, method)
+        # Only a mismatch with the signature is the fault of the client, a TypeError of the method itself is a bug
+        try:
+            if isinstance(params, list):
+                arguments = inspect.signature(function).bind(*params)
+            else:
+                arguments = inspect.signature(function).bind(**(params or {}))
+        except TypeError as e:
+            raise RpcError(INVALID_PARAMS, str(e)) from e
+        try:
+            return function(*arguments.args, **arguments.kwargs)
+        except ValueError as e:
+            raise RpcError(QUERY_ERROR, str(e)) from e
+
+
+def _node(graph: CompactGraph, node_id: int) -> dict:
+    module_id = graph.module_ids[node_id]
+    return {
+        'name': graph.names[node_id],
+        'kind': graph.kind(node_id),
+        'module': graph.module_names[module_id] if module_id != NO_ID else None,
+        'start_line': graph.start_lines[node_id] if graph.start_lines[node_id] != NO_ID else None,
+        'end_line': graph.end_lines[node_id] if graph.end_lines[node_id] != NO_ID else None,
+    }
+
+
+def handle_request(index: AnalysisIndex, body: bytes) -> dict | list | None:
+    """Answer a JSON-RPC 2.0 request or batch of requests, None if it only contained notifications."""
+    try:
+        request = json.loads(body)
+    except ValueError as e:
+        return _error(None, PARSE_ERROR, f'Parse error: {e}')
+    if isinstance(request, list):
+        if not request:
+            return _error(None, INVALID_REQUEST, 'Empty batch')
+        responses = [response for response in map(lambda item: _handle_call(index, item), request) if response]
+        return responses or None
+    return _handle_call(index, request)
+
+
+def _handle_call(index: AnalysisIndex, request) -> dict | None:
+    if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+        return _error(None, INVALID_REQUEST, 'Invalid request')
+    request_id = request.get('id')
+    params = request.get('params')
+    start = time.perf_counter()
+    try:
+        if params is not None and not isinstance(params, (dict, list)):
+            raise RpcError(INVALID_PARAMS, 'params must be an object or an array')
+        result = index.call(request['method'], params)
+    except RpcError as e:
+        response = _error(request_id, e.code, e.message)
+    except Exception as e:
+        logging.exception(f"Method '{request['method']}' failed")
+        response = _error(request_id, INTERNAL_ERROR, f'{type(e).__name__}: {e}')
+    else:
+        response = {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+    logging.debug(f"{request['method']} took {(time.perf_counter() - start) * 1000:.2f} ms")
+    # Requests without an id are notifications, which are not answered
+    return response if 'id' in request else None
+
+
+def _error(request_id, code: int, message: str) -> dict:
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}}
+
+
+class RpcRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers JSON-RPC requests that are POSTed to any path, the index is an attribute of the server.
+
+    Only requests with a JSON content type and without an Origin header are answered. A web page can make the
+    browser send a simple POST to localhost, but not with a JSON content type without an allowed preflight
+    request, and every request it sends carries an Origin header.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.headers.get('Origin') is not None:
+            self.send_error(403, 'Cross-origin requests are not allowed')
+            return
+        content_type = (self.headers.get('Content-Type') or '').partition(';')[0].strip().lower()
+        if content_type != JSON_CONTENT_TYPE:
+            self.send_error(415, f'Content-Type must be {JSON_CONTENT_TYPE}')
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_REQUEST_SIZE:
+            self.send_error(413, 'Request too large')
+            return
+        response = handle_request(self.server.index, self.rfile.read(length))
+        if response is None:
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', JSON_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        logging.debug(f'{self.address_string()} {format % args}')
+
+
+class RpcHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], index: AnalysisIndex):
+        super().__init__(address, RpcRequestHandler)
+        self.index = index
+
+
+class RpcUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, index: AnalysisIndex):
+        super().__init__(path, RpcRequestHandler)
+        self.index = index
+
+
+def create_server(index: AnalysisIndex, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                  socket_path: str = None) -> socketserver.BaseServer:
+    """A server for the index on a Unix socket if `socket_path` is given, on localhost HTTP otherwise."""
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            # A socket left behind by a server that did not shut down cleanly
+            os.unlink(socket_path)
+        return RpcUnixServer(socket_path, index)
+    return RpcHTTPServer((host, port), index)
+
+
+def serve(
+        folder_path: str,
+        parser: Parser = None,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        socket_path: str = None,
+        debounce: float = DEFAULT_DEBOUNCE,
+        output_dir: str = None,
+        on_ready: Callable[[str], None] = None
+):
+    """
+    Parse a folder and answer JSON-RPC requests about it until interrupted, see `AnalysisIndex` for the methods.
+
+    Args:
+        folder_path: The folder to analyse
+        parser: Parser used for discovering, parsing and resolving files
+        host: Host of the HTTP server, only local connections should be allowed
+        port: Port of the HTTP server, 0 picks a free port
+        socket_path: Listen on this Unix socket instead of HTTP
+        debounce: Seconds without changes before the index is refreshed
+        output_dir: The folder that the render method writes graphs to, None only returns their DOT source
+        on_ready: Called with the address of the server once it accepts requests
+    """
+    index = AnalysisIndex(folder_path, parser, debounce=debounce, output_dir=output_dir)
+    index.start()
+    server = create_server(index, host=host, port=port, socket_path=socket_path)
+    address = socket_path if socket_path is not None else 'http://{}:{}'.format(*server.server_address[:2])
+    logging.info(f'Serving {folder_path} on {address}')
+    if on_ready is not None:
+        on_ready(address)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        index.stop()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection over a Unix socket."""
+    def __init__(self, socket_path: str, timeout: float = None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def rpc_call(address: str, method: str, params: dict | list = None, timeout: float = None):
+    """
+    Call a method of a running server, e.g. `rpc_call('http://127.0.0.1:8765', 'callers', {'name': 'func'})`.
+
+    Args:
+        address: The URL of an HTTP server or the path of a Unix socket
+
+    Raises:
+        RpcError: if the server answers with an error
+    """
+    if address.startswith('http://'):
+        host, _, port = address[len('http://'):].rstrip('/').partition(':')
+        connection = http.client.HTTPConnection(host, int(port or 80), timeout=timeout)
+    else:
+        connection = UnixHTTPConnection(address, timeout=timeout)
+    try:
+        body = json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params or {}})
+        connection.request('POST', '/', body=body, headers={'Content-Type': JSON_CONTENT_TYPE})
+        response = json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+    if 'error' in response:
+        raise RpcError(response['error']['code'], response['error']['message'])
+    return response['result']
@@ -0,0 +1,104 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+
+# Number of files listed in the summary, ordered by parse time
+SLOWEST_FILES = 10
+
+
+@dataclass(slots=True)
+class FileStats:
+    """Timings of a single parsed file, times are in seconds."""
+    module: str
+    bytes: int = 0
+    read_time: float = 0.0
+    parse_time: float = 0.0  # ast.parse
+    walk_time: float = 0.0  # AstWalker
+    cached: bool = False
+
+    @property
+    def total_time(self) -> float:
+        return self.read_time + self.parse_time + self.walk_time
+
+
+@dataclass
+class RunStats:
+    """
+    Timings and counters of a run, times are in seconds.
+
+    The phases do not overlap, so their sum is the time spent in all instrumented code. The files are parsed in
+    the 'parse' phase, their times are measured inside the worker processes and can add up to more than the
+    phase when more than one worker is used.
+    """
+    phases: dict[str, float] = field(default_factory=dict)
+    counters: dict[str, int] = field(default_factory=dict)
+    files: list[FileStats] = field(default_factory=list)
+    total_time: float = 0.0
+
+    @contextmanager
+    def phase(self, name: str):
+        """Add the time spent in the `with` block to phase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_file(self, file_stats: FileStats):
+        self.files.append(file_stats)
+        self.count('files')
+        self.count('bytes', file_stats.bytes)
+        if file_stats.cached:
+            self.count('cached_files')
+
+    def slowest_files(self, n: int = SLOWEST_FILES) -> list[FileStats]:
+        return sorted(self.files, key=lambda file_stats: file_stats.total_time, reverse=True)[:n]
+
+    def to_dict(self) -> dict:
+        return {
+            'total_time': self.total_time,
+            'phases': self.phases,
+            'counters': self.counters,
+            'file_times': {
+                'read': sum(file_stats.read_time for file_stats in self.files),
+                'parse': sum(file_stats.parse_time for file_stats in self.files),
+                'walk': sum(file_stats.walk_time for file_stats in self.files),
+            },
+            'files': [asdict(file_stats) for file_stats in self.files],
+        }
+
+    def write_json(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary(self, n_files: int = SLOWEST_FILES) -> str:
+        """A table with the time of every phase, the counters and the slowest files."""
+        total = self.total_time or sum(self.phases.values()) or 1.0
+        lines = [f"{'phase':<16} {'time (s)':>10} {'share':>7}"]
+        for name, seconds in self.phases.items():
+            lines.append(f"{name:<16} {seconds:>10.3f} {seconds / total:>7.1%}")
+        if self.files:
+            file_times = self.to_dict()['file_times']
+            lines.append(f"  {'read files':<14} {file_times['read']:>10.3f}")
+            lines.append(f"  {'ast.parse':<14} {file_times['parse']:>10.3f}")
+            lines.append(f"  {'AstWalker':<14} {file_times['walk']:>10.3f}")
+        lines.append(f"{'total':<16} {self.total_time:>10.3f}")
+        lines.append('')
+        lines.extend(f"{name:<16} {value:>10}" for name, value in self.counters.items())
+
+        slowest = [file_stats for file_stats in self.slowest_files(n_files) if not file_stats.cached]
+        if slowest:
+            lines.append('')
+            lines.append(f"{'slowest files':<50} {'bytes':>10} {'time (s)':>10}")
+            for file_stats in slowest:
+                lines.append(f"{file_stats.module:<50} {file_stats.bytes:>10} {file_stats.total_time:>10.3f}")
+        return '\n'.join(lines)
+
+
+def phase(stats: RunStats | None, name: str):
+    """Time a `with` block as phase `name` of `stats`, does nothing if `stats` is None."""
+    return stats.phase(name) if stats is not None else nullcontext()
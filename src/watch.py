@@ -0,0 +1,409 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable
+
+from src.parser import FileDiscovery, Module, Parser
+from src.parser.data_classes import Class
+from src.parser.symbol_index import SymbolIndex, canonical_module_name
+
+# Seconds without changes after which a burst of saves is considered finished
+DEFAULT_DEBOUNCE = 0.2
+# Seconds between two scans of the folder when inotify is not available
+DEFAULT_POLL_INTERVAL = 1.0
+
+# inotify events, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, length of the name
+
+# {module_name: (file_path, mtime in ns, size)} of all discovered files
+Snapshot = dict[str, tuple[str, int, int]]
+
+
+def take_snapshot(folder_path: str, discovery: FileDiscovery) -> Snapshot:
+    """Discover the files of a folder together with their modification time and size."""
+    snapshot = {}
+    for file_path, module_name in discovery.discover(folder_path):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            # Deleted after it was discovered
+            continue
+        snapshot[module_name] = (file_path, stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+@dataclass
+class FileChanges:
+    """The module names of the files that changed since the previous update."""
+    added: list[str] = field(default_factory=list)
+    modified: list[str] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+    resolved: list[str] = field(default_factory=list)  # Modules whose calls were resolved again
+    time: float = 0.0  # Seconds spent on the update
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.modified or self.deleted)
+
+    def summary(self) -> str:
+        return (f'{len(self.added)} added, {len(self.modified)} modified, {len(self.deleted)} deleted, '
+                f'{len(self.resolved)} modules resolved in {self.time:.3f} s')
+
+
+class IncrementalParser:
+    """
+    Keeps the parsed and resolved modules of a folder up to date.
+
+    An update re-parses only the added and modified files. Calls are resolved again for the changed modules, and
+    for the modules that import from a module whose definitions or imports changed. Edits that only change the
+    body of functions therefore resolve a single module.
+    """
+    def __init__(self, folder_path: str, parser: Parser = None):
+        """Initialize the incremental parser.
+
+        Args:
+            folder_path: The folder to parse
+            parser: Parser used for discovering, parsing and resolving files
+        """
+        self.folder_path = folder_path
+        self.parser = parser if parser is not None else Parser()
+        self.root_package = Parser.root_package(folder_path)
+        self.snapshot: Snapshot = {}
+        self.parsed_modules: dict[str, Module] = {}  # Modules with unresolved calls
+        self.modules: dict[str, Module] = {}  # Modules with resolved calls, sorted by name
+
+    def parse(self) -> dict[str, Module]:
+        """Parse and resolve the whole folder."""
+        self.snapshot = take_snapshot(self.folder_path, self.parser.discovery)
+        jobs = [(file_path, module_name) for module_name, (file_path, _, _) in self.snapshot.items()]
+        self.parsed_modules = self.parser.parse_files(jobs)
+        self.modules = self.parser.resolve(self.parsed_modules, root_package=self.root_package)
+        return self.modules
+
+    def update(self) -> FileChanges:
+        """Parse the files that changed since the previous update and resolve the affected modules."""
+        start = time.perf_counter()
+        snapshot = take_snapshot(self.folder_path, self.parser.discovery)
+        changes = FileChanges(
+            added=[name for name in snapshot if name not in self.snapshot],
+            modified=[name for name in snapshot if name in self.snapshot and snapshot[name] != self.snapshot[name]],
+            deleted=[name for name in self.snapshot if name not in snapshot],
+        )
+        self.snapshot = snapshot
+        if not changes:
+            return changes
+
+        jobs = [(snapshot[name][0], name) for name in changes.added + changes.modified]
+        parsed = self.parser.parse_files(jobs)
+        changed_symbols = set(changes.added) | set(changes.deleted)
+        for name, module in parsed.items():
+            if name in self.parsed_modules and _symbols(self.parsed_modules[name]) != _symbols(module):
+                changed_symbols.add(name)
+            self.parsed_modules[name] = module
+        for name in changes.deleted:
+            del self.parsed_modules[name]
+        self.parsed_modules = dict(sorted(self.parsed_modules.items()))
+
+        affected = set(parsed) | self._importers(changed_symbols)
+        index = SymbolIndex(self.parsed_modules, root_package=self.root_package)
+        modules = {}
+        for name, module in self.parsed_modules.items():
+            if name in affected or name not in self.modules:
+                modules[name] = self.parser.resolve_module(index, name, module)
+                changes.resolved.append(name)
+            else:
+                modules[name] = self.modules[name]
+        self.modules = modules
+        changes.time = time.perf_counter() - start
+        return changes
+
+    def _importers(self, module_files: set[str]) -> set[str]:
+        """
+        The modules with calls to names of the given modules, directly or through re-exports.
+
+        A module that imports a name from a changed module exports that name itself, e.g. `package.name` for an
+        import in `package/__init__.py`, so calls to that name in other modules are affected as well. Imports of a
+        package that contains a changed module, e.g. `import package` for `package.module`, only affect the calls
+        of the importing module itself: following them through re-exports would grow the changed names with every
+        import cycle. A module with a subclass of an imported class is affected like a module that calls it, since
+        calls of inherited methods resolve to the base class.
+        """
+        root_prefix = f'{self.root_package}.' if self.root_package else None
+        imports = {}
+        for name, module in self.parsed_modules.items():
+            imports[name] = {
+                alias: imported_name[len(root_prefix):]
+                if root_prefix and imported_name.startswith(root_prefix) else imported_name
+                for alias, imported_name in module.imports.items()
+            }
+
+        changed_names = {canonical_module_name(name.removesuffix('.py')) for name in module_files}
+        seen_names = set(changed_names)
+        importers = set()
+        while changed_names:
+            re_exported_names = set()
+            for name, module in self.parsed_modules.items():
+                package_name = canonical_module_name(name.removesuffix('.py'))
+                touched = False
+                for alias, imported_name in imports[name].items():
+                    for changed_name in changed_names:
+                        if _refers_to(imported_name, changed_name):
+                            re_exported_names.add(f'{package_name}.{alias}' if package_name else alias)
+                            touched = True
+                        elif changed_name.startswith(imported_name + '.'):
+                            touched = True
+                subclasses = _subclasses_of(module, imports[name], changed_names) if touched else []
+                if touched and name not in importers and (
+                        subclasses or _calls_refer_to(module, imports[name], changed_names)):
+                    importers.add(name)
+                # Subclasses inherit the changed methods, which affects the modules that use them as well
+                re_exported_names.update(f'{package_name}.{class_name}' if package_name else class_name
+                                         for class_name in subclasses)
+            changed_names = re_exported_names - seen_names
+            seen_names |= changed_names
+        return importers
+
+
+def _refers_to(name: str, changed_name: str) -> bool:
+    """Whether a name is the changed name or a name inside it."""
+    return not changed_name or name == changed_name or name.startswith(changed_name + '.')
+
+
+def _calls_refer_to(module: Module, imports: dict[str, str], changed_names: set[str]) -> bool:
+    """Whether a call of the module refers to one of the changed names through an import."""
+    for callees in module.calls.values():
+        for callee in callees:
+            head, _, attribute = callee.partition('.')
+            if head not in imports:
+                continue
+            imported_name = imports[head] + (f'.{attribute}' if attribute else '')
+            if any(_refers_to(imported_name, changed_name) for changed_name in changed_names):
+                return True
+    return False
+
+
+def _subclasses_of(module: Module, imports: dict[str, str], changed_names: set[str]) -> list[str]:
+    """The classes of the module with a base class that refers to one of the changed names through an import."""
+    subclasses = []
+    for definition in module.definitions.values():
+        if not isinstance(definition, Class):
+            continue
+        for base in definition.bases or ():
+            head, _, attribute = base.partition('.')
+            if head not in imports:
+                continue
+            imported_name = imports[head] + (f'.{attribute}' if attribute else '')
+            if any(_refers_to(imported_name, changed_name) for changed_name in changed_names):
+                subclasses.append(definition.name)
+                break
+    return subclasses
+
+
+def _symbols(module: Module) -> tuple:
+    """The names a module defines and imports, other modules only depend on these."""
+    definitions = []
+    for qualified_name, definition in module.definitions.items():
+        if isinstance(definition, Class):
+            definitions.append(
+                (qualified_name, 'class', tuple(sorted(definition.methods)), tuple(definition.bases or ()))
+            )
+        else:
+            definitions.append((qualified_name, definition.type))
+    return sorted(definitions), sorted(module.imports.items())
+
+
+class Watcher(ABC):
+    """Waits for changes in a folder."""
+    @abstractmethod
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait until files may have changed.
+
+        Args:
+            timeout: Maximum number of seconds to wait, None waits until there is a change
+
+        Returns:
+            False if the timeout elapsed without changes.
+        """
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(Watcher):
+    """Waits for file system events of the Linux inotify API, called through ctypes."""
+    def __init__(self, folder_path: str, discovery: FileDiscovery):
+        self.folder_path = folder_path
+        self.discovery = discovery
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watched: dict[int, str] = {}  # {watch descriptor: directory}
+        self._add_watches()
+
+    def _add_watches(self):
+        """Watch every directory that is not ignored, directories that are already watched are skipped."""
+        directories = []
+        self.discovery.discover(self.folder_path, directories=directories)
+        watched = set(self.watched.values())
+        for directory in directories:
+            if directory in watched:
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                # E.g. the directory was deleted, or the limit of watches is reached
+                logging.warning(f'Cannot watch {directory}: {os.strerror(ctypes.get_errno())}')
+                continue
+            self.watched[wd] = directory
+
+    def wait(self, timeout: float = None) -> bool:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+
+        changed = False
+        new_directories = False
+        data = self._read_events()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, assume anything changed
+                changed = new_directories = True
+            elif mask & IN_ISDIR:
+                changed = True
+                new_directories = new_directories or bool(mask & (IN_CREATE | IN_MOVED_TO))
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self.watched.pop(wd, None)
+                changed = True
+            elif name.endswith((b'.py', b'.gitignore')):
+                changed = True
+        if new_directories:
+            self._add_watches()
+        return changed
+
+    def _read_events(self) -> bytes:
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+    """Detects changes by comparing the modification times and sizes of the files at a fixed interval."""
+    def __init__(self, folder_path: str, discovery: FileDiscovery, interval: float = DEFAULT_POLL_INTERVAL):
+        self.folder_path = folder_path
+        self.discovery = discovery
+        self.interval = interval
+        self.snapshot = take_snapshot(folder_path, discovery)
+
+    def wait(self, timeout: float = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            interval = self.interval if deadline is None else min(self.interval, deadline - time.monotonic())
+            if interval > 0:
+                time.sleep(interval)
+            snapshot = take_snapshot(self.folder_path, self.discovery)
+            if snapshot != self.snapshot:
+                self.snapshot = snapshot
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+
+def create_watcher(
+        folder_path: str,
+        discovery: FileDiscovery,
+        poll_interval: float = DEFAULT_POLL_INTERVAL
+) -> Watcher:
+    """An `InotifyWatcher` if inotify is available, a `PollingWatcher` otherwise."""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(folder_path, discovery)
+        except (OSError, AttributeError) as e:
+            logging.warning(f'inotify is not available ({e}), polling for changes instead')
+    return PollingWatcher(folder_path, discovery, interval=poll_interval)
+
+
+def watch(
+        folder_path: str,
+        on_change: Callable[[dict[str, Module], FileChanges], None],
+        parser: Parser = None,
+        debounce: float = DEFAULT_DEBOUNCE,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        max_updates: int = None
+):
+    """
+    Parse a folder and call `on_change` with the resolved modules initially and after every change.
+
+    Changes are debounced: after a change, the update waits until no file changed for `debounce` seconds, so a
+    burst of saves results in a single update. Exceptions raised by `on_change` are logged and do not stop
+    watching.
+
+    Args:
+        folder_path: The folder to watch
+        on_change: Called with the resolved modules and the changes, the changes are empty initially
+        parser: Parser used for discovering, parsing and resolving files
+        debounce: Seconds without changes before the modules are updated
+        poll_interval: Seconds between two scans of the folder if inotify is not available
+        max_updates: Stop after this number of updates, by default watch until interrupted
+    """
+    incremental = IncrementalParser(folder_path, parser)
+    watcher = create_watcher(folder_path, incremental.parser.discovery, poll_interval=poll_interval)
+    logging.info(f'Watching {folder_path} with {type(watcher).__name__}')
+    try:
+        start = time.perf_counter()
+        modules = incremental.parse()
+        _notify(on_change, modules, FileChanges(time=time.perf_counter() - start))
+        del modules
+        updates = 0
+        while max_updates is None or updates < max_updates:
+            if not watcher.wait():
+                continue
+            while watcher.wait(debounce):
+                pass
+            changes = incremental.update()
+            if changes:
+                logging.info(f'Updated {folder_path}: {changes.summary()}')
+                _notify(on_change, incremental.modules, changes)
+                updates += 1
+    finally:
+        watcher.close()
+
+
+def _notify(on_change: Callable[[dict[str, Module], FileChanges], None], modules: dict[str, Module],
+            changes: FileChanges):
+    try:
+        on_change(modules, changes)
+    except Exception as e:
+        logging.error(f'Updating the graph failed: {e}')
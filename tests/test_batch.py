@@ -0,0 +1,59 @@
+import json
+
+from src.batch import load_manifest, poseidon_batch
+
+SOURCE = '''
+def helper():
+    return 1
+
+
+def main():
+    return helper()
+'''
+
+
+def write_package(tmp_path):
+    source_dir = tmp_path / 'src'
+    source_dir.mkdir()
+    (source_dir / 'app.py').write_text(SOURCE)
+    return str(source_dir)
+
+
+def test_invalid_job_is_reported_without_stopping_the_batch(tmp_path):
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(json.dumps({
+        'defaults': {'exclude_private': False},
+        'jobs': [
+            {'output_path': str(tmp_path / 'bad.jsonl'), 'colour': 'red'},
+            {'output_path': str(tmp_path / 'calls.jsonl')},
+            {'graph_type': 'call'},
+        ],
+    }))
+    result = poseidon_batch(write_package(tmp_path), str(manifest))
+    assert [job.output_path for job in result.jobs] == [
+        str(tmp_path / 'bad.jsonl'), str(tmp_path / 'calls.jsonl'), '<job 3>'
+    ]
+    assert 'colour' in result.jobs[0].error
+    assert result.jobs[1].succeeded
+    assert 'output_path' in result.jobs[2].error
+    assert len(result.failed) == 2
+
+
+def test_manifest_defaults_are_merged(tmp_path):
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(json.dumps({'defaults': {'level': 'module'}, 'jobs': [{'output_path': 'a.png'}]}))
+    assert load_manifest(str(manifest)) == [{'level': 'module', 'output_path': 'a.png'}]
+
+
+def test_call_jobs_with_export_outputs_are_exported(tmp_path):
+    jobs = [
+        {'output_path': str(tmp_path / 'calls.jsonl')},
+        {'output_path': str(tmp_path / 'calls.dot')},
+        {'output_path': str(tmp_path / 'calls.out'), 'export_format': 'graphml'},
+    ]
+    result = poseidon_batch(write_package(tmp_path), jobs)
+    assert not result.failed
+    records = [json.loads(line) for line in (tmp_path / 'calls.jsonl').read_text().splitlines()]
+    assert any(record.get('source') == 'app.main' and record.get('target') == 'app.helper' for record in records)
+    assert (tmp_path / 'calls.dot').read_text().startswith('digraph')
+    assert '<graphml' in (tmp_path / 'calls.out').read_text()
@@ -0,0 +1,44 @@
+import os
+
+from src.parser import Parser, ParseCache
+
+
+def write_modules(folder, count: int):
+    for i in range(count):
+        (folder / f'mod_{i}.py').write_text(f'def function_{i}():\n    return {i}\n')
+
+
+def test_cache_hits_unchanged_files(tmp_path):
+    source_dir = tmp_path / 'src'
+    source_dir.mkdir()
+    write_modules(source_dir, 3)
+    Parser(cache=ParseCache(str(tmp_path / 'cache'))).parse_folder(str(source_dir))
+    cache = ParseCache(str(tmp_path / 'cache'))
+    Parser(cache=cache).parse_folder(str(source_dir))
+    assert cache.hits == 3
+
+
+def test_eviction_prunes_stat_index(tmp_path):
+    source_dir = tmp_path / 'src'
+    source_dir.mkdir()
+    write_modules(source_dir, 5)
+    cache = ParseCache(str(tmp_path / 'cache'), max_size=0)
+    Parser(cache=cache).parse_folder(str(source_dir))
+    assert not [name for name in os.listdir(tmp_path / 'cache') if name.endswith('.pkl')]
+    assert ParseCache(str(tmp_path / 'cache')).stat_index == {}
+
+
+def test_stat_index_drops_deleted_files(tmp_path):
+    source_dir = tmp_path / 'src'
+    source_dir.mkdir()
+    write_modules(source_dir, 2)
+    Parser(cache=ParseCache(str(tmp_path / 'cache'))).parse_folder(str(source_dir))
+    os.remove(source_dir / 'mod_1.py')
+    Parser(cache=ParseCache(str(tmp_path / 'cache'))).parse_folder(str(source_dir))
+    stat_index = ParseCache(str(tmp_path / 'cache')).stat_index
+    assert list(stat_index) == [os.path.abspath(source_dir / 'mod_0.py')]
+
+
+def test_cache_folder_is_private(tmp_path):
+    ParseCache(str(tmp_path / 'cache'))
+    assert os.stat(tmp_path / 'cache').st_mode & 0o077 == 0
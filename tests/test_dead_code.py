@@ -0,0 +1,45 @@
+from src.graphs import CompactGraph, find_dead_code
+from src.parser import Parser
+
+SOURCE = '''
+from dataclasses import dataclass
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+    def double(self):
+        return Point(self.x * 2, self.y * 2)
+
+
+@dataclass
+class Unused:
+    name: str
+
+    def describe(self):
+        return self.name
+
+
+def helper(point):
+    return point.double()
+
+
+def main():
+    return helper(Point(1, 2))
+'''
+
+
+def dead_names(tmp_path, **kwargs) -> set[str]:
+    (tmp_path / 'app.py').write_text(SOURCE)
+    graph = CompactGraph.from_modules(Parser().parse_folder(str(tmp_path)))
+    return {definition.name for definition in find_dead_code(graph, **kwargs).unreachable}
+
+
+def test_instantiated_dataclass_is_alive(tmp_path):
+    assert dead_names(tmp_path) == {'app.Unused', 'app.Unused.describe'}
+
+
+def test_methods_of_instantiated_class_are_alive_without_attribute_matching(tmp_path):
+    assert dead_names(tmp_path, match_attribute_calls=False) == {'app.Unused', 'app.Unused.describe'}
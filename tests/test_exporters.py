@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from src.graphs import CompactGraph
+from src.graphs.exporters import JsonLinesExporter
+from src.parser import Parser
+
+SOURCE = '''
+import os
+
+
+class _Hidden:
+    def run(self):
+        return os.getcwd()
+
+
+class Shown:
+    def run(self):
+        return _helper()
+
+    def _check(self):
+        return len([])
+
+
+def _helper():
+    return _Hidden().run()
+
+
+def main():
+    return Shown().run(), os.path.join('a', 'b')
+'''
+
+
+@pytest.mark.parametrize('exclude_private', [False, True])
+@pytest.mark.parametrize('exclude_external', [False, True])
+def test_exported_edges_match_the_filtered_graph(tmp_path, exclude_private, exclude_external):
+    (tmp_path / 'app.py').write_text(SOURCE)
+    modules = Parser().parse_folder(str(tmp_path))
+    output_path = tmp_path / 'calls.jsonl'
+    JsonLinesExporter(str(output_path), exclude_private, exclude_external).export(modules)
+    records = [json.loads(line) for line in output_path.read_text().splitlines()]
+    exported = {(record['source'], record['target']) for record in records if 'source' in record}
+    graph = CompactGraph.from_modules(modules).filter(exclude_private, exclude_external)
+    assert exported == {(graph.names[source], graph.names[target]) for source, target in graph.edges()}
+    assert exported
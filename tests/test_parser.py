@@ -0,0 +1,65 @@
+from src.graphs import CallGraph, ClassGraph, CompactGraph
+from src.parser import Parser
+
+SOURCE = '''
+from dataclasses import dataclass
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+    def double(self):
+        return Point(self.x * 2, self.y * 2)
+
+
+class Counter:
+    def __init__(self):
+        self.count = 0
+
+
+def main():
+    point = Point(1, 2)
+    counter = Counter()
+    return point.double(), counter
+'''
+
+
+def parse(tmp_path, source: str = SOURCE) -> dict:
+    (tmp_path / 'app.py').write_text(source)
+    return Parser().parse_folder(str(tmp_path))
+
+
+def test_class_without_init_is_called(tmp_path):
+    modules = parse(tmp_path)
+    assert modules['app.py'].calls['app.main']['app.Point'] == [20]
+    assert 'app.Point' in modules['app.py'].calls['app.Point.double']
+
+
+def test_class_with_init_calls_constructor(tmp_path):
+    modules = parse(tmp_path)
+    assert 'app.Counter.__init__' in modules['app.py'].calls['app.main']
+    assert 'app.Counter' not in modules['app.py'].calls['app.main']
+
+
+def test_instantiated_class_is_drawn_in_its_box(tmp_path):
+    graph = CompactGraph.from_modules(parse(tmp_path))
+    assert (graph.node_id('app.main'), graph.node_id('app.Point')) in set(graph.edges())
+    call_graph = CallGraph(output_path=str(tmp_path / 'graph.gv'))
+    call_graph.build_graph(graph)
+    source = call_graph.graph.source
+    class_box = source[source.index('cluster_app_Point'):]
+    assert '"app.Point" [label=Point' in class_box[:class_box.index('}')]
+
+
+def test_resolve_keeps_the_symbol_index(tmp_path, monkeypatch):
+    (tmp_path / 'app.py').write_text(SOURCE)
+    parser = Parser()
+    modules = parser.parse_folder(str(tmp_path))
+    assert 'app.Point.double' in parser.index.definitions
+    # A class diagram reuses the index instead of building another one
+    monkeypatch.setattr('src.graphs.class_graph.SymbolIndex', None)
+    class_graph = ClassGraph(output_path=str(tmp_path / 'classes.gv'))
+    class_graph.build_graph(modules, index=parser.index)
+    assert '"app.Point"' in class_graph.graph.source
@@ -0,0 +1,15 @@
+import pytest
+
+from benchmarks.bench_scaling import check_scaling, measure
+
+# The sizes differ 8x, a quadratic step would grow about 8x
+CLASSES = (50, 100, 200, 400)
+METHODS = 10
+MAX_GROWTH = 3.0
+
+
+# Timing based, so it only runs with --run-slow
+@pytest.mark.slow
+def test_walk_and_resolve_scale_linearly():
+    results = [measure(classes, METHODS, repeat=3) for classes in CLASSES]
+    check_scaling(results, MAX_GROWTH)
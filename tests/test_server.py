@@ -0,0 +1,135 @@
+import http.client
+import json
+import os
+import threading
+
+import pytest
+
+from src.server import INVALID_PARAMS, AnalysisIndex, RpcError, create_server, rpc_call
+
+SOURCE = '''
+def main():
+    helper()
+
+
+def helper():
+    pass
+'''
+
+
+@pytest.fixture
+def index(tmp_path):
+    source_dir = tmp_path / 'src'
+    source_dir.mkdir()
+    (source_dir / 'app.py').write_text(SOURCE)
+    return AnalysisIndex(str(source_dir), output_dir=str(tmp_path / 'out'))
+
+
+def change_source(tmp_path, source: str):
+    path = tmp_path / 'src' / 'app.py'
+    path.write_text(source)
+    # Make the change visible even if the file system has a coarse modification time
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.fixture
+def address(index):
+    server = create_server(index, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[:2]
+    server.shutdown()
+    server.server_close()
+
+
+def post(address, body: str, headers: dict) -> http.client.HTTPResponse:
+    connection = http.client.HTTPConnection(*address, timeout=5)
+    connection.request('POST', '/', body=body, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response
+
+
+def render_request(output_path: str) -> str:
+    return json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'render', 'params': {'output_path': output_path}})
+
+
+def test_json_request_is_answered(address):
+    result = rpc_call('http://{}:{}'.format(*address), 'callees', {'name': 'main'}, timeout=5)
+    assert [node['name'] for node in result] == ['app.helper']
+
+
+def test_cross_origin_request_is_rejected(address, tmp_path):
+    target = tmp_path / 'pwn.gv'
+    response = post(address, render_request(str(target)), {
+        'Content-Type': 'application/json', 'Origin': 'https://attacker.example',
+    })
+    assert response.status == 403
+    assert not target.exists()
+
+
+def test_simple_text_request_is_rejected(address, tmp_path):
+    target = tmp_path / 'pwn.gv'
+    response = post(address, render_request(str(target)), {'Content-Type': 'text/plain'})
+    assert response.status == 415
+    assert not target.exists()
+
+
+@pytest.mark.parametrize('output_path', ['/tmp/pwn.gv', '../pwn.gv', 'graphs/../../pwn.gv'])
+def test_render_outside_output_dir_is_rejected(index, output_path):
+    with pytest.raises(RpcError):
+        index.render(output_path=output_path)
+
+
+def test_render_dot_source(index, tmp_path):
+    result = index.render(output_path='graphs/graph.gv')
+    assert result['output_path'] == os.path.realpath(tmp_path / 'out' / 'graphs' / 'graph.gv')
+    with open(result['output_path'], encoding='utf-8') as f:
+        assert f.read().startswith('digraph')
+
+
+def test_invalid_params(index):
+    with pytest.raises(RpcError) as error:
+        index.call('callees', {'unknown': 1})
+    assert error.value.code == INVALID_PARAMS
+
+
+def test_type_error_of_method_is_not_invalid_params(index, monkeypatch):
+    def fail(name: str):
+        raise TypeError('bug')
+    monkeypatch.setattr(index, 'definition', fail)
+    with pytest.raises(TypeError):
+        index.call('definition', ['main'])
+
+
+def test_refresh_after_file_change(index, tmp_path):
+    assert index.refresh()['changed'] is False
+    change_source(tmp_path, SOURCE + '\n\ndef extra():\n    helper()\n')
+    result = index.refresh()
+    assert result['changed'] is True
+    assert result['version'] == 2
+    assert {node['name'] for node in index.callers('helper')} == {'app.main', 'app.extra'}
+
+
+def test_refresh_invalidates_memoized_queries(index, tmp_path):
+    assert index.cycles() == []
+    assert index.dead_code()['unreachable'] == []
+    change_source(tmp_path, 'def main():\n    pass\n\n\ndef helper():\n    other()\n\n\ndef other():\n    helper()\n')
+    index.refresh()
+    assert [sorted(cycle) for cycle in index.cycles()] == [['app.helper', 'app.other']]
+    assert {definition['name'] for definition in index.dead_code()['unreachable']} == {'app.helper', 'app.other'}
+
+
+def test_unix_socket_transport(index, tmp_path):
+    socket_path = str(tmp_path / 'poseidon.sock')
+    server = create_server(index, socket_path=socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        result = rpc_call(socket_path, 'callees', {'name': 'main'}, timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert [node['name'] for node in result] == ['app.helper']